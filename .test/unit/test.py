@@ -109,8 +109,12 @@ class TestPipeline(unittest.TestCase):
 
         # checking number of tasks for a rule is consistent
         snakemake_jobs = self.parse_snakemake_dryrun_output(result.stdout)
-        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping']
-        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 2, "Job 'reads_mapping' count is not 2")
+        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping_streaming']
+        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 2, "Job 'reads_mapping_streaming' count is not 2")
+
+        # each assembly is indexed once
+        indexing_tasks = snakemake_jobs[snakemake_jobs['job'] == 'minimap2_indexing']
+        self.assertEqual(int(indexing_tasks['count'].values[0]), 2, "Job 'minimap2_indexing' count is not 2")
 
     def test_only_long_reads_dryrun(self):
         """
@@ -162,11 +166,11 @@ class TestPipeline(unittest.TestCase):
 
         # checking number of tasks for rules is consistent
         snakemake_jobs = self.parse_snakemake_dryrun_output(result.stdout)
-        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping']
-        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 3, "Job 'reads_mapping' count is not 3")
+        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping_streaming']
+        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 3, "Job 'reads_mapping_streaming' count is not 3")
 
-        reads_mapping_LR_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping_LR']
-        self.assertEqual(int(reads_mapping_LR_tasks['count'].values[0]), 1, "Job 'reads_mapping_LR' count is not 1")
+        reads_mapping_LR_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping_LR_streaming']
+        self.assertEqual(int(reads_mapping_LR_tasks['count'].values[0]), 1, "Job 'reads_mapping_LR_streaming' count is not 1")
 
     def test_given_config_dryrun(self):
         """
@@ -192,8 +196,8 @@ class TestPipeline(unittest.TestCase):
 
         # checking number of tasks for a rule is consistent
         snakemake_jobs = self.parse_snakemake_dryrun_output(result.stdout)
-        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping']
-        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 3, "Job 'reads_mapping' count is not 3")
+        reads_mapping_tasks = snakemake_jobs[snakemake_jobs['job'] == 'reads_mapping_streaming']
+        self.assertEqual(int(reads_mapping_tasks['count'].values[0]), 3, "Job 'reads_mapping_streaming' count is not 3")
 
     def test_short_reads_fail_if_long_reads_only_dryrun(self): 
         """
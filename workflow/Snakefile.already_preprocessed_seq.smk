@@ -24,12 +24,20 @@ from rules.utils import *
 ################################################################################
 
 SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
-SAMPLES_DF = pd.read_csv(SAMPLES_TABLE, sep="\t")
+# the samples table is parsed and validated once, by the rule modules (see SampleSheet in rules/utils.py)
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
+SAMPLES_DF = SAMPLE_SHEET.df
 FASTQ_FILES = SAMPLES_DF['sample'].tolist()
 FASTQ_FILES = [f[:-9] for f in FASTQ_FILES]
 
+# the concurrent write cap ('resources: concurrent_write_cap_mb' in the config) bounds the sum of the disk_mb
+# declared by the running jobs, unless a limit is given on the command line (--resources disk_mb=...).
+# It limits how much is written at the same time, not the disk usage of the run: temporary files kept
+# by finished jobs are not counted
+if concurrent_write_cap(config):
+    workflow.global_resources.setdefault('disk_mb', concurrent_write_cap(config))
+
 READS = [1, 2]
 ASSEMBLER = config['assembly']['assembler']
 LONG_READ_ASSEMBLER = config['assembly']['long_read_assembler']
@@ -48,8 +56,7 @@ if HYBRID_ASSEMBLER == None:
        HYBRID_ASSEMBLER = []
 
 # validating that we can run the pipeline using the given FASTQ
-samples_table_df = pd.read_csv(SAMPLES_TABLE, sep="\t")
-validate_assemblers(samples_table_df, 
+validate_assemblers(SAMPLES_DF, 
                     ASSEMBLER + LONG_READ_ASSEMBLER + HYBRID_ASSEMBLER)
 
 # for dereplication, MAG profiling...
@@ -83,6 +90,8 @@ rule all:
                    assembler=ASSEMBLER + LONG_READ_ASSEMBLER + HYBRID_ASSEMBLER, ani = ANI_THRESHOLD),
             expand("results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins",
                    assembler=ASSEMBLER + HYBRID_ASSEMBLER + LONG_READ_ASSEMBLER, ani = ANI_THRESHOLD),
+            expand("results/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.sqlite",
+                   assembler=ASSEMBLER + HYBRID_ASSEMBLER + LONG_READ_ASSEMBLER, ani = ANI_THRESHOLD),
             expand("results/08_bins_postprocessing/gtdb_tk/{ani}/{assembler}", 
                    assembler=ASSEMBLER + LONG_READ_ASSEMBLER + HYBRID_ASSEMBLER, ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE),
             expand("results/08_bins_postprocessing/checkm1/{ani}/{assembler}/{sample}/profile.processed.tsv",
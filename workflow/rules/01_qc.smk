@@ -1,11 +1,11 @@
 import pandas as pd 
 from utils import *
 
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
 
 rule fastqc_before_preprocessing:
-    input: lambda wildcards: get_fastq_pair(SAMPLES_DF, wildcards.sample)
+    input: lambda wildcards: SAMPLE_SHEET.fastq_pair(wildcards.sample)
     output: directory("results/01_qc/fastqc/{sample}")
     conda: 
         "../envs/fastqc.yaml"
@@ -1,5 +1,5 @@
 rule fastp:
-    input: lambda wildcards: get_fastq_pair(SAMPLES_DF, wildcards.sample)
+    input: lambda wildcards: SAMPLE_SHEET.fastq_pair(wildcards.sample)
     output:
         r1 = "results/02_preprocess/fastp/{sample}_1.fastq.gz",
         r2 = "results/02_preprocess/fastp/{sample}_2.fastq.gz",
@@ -15,7 +15,8 @@ rule megahit_assembly:
         r1 = "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz",
         r2 = "results/02_preprocess/bowtie2/{sample}_2.clean.fastq.gz"
     output:
-        assembly = "results/03_assembly/megahit/{sample}/assembly.fa",
+        # headers are normalized and the assembly compressed by `megahit_fasta_headers_renaming`
+        assembly = "results/03_assembly/megahit/{sample}/final.contigs.fa",
     conda:
         "../envs/megahit.yaml"
     log:
@@ -29,6 +30,7 @@ rule megahit_assembly:
         tmp_output = "{sample}_tmp_megahit_output",
         min_contig_len = config['assembly'].get('megahit', {}).get('min_contig_len', 0)
     threads: config['assembly'].get('megahit', {}).get('threads', 0)
+    resources: **rule_resources(config, "megahit_assembly")
     shell:
         """
         mkdir -p {params.tmp_dir} \
@@ -41,14 +43,13 @@ rule megahit_assembly:
         && \
         mv {params.tmp_output}/* {params.out_dir} \
         && \
-        rm -r {params.tmp_output} \
-        && \
-        mv {params.out_dir}/final.contigs.fa {params.out_dir}/assembly.fa
+        rm -r {params.tmp_output}
         """
 
 # for VAMB for example. It will replace the spaces in the FASTA headers and gzip the asssembly
+# in a single pass (the contigs and bases numbers are saved along the logs)
 rule megahit_fasta_headers_renaming:
-    input: "results/03_assembly/megahit/{sample}/assembly.fa"
+    input: "results/03_assembly/megahit/{sample}/final.contigs.fa"
     output: 
         assembly = "results/03_assembly/megahit/{sample}/assembly.fa.gz",
         other_files = "results/03_assembly/megahit/{sample}/other_files.tar.gz"
@@ -57,26 +58,23 @@ rule megahit_fasta_headers_renaming:
     log:
         stdout = "logs/03_assembly/megahit/{sample}.rename.stdout",
         stderr = "logs/03_assembly/megahit/{sample}.rename.stderr",
-        stdout_pigz = "logs/03_assembly/megahit/{sample}.rename.pigz.stdout",
-        stderr_pigz = "logs/03_assembly/megahit/{sample}.rename.pigz.stderr"
+        stats = "logs/03_assembly/megahit/{sample}.rename.stats.tsv"
     benchmark:
         "benchmarks/03_assembly/megahit/{sample}.rename.benchmark.txt"
     params:
         rename_script = "workflow/scripts/megahit_fasta_header_rename.py",
-        intermediate_output = "results/03_assembly/megahit/{sample}/assembly.new.fa",
         compressing_files_script = "workflow/scripts/compress_spades_megahit_results.sh",
         out_dir = "results/03_assembly/megahit/{sample}"
+    threads: config['assembly'].get('megahit', {}).get('threads', 0)
     shell:
         """
-        python3 {params.rename_script} {input} {params.intermediate_output} \
+        python3 {params.rename_script} {input} {output.assembly} \
+            --threads {threads} \
+            --stats {log.stats} \
         > {log.stdout} 2> {log.stderr} \
         && \
         rm {input} \
         && \
-        mv {params.intermediate_output} {input} \
-        && \
-        pigz --verbose {input} > {log.stdout_pigz} 2> {log.stderr_pigz} \
-        && \
         bash {params.compressing_files_script} {params.out_dir}
         """
 
@@ -102,6 +100,7 @@ rule metaspades_assembly:
         compressing_files_script = "workflow/scripts/compress_spades_megahit_results.sh",
         intermediate_assembly = "{sample}_metaspades_tmp_assembly.fa"
     threads: config['assembly'].get('metaspades', {}).get('threads', 0)
+    resources: **rule_resources(config, "metaspades_assembly")
     shell:
         """
         spades.py --meta -1 {input.r1} -2 {input.r2} \
@@ -146,6 +145,7 @@ rule hybridspades_assembly:
         compressing_files_script = "workflow/scripts/compress_spades_megahit_results.sh",
         intermediate_assembly = "{sample}_hybridspades_tmp_assembly.fa"
     threads: config['assembly'].get('hybridspades', {}).get('threads', 0)
+    resources: **rule_resources(config, "hybridspades_assembly")
     shell:
         """
         spades.py --meta -1 {input.r1} -2 {input.r2} \
@@ -188,6 +188,7 @@ rule hylight_assembly:
         out_dir = "results/03_assembly/hylight/{sample}",
         min_contig_len = config['assembly'].get('hylight', {}).get('min_contig_len', 0),
     threads: config['assembly'].get('hylight', {}).get('threads', 0),
+    resources: **rule_resources(config, "hylight_assembly")
     shell:
         """ 
         # HyLight needs interleaved reads, so we need to merge paired-end reads
@@ -238,6 +239,7 @@ rule metaflye_assembly:
         min_contig_len = config['assembly'].get('metaflye', {}).get('min_contig_len', 0),
         intermediate_assembly = "{sample}_metaflye_tmp_assembly.fa"
     threads: config['assembly'].get('metaflye', {}).get('threads', 0)
+    resources: **rule_resources(config, "metaflye_assembly")
     shell:
         """
         flye {params.method_flag} {input.long_read} --out-dir {params.out_dir} \
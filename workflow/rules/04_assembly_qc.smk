@@ -16,9 +16,9 @@ if HYBRID_ASSEMBLER == None:
 if ASSEMBLER_LR == None:
        ASSEMBLER_LR = []
 
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
 
 # adding to "SAMPLES" samples "SAMPLES_LR" that were not found in "SAMPLES"
 for sample in SAMPLES_LR:
@@ -103,7 +103,7 @@ rule gene_calling_assembly:
         # assemblies produced in step 03
         "results/03_assembly/{assembler}/{sample}/assembly.fa.gz"
     output:
-        "results/04_assembly_qc/gene_calling/{assembler}/{sample}/genes.fna"
+        temp("results/04_assembly_qc/gene_calling/{assembler}/{sample}/genes.fna")
     conda:
         "../envs/prodigal.yaml"
     log:
@@ -122,7 +122,7 @@ rule gene_calling_assembly_long_read:
         # assemblies produced in step 03
         "results/03_assembly/{assembler_lr}/{sample}/assembly.fa.gz"
     output:
-        "results/04_assembly_qc/gene_calling/{assembler_lr}/{sample}/genes.fna"
+        temp("results/04_assembly_qc/gene_calling/{assembler_lr}/{sample}/genes.fna")
     conda:
         "../envs/prodigal.yaml"
     log:
@@ -147,6 +147,7 @@ rule concatenating_assembly_genes:
         "../envs/seqkit.yaml"
     benchmark:
         "benchmarks/04_assembly_qc/gene_calling/{assembler}.benchmark.txt"
+    priority: intermediates_priority(config)
     params:
         uncompressed_output = "results/04_assembly_qc/gene_calling/{assembler}/genes.fna"
     shell:
@@ -166,6 +167,7 @@ rule concatenating_assembly_genes_long_read:
         "../envs/seqkit.yaml"
     benchmark:
         "benchmarks/04_assembly_qc/gene_calling/{assembler_lr}.benchmark.txt"
+    priority: intermediates_priority(config)
     params:
         uncompressed_output = "results/04_assembly_qc/gene_calling/{assembler_lr}/genes.fna"
     shell:
@@ -184,7 +186,8 @@ rule gene_clustering:
     conda:
         "../envs/mmseqs2.yaml"
     benchmark:
-        "benchmarks/04_assembly_qc/gene_clustering/{assembler_all}_gene_clustering.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/04_assembly_qc/gene_clustering/{assembler_all}_gene_clustering.benchmark.txt", config.get('benchmark_repeats', 1))
     log:
         stdout = "logs/04_assembly_qc/gene_clustering/{assembler_all}_gene_clustering.stdout",
         stderr = "logs/04_assembly_qc/gene_clustering/{assembler_all}_gene_clustering.stderr"
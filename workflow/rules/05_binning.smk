@@ -1,8 +1,8 @@
 from utils import * 
 
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
 ASSEMBLER = config['assembly']['assembler']
 
 HYBRID_ASSEMBLER = config['assembly']['hybrid_assembler'] 
@@ -25,6 +25,9 @@ if ASSEMBLER_LR == None:
 seq_format = config["lr_seq_format"]
 sequences_file_end = f"_1.{seq_format}.gz"
 
+# minimap2 preset of the long reads, the assemblies and references are indexed with it as well
+LONG_READ_PRESET = long_read_preset(config)
+
 wildcard_constraints:
     assembler_lr = "|".join(ASSEMBLER_LR) if ASSEMBLER_LR != [] else "none",
     assembler_all = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR) if ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR != [] else "none",
@@ -32,30 +35,109 @@ wildcard_constraints:
     assembler_hybrid = "|".join(HYBRID_ASSEMBLER) if HYBRID_ASSEMBLER != [] else "none",
     assembler_sr_hybrid = "|".join(ASSEMBLER + HYBRID_ASSEMBLER) if ASSEMBLER + HYBRID_ASSEMBLER != [] else "none",
 
+# the sorted BAM are written either by minimap2 piped into samtools sort (streaming mode), or by
+# sorting the BAM converted from the SAM written by minimap2 (mode 'sam', see 'mapping' in the config)
+if streaming_mapping(config):
+    ruleorder: reads_mapping_streaming > bam_sorting
+    ruleorder: reads_mapping_hybrid_streaming > bam_sorting
+    ruleorder: reads_mapping_LR_streaming > bam_sorting_LR
+else:
+    ruleorder: bam_sorting > reads_mapping_streaming
+    ruleorder: bam_sorting > reads_mapping_hybrid_streaming
+    ruleorder: bam_sorting_LR > reads_mapping_LR_streaming
+
+# minimap2 index of each assembly, built once per preset ('sr' for short reads, the long-read
+# preset otherwise) and shared by every mapping rule instead of being rebuilt by each of them
+rule minimap2_indexing:
+    input:
+        "results/03_assembly/{assembler}/{sample}/assembly.fa.gz"
+    output:
+        temp("results/05_binning/minimap2/index/{assembler}/{sample}.{preset}.mmi")
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/05_binning/minimap2/index/{assembler}/{sample}.{preset}.stderr"
+    benchmark:
+        "benchmarks/05_binning/minimap2/index/{assembler}/{sample}.{preset}.benchmark.txt"
+    wildcard_constraints:
+        assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR),
+        sample = samples_constraint(config, SAMPLES + SAMPLES_LR),
+        preset = "sr|map-ont|map-hifi|map-pb"
+    # minimap2 uses at most 3 threads to build an index
+    threads: min(3, config['binning']['minimap2']['threads'])
+    shell:
+        """
+        minimap2 -x {wildcards.preset} -t {threads} -d {output} {input} 2> {log.stderr}
+        """
+
 ###### short reads ######
 rule reads_mapping:
     input:
         # metagenome reads
         r1 = "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz",
         r2 = "results/02_preprocess/bowtie2/{sample}_2.clean.fastq.gz",
-        # assembly to map reads on
-        assembly = "results/03_assembly/{assembler_sr}/{sample}/assembly.fa.gz"
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_sr}/{sample}.sr.mmi"
     output:
-        "results/05_binning/minimap2/{assembler_sr}/{sample}.sam"
+        temp("results/05_binning/minimap2/{assembler_sr}/{sample}.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
         stderr = "logs/05_binning/minimap2/SR/{assembler_sr}/{sample}.mapping.stderr"
     benchmark:
-        "benchmarks/05_binning/minimap2/SR/{assembler_sr}/{sample}.mapping.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/05_binning/minimap2/SR/{assembler_sr}/{sample}.mapping.benchmark.txt", config.get('benchmark_repeats', 1))
     params:
         index_basename = "{sample}",
         assembler = config['assembly']['assembler']
     threads: config['binning']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax sr -t {threads} \
-            {input.assembly} {input.r1} {input.r2} > {output} 2> {log.stderr}
+            {input.index} {input.r1} {input.r2} > {output} 2> {log.stderr}
+        """
+
+# streaming mode: minimap2 output is sorted on the fly by samtools sort, so that neither the SAM nor
+# the unsorted BAM are written. The rules writing them (reads_mapping, sam_to_bam, bam_sorting) are
+# only used when config['mapping']['mode'] is 'sam'
+rule reads_mapping_streaming:
+    input:
+        # metagenome reads
+        r1 = "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz",
+        r2 = "results/02_preprocess/bowtie2/{sample}_2.clean.fastq.gz",
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_sr}/{sample}.sr.mmi"
+    output:
+        bam = "results/05_binning/minimap2/{assembler_sr}/{sample}.sorted.bam",
+        **({'bai': "results/05_binning/minimap2/{assembler_sr}/{sample}.sorted.bam.bai"} if mapping_option(config, 'index_bam') else {})
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/05_binning/minimap2/SR/{assembler_sr}/{sample}.mapping.stderr",
+        stderr_sort = "logs/05_binning/samtools/{assembler_sr}/{sample}.sorting.stderr"
+    benchmark:
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/05_binning/minimap2/SR/{assembler_sr}/{sample}.mapping_sorting.benchmark.txt", config.get('benchmark_repeats', 1))
+    params:
+        # the threads of the job are shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: max(1, threads - mapping_option(config, 'sort_threads')),
+        sort_threads = mapping_option(config, 'sort_threads'),
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        tmp_prefix = sort_tmp_prefix(config, "results/05_binning/minimap2/{assembler_sr}/{sample}.sorted.bam"),
+        index_bam = mapping_option(config, 'index_bam')
+    threads: config['binning']['minimap2']['threads'] + mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_mapping_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.tmp_prefix}) \
+        && \
+        minimap2 -ax sr -t {params.mapping_threads} \
+            {input.index} {input.r1} {input.r2} 2> {log.stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.tmp_prefix} \
+            -o {output.bam} - 2> {log.stderr_sort} \
+        && \
+        if [ "{params.index_bam}" = "True" ]; then samtools index -@ {threads} {output.bam} 2>> {log.stderr_sort}; fi
         """
 
 # there are two possibilities: reads used in hybrid assemblies were downsized, or reads used 
@@ -67,10 +149,10 @@ rule reads_mapping_hybrid_sr_part:
         # select input files based on whether reads are downsized or not
         r1 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_1.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
         r2 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_2.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
-        # assembly to map reads on
-        assembly = "results/03_assembly/{assembler_hybrid}/{sample}/assembly.fa.gz"
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_hybrid}/{sample}.sr.mmi"
     output:
-        "results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sam"
+        temp("results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
@@ -79,31 +161,27 @@ rule reads_mapping_hybrid_sr_part:
         "benchmarks/05_binning/minimap2/SR/{assembler_hybrid}/{sample}.mapping.benchmark.txt"
     params:
         index_basename = "{sample}",
-        method = (
-            "map-ont" if config.get('lr_technology', '') == "nanopore"
-            else "map-hifi" if config.get('lr_technology', '') == "pacbio-hifi"
-            else "map-pb" if config.get('lr_technology', '') == "pacbio"
-            else ""
-        ),
+        method = LONG_READ_PRESET,
         mapping_sr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sam",
         mapping_lr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sam"
     wildcard_constraints:
-        sample = "|".join(SAMPLES)
+        sample = samples_constraint(config, SAMPLES)
     threads: config['binning']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping_hybrid_sr_part", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax sr -t {threads} \
-            {input.assembly} {input.r1} {input.r2} \
+            {input.index} {input.r1} {input.r2} \
             > {output} 2> {log.sr_stderr}
         """
 
 rule reads_mapping_hybrid_lr_part:
     input:
         long_read = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}fastp_long_read/{wildcards.sample}{'_downsized' if subsample_hybrid_reads else ''}{sequences_file_end}",
-        # assembly to map reads on
-        assembly = "results/03_assembly/{assembler_hybrid}/{sample}/assembly.fa.gz"
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_hybrid}/{sample}." + LONG_READ_PRESET + ".mmi"
     output:
-        "results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sam"
+        temp("results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
@@ -112,19 +190,15 @@ rule reads_mapping_hybrid_lr_part:
         "benchmarks/05_binning/minimap2/LR/{assembler_hybrid}/{sample}.mapping.benchmark.txt"
     params:
         index_basename = "{sample}",
-        method = (
-            "map-ont" if config.get('lr_technology', '') == "nanopore"
-            else "map-hifi" if config.get('lr_technology', '') == "pacbio-hifi"
-            else "map-pb" if config.get('lr_technology', '') == "pacbio"
-            else ""
-        ),
+        method = LONG_READ_PRESET,
     wildcard_constraints:
-        sample = "|".join(SAMPLES)
+        sample = samples_constraint(config, SAMPLES)
     threads: config['binning']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping_hybrid_lr_part", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax {params.method} -t {threads} \
-            {input.assembly} {input.long_read} \
+            {input.index} {input.long_read} \
             > {output} 2> {log.lr_stderr}
         """
 
@@ -133,7 +207,7 @@ rule reads_mapping_hybrid_sam_merging:
         mapping_sr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sam",
         mapping_lr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sam",
     output:
-        "results/05_binning/minimap2/{assembler_hybrid}/{sample}.sam"
+        temp("results/05_binning/minimap2/{assembler_hybrid}/{sample}.sam")
     conda:
         "../envs/samtools.yaml"
     log:
@@ -142,8 +216,10 @@ rule reads_mapping_hybrid_sam_merging:
     benchmark:
             "benchmarks/05_binning/samtools/{assembler_hybrid}/{sample}.merging.benchmark.txt"
     wildcard_constraints:
-        sample = "|".join(SAMPLES)
+        sample = samples_constraint(config, SAMPLES)
     threads: config['binning'].get('samtools', {}).get('threads', 0)
+    resources: **rule_resources(config, "reads_mapping_hybrid_sam_merging", disk_mb=mapping_disk_mb(config, 'sorting'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools sort -T /tmp -@ {threads} -o {input.mapping_sr}.sorted.sam {input.mapping_sr} \
@@ -153,14 +229,82 @@ rule reads_mapping_hybrid_sam_merging:
         samtools merge --threads {threads} -o {output} {input.mapping_sr}.sorted.sam {input.mapping_lr}.sorted.sam \
         > {log.stdout_merge} 2> {log.stderr_merge} \
         && \
-        rm -v {input.mapping_sr} {input.mapping_lr} {input.mapping_sr}.sorted.sam {input.mapping_lr}.sorted.sam
+        rm -v {input.mapping_sr}.sorted.sam {input.mapping_lr}.sorted.sam
+        """
+
+# streaming mode: short and long reads are mapped concurrently, sharing the threads of the job, each
+# mapping being sorted on the fly into a BAM; both sorted BAM are then merged once into the final one
+rule reads_mapping_hybrid_streaming:
+    input:
+        # select input files based on whether reads are downsized or not
+        r1 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_1.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
+        r2 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_2.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
+        long_read = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}fastp_long_read/{wildcards.sample}{'_downsized' if subsample_hybrid_reads else ''}{sequences_file_end}",
+        # indexes of the assembly to map reads on
+        index_sr = "results/05_binning/minimap2/index/{assembler_hybrid}/{sample}.sr.mmi",
+        index_lr = "results/05_binning/minimap2/index/{assembler_hybrid}/{sample}." + LONG_READ_PRESET + ".mmi"
+    output:
+        bam = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.sorted.bam",
+        **({'bai': "results/05_binning/minimap2/{assembler_hybrid}/{sample}.sorted.bam.bai"} if mapping_option(config, 'index_bam') else {})
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        sr_stderr = "logs/05_binning/minimap2/SR/{assembler_hybrid}/{sample}.mapping.stderr",
+        lr_stderr = "logs/05_binning/minimap2/LR/{assembler_hybrid}/{sample}.mapping.stderr",
+        sr_stderr_sort = "logs/05_binning/samtools/{assembler_hybrid}/{sample}.SR.sorting.stderr",
+        lr_stderr_sort = "logs/05_binning/samtools/{assembler_hybrid}/{sample}.LR.sorting.stderr",
+        stderr_merge = "logs/05_binning/samtools/merge/{assembler_hybrid}/{sample}.merge.stderr"
+    benchmark:
+        "benchmarks/05_binning/minimap2/hybrid/{assembler_hybrid}/{sample}.mapping_sorting.benchmark.txt"
+    params:
+        method = LONG_READ_PRESET,
+        # half of the threads of the job for each mapping, shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: hybrid_mapping_threads(threads, mapping_option(config, 'sort_threads'))[0],
+        sort_threads = lambda wildcards, threads: hybrid_mapping_threads(threads, mapping_option(config, 'sort_threads'))[1],
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        mapping_sr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sorted.bam",
+        mapping_lr = "results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sorted.bam",
+        sr_tmp_prefix = sort_tmp_prefix(config, "results/05_binning/minimap2/{assembler_hybrid}/{sample}.SR.sorted.bam"),
+        lr_tmp_prefix = sort_tmp_prefix(config, "results/05_binning/minimap2/{assembler_hybrid}/{sample}.LR.sorted.bam"),
+        index_bam = mapping_option(config, 'index_bam')
+    wildcard_constraints:
+        sample = samples_constraint(config, SAMPLES)
+    threads: config['binning']['minimap2']['threads'] + 2 * mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_mapping_hybrid_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.sr_tmp_prefix}) $(dirname {params.lr_tmp_prefix})
+
+        minimap2 -ax sr -t {params.mapping_threads} \
+            {input.index_sr} {input.r1} {input.r2} 2> {log.sr_stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.sr_tmp_prefix} \
+            -o {params.mapping_sr} - 2> {log.sr_stderr_sort} &
+        sr_pid=$!
+
+        minimap2 -ax {params.method} -t {params.mapping_threads} \
+            {input.index_lr} {input.long_read} 2> {log.lr_stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.lr_tmp_prefix} \
+            -o {params.mapping_lr} - 2> {log.lr_stderr_sort} &
+        lr_pid=$!
+
+        # both mappings must succeed
+        sr_status=0; wait $sr_pid || sr_status=$?
+        lr_status=0; wait $lr_pid || lr_status=$?
+        if [ $sr_status -ne 0 ] || [ $lr_status -ne 0 ]; then
+            rm -f {params.mapping_sr} {params.mapping_lr}
+            exit 1
+        fi
+
+        samtools merge --threads {threads} -o {output.bam} {params.mapping_sr} {params.mapping_lr} 2> {log.stderr_merge}
+        rm {params.mapping_sr} {params.mapping_lr}
+        if [ "{params.index_bam}" = "True" ]; then samtools index -@ {threads} {output.bam} 2>> {log.stderr_merge}; fi
         """
 
 rule sam_to_bam:
     input:
         sam = "results/05_binning/minimap2/{assembler_sr_hybrid}/{sample}.sam"
     output:
-        bam = "results/05_binning/minimap2/{assembler_sr_hybrid}/{sample}.bam"
+        bam = temp("results/05_binning/minimap2/{assembler_sr_hybrid}/{sample}.bam")
     conda:
         "../envs/samtools.yaml"
     log:
@@ -171,16 +315,17 @@ rule sam_to_bam:
     params:
         assembler = config['assembly']['assembler']
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER)
     threads:
         config['binning'].get('samtools', {}).get('threads', 0)
+    resources: **rule_resources(config, "sam_to_bam", disk_mb=mapping_disk_mb(config, 'bam'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools view --threads {threads} \
             -o {output.bam} {input.sam} \
-            > {log.stdout} 2> {log.stderr} \
-        && rm {input.sam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 rule bam_sorting:
@@ -195,25 +340,28 @@ rule bam_sorting:
         stdout = "logs/05_binning/samtools/{assembler_sr_hybrid}/{sample}.sorting.stdout",
         stderr = "logs/05_binning/samtools/{assembler_sr_hybrid}/{sample}.sorting.stderr"
     benchmark:
-        "benchmarks/05_binning/samtools/{assembler_sr_hybrid}/{sample}.sorting.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/05_binning/samtools/{assembler_sr_hybrid}/{sample}.sorting.benchmark.txt", config.get('benchmark_repeats', 1))
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER)
     threads:
         config['binning'].get('samtools', {}).get('threads', 0)
+    resources: **rule_resources(config, "bam_sorting", disk_mb=mapping_disk_mb(config, 'sorting'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools sort -T /tmp -@ {threads} \
             -o {output.bam} {input.bam} \
-            > {log.stdout} 2> {log.stderr} \
-        && \
-        rm {input.bam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 
 # binning rules
 
-# metabat2
+# depth of the contigs, computed once per assembly from the BAM: MetaBAT 2 reads it, and so do the
+# short-read SemiBin2 and VAMB unless config['binning']['shared_depth'] is false (they read the BAM otherwise).
+# The long-read SemiBin2 and VAMB always read the BAM, as reads below 97% identity are left out of the table
 rule get_contigs_depth:
     input:
         bam = "results/05_binning/minimap2/{assembler}/{sample}.sorted.bam"
@@ -227,7 +375,7 @@ rule get_contigs_depth:
     benchmark:
         "benchmarks/05_binning/metabat2/{assembler}/{sample}.depth_matrix.benchmark.txt"
     wildcard_constraints:
-        sample="|".join(SAMPLES + SAMPLES_LR),
+        sample = samples_constraint(config, SAMPLES + SAMPLES_LR),
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR)
     shell:
         """
@@ -235,6 +383,32 @@ rule get_contigs_depth:
             {input.bam} > {log.stdout} 2> {log.stderr}
         """
 
+# the depth table converted into the abundance file VAMB reads instead of the BAM
+rule vamb_abundance:
+    input:
+        bam_depth_matrix = "results/05_binning/metabat2/{assembler}/{sample}.depth_matrix.tab"
+    output:
+        abundance = "results/05_binning/vamb/{assembler}/{sample}.abundance.npz"
+    conda:
+        "../envs/python.yaml"
+    log:
+        stdout = "logs/05_binning/vamb/{assembler}/{sample}.abundance.stdout",
+        stderr = "logs/05_binning/vamb/{assembler}/{sample}.abundance.stderr"
+    benchmark:
+        "benchmarks/05_binning/vamb/{assembler}/{sample}.abundance.benchmark.txt"
+    params:
+        # the abundance must list the contigs VAMB keeps
+        min_contig_length = vamb_min_contig_length(config)
+    wildcard_constraints:
+        sample = samples_constraint(config, SAMPLES + SAMPLES_LR),
+        assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR)
+    shell:
+        """
+        python3 workflow/scripts/depth_to_vamb_abundance.py --depth {input.bam_depth_matrix} \
+            --min_length {params.min_contig_length} \
+            --output {output.abundance} > {log.stdout} 2> {log.stderr}
+        """
+
 rule metabat2_binning:
     input:
         assembly = "results/03_assembly/{assembler_sr_hybrid}/{sample}/assembly.fa.gz",
@@ -253,13 +427,15 @@ rule metabat2_binning:
         stdout_mv = "logs/05_binning/metabat2/{assembler_sr_hybrid}/{sample}.moving.stdout",
         stderr_mv = "logs/05_binning/metabat2/{assembler_sr_hybrid}/{sample}.moving.stderr"
     benchmark:
-        "benchmarks/05_binning/metabat2/{assembler_sr_hybrid}/{sample}.binning.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/05_binning/metabat2/{assembler_sr_hybrid}/{sample}.binning.benchmark.txt", config.get('benchmark_repeats', 1))
     params:
         min_contig_size = config['binning']['metabat2']['min_contig_size'],
         minimum_mean_coverage = config['binning']['metabat2']['minimum_mean_coverage'],
         min_bin_size = config['binning']['metabat2']['min_bin_size'],
         bin_basename = "{sample}",
     threads: config['binning'].get('metabat2').get('threads', 0)
+    resources: **rule_resources(config, "metabat2_binning")
     shell:
         """
         metabat2 -i {input.assembly} -o "{output.output}/{params.bin_basename}" \
@@ -282,7 +458,9 @@ rule metabat2_binning:
 rule semibin2_binning:
     input:
         assembly = "results/03_assembly/{assembler_sr_hybrid}/{sample}/assembly.fa.gz",
-        bam = "results/05_binning/minimap2/{assembler_sr_hybrid}/{sample}.sorted.bam"
+        # depth of the contigs (see get_contigs_depth), or the BAM to compute it from
+        **({'bam_depth_matrix': "results/05_binning/metabat2/{assembler_sr_hybrid}/{sample}.depth_matrix.tab"} if shared_depth(config)
+           else {'bam': "results/05_binning/minimap2/{assembler_sr_hybrid}/{sample}.sorted.bam"})
     output:
         output = directory("results/05_binning/semibin2/bins/{assembler_sr_hybrid}/{sample}")
     conda:
@@ -293,16 +471,20 @@ rule semibin2_binning:
         stdout_move = "logs/05_binning/semibin2/{assembler_sr_hybrid}/{sample}.move.stdout",
         stderr_move = "logs/05_binning/semibin2/{assembler_sr_hybrid}/{sample}.move.stderr"
     benchmark:
-        "benchmarks/05_binning/semibin2/{assembler_sr_hybrid}/{sample}.binning.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/05_binning/semibin2/{assembler_sr_hybrid}/{sample}.binning.benchmark.txt", config.get('benchmark_repeats', 1))
     params:
-        environment = config['binning'].get('semibin2', {}).get('environment', 0)
+        environment = config['binning'].get('semibin2', {}).get('environment', 0),
+        coverage = lambda wildcards, input: (f"--depth-metabat2 {input.bam_depth_matrix}" if shared_depth(config)
+                                             else f"-b {input.bam}")
     threads: config['binning'].get('semibin2', {}).get('threads', 0)
+    resources: **rule_resources(config, "semibin2_binning")
     shell:
         """
         SemiBin2 single_easy_bin \
                 --environment {params.environment} \
                 -i {input.assembly} \
-                -b {input.bam} \
+                {params.coverage} \
                 -o {output.output} \
                 --threads {threads} \
                 --verbose \
@@ -318,7 +500,9 @@ rule semibin2_binning:
 rule vamb_binning:
     input:
         assembly = "results/03_assembly/{assembler}/{sample}/assembly.fa.gz",
-        bam = "results/05_binning/minimap2/{assembler}/{sample}.sorted.bam"
+        # abundance of the contigs (see vamb_abundance), or the BAM to compute it from
+        **({'abundance': "results/05_binning/vamb/{assembler}/{sample}.abundance.npz"} if shared_depth(config)
+           else {'bam': "results/05_binning/minimap2/{assembler}/{sample}.sorted.bam"})
     output:
         output = directory("results/05_binning/vamb/bins/{assembler}/{sample}")
     conda:
@@ -334,14 +518,19 @@ rule vamb_binning:
         epochs = config['binning'].get('vamb', {}).get('epochs'),
         batch_sizes = config['binning'].get('vamb', {}).get('batch_sizes'),
         start_batch_size = config['binning'].get('vamb', {}).get('start_batch_size'),
+        min_contig_length = vamb_min_contig_length(config),
+        coverage = lambda wildcards, input: (f"--rpkm {input.abundance}" if shared_depth(config)
+                                             else f"--bamfiles {input.bam}"),
     threads: config['binning'].get('vamb', {}).get('threads', 0)
     wildcard_constraints:
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER)
+    resources: **rule_resources(config, "vamb_binning")
     shell:
         """
         vamb --outdir {output.output} \
             --fasta {input.assembly} \
-            --bamfiles {input.bam} \
+            -m {params.min_contig_length} \
+            {params.coverage} \
             --minfasta {params.minfasta} \
             -e {params.epochs} \
             -p {threads} \
@@ -365,10 +554,10 @@ rule reads_mapping_LR:
     input:
         # metagenome reads
         long_read = "results/02_preprocess/fastp_long_read/{sample_lr}" + sequences_file_end,
-        # assembly
-        assembly = "results/03_assembly/{assembler_lr}/{sample_lr}/assembly.fa.gz"
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_lr}/{sample_lr}." + LONG_READ_PRESET + ".mmi"
     output:
-        sam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sam"
+        sam = temp("results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
@@ -377,26 +566,61 @@ rule reads_mapping_LR:
     benchmark:
         "benchmarks/05_binning/minimap2/LR/{assembler_lr}/{sample_lr}.mapping.benchmark.txt"
     params:
-        method = (
-            "map-ont" if config.get('lr_technology', '') == "nanopore"
-            else "map-hifi" if config.get('lr_technology', '') == "pacbio-hifi"
-            else "map-pb" if config.get('lr_technology', '') == "pacbio"
-            else ""
-        ),
+        method = LONG_READ_PRESET,
     threads: config['binning']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping_LR", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax {params.method} -t {threads} \
-            {input.assembly} \
+            {input.index} \
             {input.long_read} \
             > {output.sam}
         """
 
+# streaming mode (see reads_mapping_streaming)
+rule reads_mapping_LR_streaming:
+    input:
+        # metagenome reads
+        long_read = "results/02_preprocess/fastp_long_read/{sample_lr}" + sequences_file_end,
+        # index of the assembly to map reads on
+        index = "results/05_binning/minimap2/index/{assembler_lr}/{sample_lr}." + LONG_READ_PRESET + ".mmi"
+    output:
+        bam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sorted.bam",
+        **({'bai': "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sorted.bam.bai"} if mapping_option(config, 'index_bam') else {})
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/05_binning/minimap2/LR/{assembler_lr}/{sample_lr}.mapping.stderr",
+        stderr_sort = "logs/05_binning/samtools/LR/{assembler_lr}/{sample_lr}.sorting.stderr"
+    benchmark:
+        "benchmarks/05_binning/minimap2/LR/{assembler_lr}/{sample_lr}.mapping_sorting.benchmark.txt"
+    params:
+        method = LONG_READ_PRESET,
+        # the threads of the job are shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: max(1, threads - mapping_option(config, 'sort_threads')),
+        sort_threads = mapping_option(config, 'sort_threads'),
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        tmp_prefix = sort_tmp_prefix(config, "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sorted.bam"),
+        index_bam = mapping_option(config, 'index_bam')
+    threads: config['binning']['minimap2']['threads'] + mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_mapping_LR_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.tmp_prefix}) \
+        && \
+        minimap2 -ax {params.method} -t {params.mapping_threads} \
+            {input.index} {input.long_read} 2> {log.stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.tmp_prefix} \
+            -o {output.bam} - 2> {log.stderr_sort} \
+        && \
+        if [ "{params.index_bam}" = "True" ]; then samtools index -@ {threads} {output.bam} 2>> {log.stderr_sort}; fi
+        """
+
 rule sam_to_bam_LR:
     input:
         sam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sam"
     output:
-        bam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.bam"
+        bam = temp("results/05_binning/minimap2/{assembler_lr}/{sample_lr}.bam")
     conda:
         "../envs/samtools.yaml"
     log:
@@ -404,11 +628,12 @@ rule sam_to_bam_LR:
         stderr = "logs/05_binning/samtools/LR/{assembler_lr}/{sample_lr}.sam_to_bam.stderr"
     benchmark:
         "benchmarks/05_binning/samtools/LR/{assembler_lr}/{sample_lr}.sam_to_bam.benchmark.txt"
+    resources: **rule_resources(config, "sam_to_bam_LR", disk_mb=mapping_disk_mb(config, 'bam'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools view -o {output.bam} {input.sam} \
-            > {log.stdout} 2> {log.stderr} \
-        && rm {input.sam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 rule bam_sorting_LR:
@@ -424,12 +649,12 @@ rule bam_sorting_LR:
         stderr = "logs/05_binning/samtools/LR/{assembler_lr}/{sample_lr}.sorting.stderr"
     benchmark:
         "benchmarks/05_binning/samtools/LR/{assembler_lr}/{sample_lr}.sorting.benchmark.txt"
+    resources: **rule_resources(config, "bam_sorting_LR", disk_mb=mapping_disk_mb(config, 'sorting'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools sort -o {output.bam} {input.bam} \
-            > {log.stdout} 2> {log.stderr} \
-        && \
-        rm {input.bam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 # binning rules
@@ -459,6 +684,7 @@ rule metabat2_binning_LR:
         min_bin_size = config['binning']['metabat2']['min_bin_size'],
         bin_basename = "{sample_lr}"
     threads: config['binning'].get('metabat2', {}).get('threads', 0)
+    resources: **rule_resources(config, "metabat2_binning_LR")
     shell:
         """
         metabat2 -i {input.assembly} -o "{output.output}/{params.bin_basename}" \
@@ -481,6 +707,7 @@ rule metabat2_binning_LR:
 rule semibin2_binning_LR:
     input:
         assembly = "results/03_assembly/{assembler_lr}/{sample_lr}/assembly.fa.gz",
+        # always the BAM: the shared depth table drops reads below 97% identity, i.e. most long reads
         bam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sorted.bam"
     output:
         output = directory("results/05_binning/semibin2/bins/{assembler_lr}/{sample_lr}")
@@ -496,6 +723,7 @@ rule semibin2_binning_LR:
     params:
         environment = config['binning'].get('semibin2', {}).get('environment', '')
     threads: config['binning'].get('semibin2', {}).get('threads', 0)
+    resources: **rule_resources(config, "semibin2_binning_LR")
     shell:
         """
         SemiBin2 single_easy_bin \
@@ -518,6 +746,7 @@ rule semibin2_binning_LR:
 rule vamb_binning_LR:
     input:
         assembly = "results/03_assembly/{assembler_lr}/{sample_lr}/assembly.fa.gz",
+        # always the BAM, as for semibin2_binning_LR
         bam = "results/05_binning/minimap2/{assembler_lr}/{sample_lr}.sorted.bam"
     output:
         output = directory("results/05_binning/vamb/bins/{assembler_lr}/{sample_lr}")
@@ -534,12 +763,15 @@ rule vamb_binning_LR:
         epochs = config['binning'].get('vamb', {}).get('epochs'),
         batch_sizes = config['binning'].get('vamb', {}).get('batch_sizes'),
         start_batch_size = config['binning'].get('vamb', {}).get('start_batch_size'),
+        min_contig_length = vamb_min_contig_length(config),
         assembler_lr = config['assembly'].get('assembler'),
     threads: config['binning'].get('vamb', {}).get('threads', 0)
+    resources: **rule_resources(config, "vamb_binning_LR")
     shell:
         """
         vamb --outdir {output.output} \
             --fasta {input.assembly} \
+            -m {params.min_contig_length} \
             --bamfiles {input.bam} \
             --minfasta {params.minfasta} \
             -e {params.epochs} \
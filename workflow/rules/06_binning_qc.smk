@@ -1,6 +1,6 @@
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
 ASSEMBLER = config['assembly']['assembler']
 ASSEMBLER_LR = config['assembly']['long_read_assembler']
 HYBRID_ASSEMBLER = config['assembly']['hybrid_assembler']
@@ -65,10 +65,12 @@ rule checkm2_assessment:
         stdout = "logs/06_binning_qc/checkm2/{binner}/{assembler_sr_hybrid}/{sample}.assessment.stdout",
         stderr = "logs/06_binning_qc/checkm2/{binner}/{assembler_sr_hybrid}/{sample}.assessment.stderr"
     benchmark:
-        "benchmarks/06_binning_qc/checkm2/{binner}/{assembler_sr_hybrid}/{sample}.assessment.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/06_binning_qc/checkm2/{binner}/{assembler_sr_hybrid}/{sample}.assessment.benchmark.txt", config.get('benchmark_repeats', 1))
     threads: config['checkm2']['threads']
     wildcard_constraints:
         binner = "|".join(SHORT_READ_BINNER)
+    resources: **rule_resources(config, "checkm2_assessment")
     shell:
         """
         echo {input.bins} \
@@ -97,6 +99,7 @@ rule checkm2_assessment_LR:
     threads: config['checkm2']['threads']
     wildcard_constraints:
         long_read_binner = "|".join(LONG_READ_BINNER)
+    resources: **rule_resources(config, "checkm2_assessment_LR")
     shell:
         """
         echo {input.bins} \
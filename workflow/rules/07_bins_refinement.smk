@@ -20,9 +20,9 @@ if ASSEMBLER_LR == None:
 SHORT_READ_BINNER = config['binning']['binner']
 LONG_READ_BINNER = config['binning']['long_read_binner']
 
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
 
 rule binette_refinement:
     input: 
@@ -46,6 +46,7 @@ rule binette_refinement:
     wildcard_constraints:
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER)
     threads: config["bins_refinement"]["binette"]["threads"]
+    resources: **rule_resources(config, "binette_refinement")
     shell:
         """
         binette --bin_dirs {params.bins_folder} --contigs {input.assembly} \
@@ -79,9 +80,10 @@ rule binette_refinement_LR:
         bins_folder = lambda wildcards, input: [f"{dir}/bins" for dir in input.bins_dirs],
         low_mem = config["bins_refinement"]["binette"]["low_mem"]
     wildcard_constraints:
-        sample_lr = "|".join(SAMPLES_LR),
+        sample_lr = samples_constraint(config, SAMPLES_LR),
         assembler_lr = "|".join(ASSEMBLER_LR)
     threads: config["bins_refinement"]["binette"]["threads"]
+    resources: **rule_resources(config, "binette_refinement_LR")
     shell:
         """
         binette --bin_dirs {params.bins_folder} --contigs {input.assembly} \
@@ -1,6 +1,6 @@
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
-SAMPLES_LR = read_table_long_reads(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
+SAMPLES_LR = SAMPLE_SHEET.samples_lr
 
 # adding to "SAMPLES" samples "SAMPLES_LR" that were not found in "SAMPLES"
 for sample in SAMPLES_LR:
@@ -64,6 +64,7 @@ rule gtdb_tk_taxonomic_annotation:
     threads: config['bins_postprocessing']['gtdbtk']['threads']
     wildcard_constraints:
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
+    resources: **rule_resources(config, "gtdb_tk_taxonomic_annotation")
     shell:
         """
         gtdbtk classify_wf --genome_dir {input.refined_bins} --cpus {threads} --out_dir {output} \
@@ -130,12 +131,12 @@ else:
 
 # copying bins into another foler and renaming them if needed to avoid duplicated names 
 # (what makes dRep fail)
-# the copied bins will be removed once dRep is done
+# the copied bins are removed once dRep is done (for every ANI threshold)
 rule copy_and_rename_bins:
     input:
         "results/08_bins_postprocessing/genomes_list/{assembler}/list.txt"
     output:
-        bins_dest = directory("results/08_bins_postprocessing/genomes_list/genomes/{assembler}"),
+        bins_dest = temp(directory("results/08_bins_postprocessing/genomes_list/genomes/{assembler}")),
         bins_name_link_table = "results/08_bins_postprocessing/genomes_list/{assembler}/unduplicated.tsv"
     log:
         stdout = "logs/08_bins_postprocessing/genomes_list/{assembler}/copy_and_rename.stdout",
@@ -167,7 +168,10 @@ rule list_refined_genomes_after_unduplicating_filenames:
 rule genomes_dereplication:
     # input is formed of every refined produced no matter the sample
     # it is, however, assembler specific
-    input: "results/08_bins_postprocessing/genomes_list/{assembler}/list_unduplicated_filenames.txt"
+    input:
+        genomes_list = "results/08_bins_postprocessing/genomes_list/{assembler}/list_unduplicated_filenames.txt",
+        # the copied bins the list points to, so that they are kept until dRep is done
+        genomes = "results/08_bins_postprocessing/genomes_list/genomes/{assembler}"
     output: directory("results/08_bins_postprocessing/dRep/{ani}/{assembler}")
     conda:
         "../envs/drep.yaml"
@@ -175,7 +179,8 @@ rule genomes_dereplication:
         stdout = "logs/08_bins_postprocessing/drep/{ani}/{assembler}/dereplication.stdout",
         stderr = "logs/08_bins_postprocessing/drep/{ani}/{assembler}/dereplication.stderr"
     benchmark:
-        "benchmarks/08_bins_postprocessing/drep/{ani}/{assembler}/dereplication.benchmark.txt"
+        # repeated when measuring the scaling of the rule (see thread_scaling.py)
+        repeat("benchmarks/08_bins_postprocessing/drep/{ani}/{assembler}/dereplication.benchmark.txt", config.get('benchmark_repeats', 1))
     params:
         comparison_algorithm = config['bins_postprocessing']['drep']['comparison_algorithm'],
         other_args = config['bins_postprocessing']['drep']['other_args'],
@@ -183,9 +188,11 @@ rule genomes_dereplication:
     threads: config['bins_postprocessing']['drep']['threads']
     wildcard_constraints:
         ani = "|".join(ANI_THRESHOLD)
+    resources: **rule_resources(config, "genomes_dereplication")
+    priority: intermediates_priority(config)
     shell:
         """
-        dRep dereplicate --genomes {input} --processors {threads} \
+        dRep dereplicate --genomes {input.genomes_list} --processors {threads} \
             --S_algorithm {params.comparison_algorithm} \
             --S_ani {params.ani_dec} \
             {params.other_args} \
@@ -202,7 +209,9 @@ rule dereplicated_genomes_quality_and_filtering:
         diamond_database = "results/06_binning_qc/checkm2/database/CheckM2_database/uniref100.KO.1.dmnd"
     output:
         out_dir = directory("results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/checkm2"),
-        selected_bins = directory("results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins")
+        selected_bins = protected(directory("results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins")),
+        # bins whose contigs were renamed, kept next to the bins folder
+        renamed_contigs_manifest = "results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/renamed_contigs_manifest.tsv"
     conda:
         "../envs/checkm2.yaml"
     log:
@@ -218,6 +227,7 @@ rule dereplicated_genomes_quality_and_filtering:
     threads: config['bins_postprocessing']['genomes_quality_filtration']['checkm2']['threads']
     wildcard_constraints:
         ani = "|".join(ANI_THRESHOLD)
+    resources: **rule_resources(config, "dereplicated_genomes_quality_and_filtering")
     shell:
         """
         checkm2 predict --input {input.bins}/dereplicated_genomes --threads {threads} \
@@ -233,7 +243,36 @@ rule dereplicated_genomes_quality_and_filtering:
             --outdir {output.selected_bins} \
             > {log.stdout_filtration} 2> {log.stderr_filtration} \
         && \
-        python3 workflow/scripts/deduplicate_contigs_name.py {output.selected_bins}
+        python3 workflow/scripts/deduplicate_contigs_name.py --cpu {threads} \
+            --manifest {output.renamed_contigs_manifest} {output.selected_bins}
+        """
+
+# indexing once the link between every binned contig and its assembler, sample, binner, refined bin
+# and dereplicated bin, so that later steps don't have to read the bins again. One index per (ANI, assembler),
+# so that its consumers only wait for their own dereplication
+rule contigs_membership_index:
+    input:
+        bins_name_link_table = "results/08_bins_postprocessing/genomes_list/{assembler}/unduplicated.tsv",
+        dereplicated_bins = "results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins"
+    output:
+        "results/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.sqlite"
+    conda:
+        "../envs/python.yaml"
+    log:
+        stdout = "logs/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.stdout",
+        stderr = "logs/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.stderr"
+    benchmark:
+        "benchmarks/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.benchmark.txt"
+    threads: config['bins_postprocessing']['contigs_membership']['threads']
+    wildcard_constraints:
+        ani = "|".join(ANI_THRESHOLD)
+    shell:
+        """
+        python3 workflow/scripts/contigs_membership.py build \
+            --unduplicated {input.bins_name_link_table} \
+            --dereplicated {input.dereplicated_bins} \
+            --cpu {threads} -o {output} \
+            > {log.stdout} 2> {log.stderr}
         """
 
 # predicting genes in dereplicated genomes
@@ -418,6 +457,7 @@ rule bakta_annotation:
     wildcard_constraints:
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     threads: config['bins_postprocessing']['bakta']['parallel_jobs'] * config['bins_postprocessing']['bakta']['threads'] # for sizing well the number of threads, we need to account for both the number of parallel jobs and the number of threads per job
+    resources: **rule_resources(config, "bakta_annotation")
     shell:
         """
         python3 workflow/scripts/generate_bakta_commands.py bakta_annot \
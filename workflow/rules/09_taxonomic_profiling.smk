@@ -3,7 +3,7 @@ from utils import convert_to_si_units, convert_from_si_units_to_int
 
 rule metaphlan_profiling:
     input: "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz" # on short reads only
-    output: "results/09_taxonomic_profiling/metaphlan/{sample}.profile.txt"
+    output: protected("results/09_taxonomic_profiling/metaphlan/{sample}.profile.txt")
     conda:
         "../envs/metaphlan.yaml"
     log:
@@ -12,6 +12,7 @@ rule metaphlan_profiling:
     benchmark:
         "benchmarks/09_taxonomic_profiling/metaphlan/{sample}.profile.benchmark.txt"
     threads: config.get('taxonomic_profiling', {}).get('metaphlan', {}).get('threads', 0)
+    resources: **rule_resources(config, "metaphlan_profiling")
     shell:
         """
         metaphlan --input_type fastq --nproc {threads} \
@@ -76,6 +77,7 @@ rule meteor_mapping:
         config.get('taxonomic_profiling', {}).get('meteor', {}).get('threads', 0)
     params:
         indexed_fastq_file_with_sample = lambda wildcards: os.path.join(f"results/09_taxonomic_profiling/meteor/{wildcards.sample}/fastq_index", f"{wildcards.sample}")
+    resources: **rule_resources(config, "meteor_mapping")
     shell:
         """
         meteor mapping -i {params.indexed_fastq_file_with_sample} -o {output} -r $REFERENCE \
@@ -87,7 +89,7 @@ rule meteor_profiling:
     input:
         "results/09_taxonomic_profiling/meteor/{sample}/mapping"
     output:
-        directory("results/09_taxonomic_profiling/meteor/{sample}/profiling")
+        protected(directory("results/09_taxonomic_profiling/meteor/{sample}/profiling"))
     conda:
         "../envs/meteor.yaml"
     log:
@@ -97,6 +99,7 @@ rule meteor_profiling:
         "benchmarks/09_taxonomic_profiling/meteor/{sample}.profile.benchmark.txt"
     params:
         mapping_with_sample = lambda wildcards: os.path.join(f"results/09_taxonomic_profiling/meteor/{wildcards.sample}/mapping", f"{wildcards.sample}")
+    resources: **rule_resources(config, "meteor_profiling")
     shell:
         """ 
         meteor profile -i {params.mapping_with_sample} -o {output} -r $REFERENCE \
@@ -111,7 +114,7 @@ rule meteor_profiling_downsized:
     input:
         "results/09_taxonomic_profiling/meteor/{sample}/mapping"
     output:
-        directory("results/09_taxonomic_profiling/meteor/{sample}/profiling_downsized_{downsize}")
+        protected(directory("results/09_taxonomic_profiling/meteor/{sample}/profiling_downsized_{downsize}"))
     conda:
         "../envs/meteor.yaml"
     log:
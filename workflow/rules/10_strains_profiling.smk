@@ -1,7 +1,7 @@
 from utils import * 
 
-SAMPLES_TABLE = config['samples']
-SAMPLES = read_table(SAMPLES_TABLE)
+SAMPLE_SHEET = load_sample_sheet(config['samples'])
+SAMPLES = SAMPLE_SHEET.samples
 ASSEMBLER = config['assembly']['assembler']
 ASSEMBLER_LR = config['assembly']['long_read_assembler']
 
@@ -26,6 +26,9 @@ DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE = str(config['bins_postprocessing']['g
 seq_format = config["lr_seq_format"]
 sequences_file_end = f"_1.{seq_format}.gz"
 
+# minimap2 preset of the long reads, the assemblies and references are indexed with it as well
+LONG_READ_PRESET = long_read_preset(config)
+
 wildcard_constraints:
     assembler_lr = "|".join(ASSEMBLER_LR) if ASSEMBLER_LR != [] else "none",
     assembler_all = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR) if ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR != [] else "none",
@@ -33,13 +36,24 @@ wildcard_constraints:
     assembler_hybrid = "|".join(HYBRID_ASSEMBLER) if HYBRID_ASSEMBLER != [] else "none",
     assembler_sr_hybrid = "|".join(ASSEMBLER + HYBRID_ASSEMBLER) if ASSEMBLER + HYBRID_ASSEMBLER != [] else "none",
 
+# the sorted BAM are written either by minimap2 piped into samtools sort (streaming mode), or by
+# sorting the BAM converted from the SAM written by minimap2 (mode 'sam', see 'mapping' in the config)
+if streaming_mapping(config):
+    ruleorder: reads_mapping_on_reference_streaming > bam_sorting_strains_profiling
+    ruleorder: reads_LR_mapping_on_reference_streaming > bam_sorting_strains_profiling
+    ruleorder: reads_mapping_on_reference_hybrid_streaming > reads_mapping_on_reference_hybrid
+else:
+    ruleorder: bam_sorting_strains_profiling > reads_mapping_on_reference_streaming
+    ruleorder: bam_sorting_strains_profiling > reads_LR_mapping_on_reference_streaming
+    ruleorder: reads_mapping_on_reference_hybrid > reads_mapping_on_reference_hybrid_streaming
+
 # rule to concatenate every bins that were dereplicated and filtered into a 
-# unique FASTA file
+# unique FASTA file (temporary, as its indexes: removed once every sample is profiled)
 rule creating_ref_genomes_fasta:
     input:
         "results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins"
     output:
-        "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa"
+        temp("results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa")
     log:
         stderr = "logs/10_strain_profiling/refs/{ani}/{assembler}.concatenate.stderr"
     benchmark:
@@ -56,7 +70,7 @@ rule indexing_ref_genomes:
     input:
         "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa"
     output:
-        "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa.fai"
+        temp("results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa.fai")
     conda:
         "../envs/samtools.yaml"
     log:
@@ -72,13 +86,37 @@ rule indexing_ref_genomes:
         samtools faidx {input} > {log.stdout} 2> {log.stderr}
         """
 
+# minimap2 index of the reference genomes, built once per preset and shared by the mapping
+# of every sample
+rule minimap2_indexing_ref_genomes:
+    input:
+        "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa"
+    output:
+        temp("results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.{preset}.mmi")
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/10_strain_profiling/refs_indexing/{ani}/{assembler}.{preset}.minimap2.stderr"
+    benchmark:
+        "benchmarks/10_strain_profiling/refs_indexing/{ani}/{assembler}.{preset}.minimap2.benchmark.txt"
+    wildcard_constraints:
+        assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR),
+        ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE,
+        preset = "sr|map-ont|map-hifi|map-pb"
+    # minimap2 uses at most 3 threads to build an index
+    threads: min(3, config['strains_profiling']['minimap2']['threads'])
+    shell:
+        """
+        minimap2 -x {wildcards.preset} -t {threads} -d {output} {input} 2> {log.stderr}
+        """
+
 # inStrain will take predicted genes as an input if they have been
 # concatenated into a single FASTA file
 rule concatenating_predicted_genes:
     input:
         "results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/genes"
     output:
-        "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genes.fa"
+        temp("results/10_strain_profiling/refs/{ani}/{assembler}/ref_genes.fa")
     benchmark:
         "benchmarks/10_strain_profiling/refs/{ani}/{assembler}/concatenate_ref_genes.benchmark.txt"
     wildcard_constraints:
@@ -92,13 +130,13 @@ rule concatenating_predicted_genes:
 # mapping sample reads on the reference genomes (the bins)
 rule reads_mapping_on_reference:
     input:
-        # the bins we concatenated into a single FASTA file
-        refs = "results/10_strain_profiling/refs/{ani}/{assembler_sr}/ref_genomes.fa",
+        # index of the bins we concatenated into a single FASTA file
+        index = "results/10_strain_profiling/refs/{ani}/{assembler_sr}/ref_genomes.sr.mmi",
         # metagenome reads
         r1 = "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz",
         r2 = "results/02_preprocess/bowtie2/{sample}_2.clean.fastq.gz"
     output:
-        "results/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.sam"
+        temp("results/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
@@ -106,13 +144,53 @@ rule reads_mapping_on_reference:
     benchmark:
         "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.benchmark.txt"
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     threads: config['strains_profiling']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping_on_reference", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax sr -t {threads} \
-            {input.refs} {input.r1} {input.r2} > {output} 2> {log.stderr}
+            {input.index} {input.r1} {input.r2} > {output} 2> {log.stderr}
+        """
+
+# streaming mode: minimap2 output is sorted on the fly by samtools sort, so that neither the SAM nor
+# the unsorted BAM are written (see reads_mapping_streaming in 05_binning.smk)
+rule reads_mapping_on_reference_streaming:
+    input:
+        # index of the bins we concatenated into a single FASTA file
+        index = "results/10_strain_profiling/refs/{ani}/{assembler_sr}/ref_genomes.sr.mmi",
+        # metagenome reads
+        r1 = "results/02_preprocess/bowtie2/{sample}_1.clean.fastq.gz",
+        r2 = "results/02_preprocess/bowtie2/{sample}_2.clean.fastq.gz"
+    output:
+        "results/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.sorted.bam"
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.stderr",
+        stderr_sort = "logs/10_strain_profiling/samtools/{ani}/{assembler_sr}/{sample}.sorting.stderr"
+    benchmark:
+        "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.mapping_sorting.benchmark.txt"
+    wildcard_constraints:
+        sample = samples_constraint(config, SAMPLES),
+        ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
+    params:
+        # the threads of the job are shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: max(1, threads - mapping_option(config, 'sort_threads')),
+        sort_threads = mapping_option(config, 'sort_threads'),
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        tmp_prefix = sort_tmp_prefix(config, "results/10_strain_profiling/minimap2/{ani}/{assembler_sr}/{sample}.sorted.bam")
+    threads: config['strains_profiling']['minimap2']['threads'] + mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_mapping_on_reference_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.tmp_prefix}) \
+        && \
+        minimap2 -ax sr -t {params.mapping_threads} \
+            {input.index} {input.r1} {input.r2} 2> {log.stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.tmp_prefix} \
+            -o {output} - 2> {log.stderr_sort}
         """
 
 # there are two possibilities: reads used in hybrid assemblies were downsized, or reads used 
@@ -121,8 +199,9 @@ subsample_hybrid_reads = config["downsizing_for_hybrid"]["lr"] is not None and c
 
 rule reads_mapping_on_reference_hybrid:
     input:
-        # the bins we concatenated into a single FASTA file
-        refs = "results/10_strain_profiling/refs/{ani}/{assembler_hybrid}/ref_genomes.fa",
+        # indexes of the bins we concatenated into a single FASTA file
+        index_sr = "results/10_strain_profiling/refs/{ani}/{assembler_hybrid}/ref_genomes.sr.mmi",
+        index_lr = "results/10_strain_profiling/refs/{ani}/{assembler_hybrid}/ref_genomes." + LONG_READ_PRESET + ".mmi",
         # Select input files based on whether reads are downsized or not
         r1 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_1.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
         r2 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_2.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
@@ -137,40 +216,103 @@ rule reads_mapping_on_reference_hybrid:
     benchmark:
         "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.benchmark.txt"
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     params:
         mapping_sr = "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.SR.bam",
         mapping_lr = "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.LR.bam",
-        method = (
-            "map-ont" if config.get('lr_technology', '') == "nanopore"
-            else "map-hifi" if config.get('lr_technology', '') == "pacbio-hifi"
-            else "map-pb" if config.get('lr_technology', '') == "pacbio"
-            else ""
-        ),
+        method = LONG_READ_PRESET,
     threads: config['strains_profiling']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_mapping_on_reference_hybrid", disk_mb=mapping_disk_mb(config, 'sorting'))
     shell:
         """
         minimap2 -ax sr -t {threads} \
-            {input.refs} {input.r1} {input.r2} | samtools view -Sb - | samtools sort -o {params.mapping_sr} 2> {log.sr_stderr} \
+            {input.index_sr} {input.r1} {input.r2} | samtools view -Sb - | samtools sort -o {params.mapping_sr} 2> {log.sr_stderr} \
         && \
         minimap2 -ax {params.method} -t {threads} \
-            {input.refs} {input.long_read} | samtools view -Sb - | samtools sort -o {params.mapping_lr} 2> {log.lr_stderr} \
+            {input.index_lr} {input.long_read} | samtools view -Sb - | samtools sort -o {params.mapping_lr} 2> {log.lr_stderr} \
         && \
         samtools merge --threads {threads} -o {output} {params.mapping_sr} {params.mapping_lr} \
         && \
         rm -v {params.mapping_sr} {params.mapping_lr}
         """
 
+# streaming mode: short and long reads are mapped concurrently, sharing the threads of the job, each
+# mapping being sorted on the fly with the settings of config['mapping'] (see reads_mapping_hybrid_streaming
+# in 05_binning.smk); both sorted BAM are then merged once into the final one
+rule reads_mapping_on_reference_hybrid_streaming:
+    input:
+        # indexes of the bins we concatenated into a single FASTA file
+        index_sr = "results/10_strain_profiling/refs/{ani}/{assembler_hybrid}/ref_genomes.sr.mmi",
+        index_lr = "results/10_strain_profiling/refs/{ani}/{assembler_hybrid}/ref_genomes." + LONG_READ_PRESET + ".mmi",
+        # Select input files based on whether reads are downsized or not
+        r1 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_1.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
+        r2 = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}bowtie2/{wildcards.sample}_2.clean{'.downsized' if subsample_hybrid_reads else ''}.fastq.gz",
+        long_read = lambda wildcards: f"results/02_preprocess/{'downsized/' if subsample_hybrid_reads else ''}fastp_long_read/{wildcards.sample}{'_downsized' if subsample_hybrid_reads else ''}{sequences_file_end}"
+    output:
+        "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.sorted.bam"
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        sr_stderr = "logs/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.SR.stderr",
+        lr_stderr = "logs/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.LR.stderr",
+        sr_stderr_sort = "logs/10_strain_profiling/samtools/{ani}/{assembler_hybrid}/{sample}.SR.sorting.stderr",
+        lr_stderr_sort = "logs/10_strain_profiling/samtools/{ani}/{assembler_hybrid}/{sample}.LR.sorting.stderr",
+        stderr_merge = "logs/10_strain_profiling/samtools/{ani}/{assembler_hybrid}/{sample}.merge.stderr"
+    benchmark:
+        "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.mapping_sorting.benchmark.txt"
+    wildcard_constraints:
+        sample = samples_constraint(config, SAMPLES),
+        ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
+    params:
+        mapping_sr = "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.SR.bam",
+        mapping_lr = "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.LR.bam",
+        method = LONG_READ_PRESET,
+        # half of the threads of the job for each mapping, shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: hybrid_mapping_threads(threads, mapping_option(config, 'sort_threads'))[0],
+        sort_threads = lambda wildcards, threads: hybrid_mapping_threads(threads, mapping_option(config, 'sort_threads'))[1],
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        sr_tmp_prefix = sort_tmp_prefix(config, "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.SR.bam"),
+        lr_tmp_prefix = sort_tmp_prefix(config, "results/10_strain_profiling/minimap2/{ani}/{assembler_hybrid}/{sample}.LR.bam")
+    threads: config['strains_profiling']['minimap2']['threads'] + 2 * mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_mapping_on_reference_hybrid_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.sr_tmp_prefix}) $(dirname {params.lr_tmp_prefix})
+
+        minimap2 -ax sr -t {params.mapping_threads} \
+            {input.index_sr} {input.r1} {input.r2} 2> {log.sr_stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.sr_tmp_prefix} \
+            -o {params.mapping_sr} - 2> {log.sr_stderr_sort} &
+        sr_pid=$!
+
+        minimap2 -ax {params.method} -t {params.mapping_threads} \
+            {input.index_lr} {input.long_read} 2> {log.lr_stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.lr_tmp_prefix} \
+            -o {params.mapping_lr} - 2> {log.lr_stderr_sort} &
+        lr_pid=$!
+
+        # both mappings must succeed
+        sr_status=0; wait $sr_pid || sr_status=$?
+        lr_status=0; wait $lr_pid || lr_status=$?
+        if [ $sr_status -ne 0 ] || [ $lr_status -ne 0 ]; then
+            rm -f {params.mapping_sr} {params.mapping_lr}
+            exit 1
+        fi
+
+        samtools merge --threads {threads} -o {output} {params.mapping_sr} {params.mapping_lr} 2> {log.stderr_merge}
+        rm {params.mapping_sr} {params.mapping_lr}
+        """
+
 # mapping sample reads (long reads) on the reference genomes (the bins)
 rule reads_LR_mapping_on_reference:
     input:
-        # the bins we concatenated into a single FASTA file
-        refs = "results/10_strain_profiling/refs/{ani}/{assembler_lr}/ref_genomes.fa",
+        # index of the bins we concatenated into a single FASTA file
+        index = "results/10_strain_profiling/refs/{ani}/{assembler_lr}/ref_genomes." + LONG_READ_PRESET + ".mmi",
         # metagenome reads
         long_read = "results/02_preprocess/fastp_long_read/{sample}" + sequences_file_end
     output:
-        "results/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.sam"
+        temp("results/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.sam")
     conda:
         "../envs/minimap2.yaml"
     log:
@@ -178,28 +320,62 @@ rule reads_LR_mapping_on_reference:
     benchmark:
         "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.benchmark.txt"
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     params:
-        method = (
-            "map-ont" if config.get('lr_technology', '') == "nanopore"
-            else "map-hifi" if config.get('lr_technology', '') == "pacbio-hifi"
-            else "map-pb" if config.get('lr_technology', '') == "pacbio"
-            else ""
-        ),
+        method = LONG_READ_PRESET,
     threads: config['strains_profiling']['minimap2']['threads']
+    resources: **rule_resources(config, "reads_LR_mapping_on_reference", disk_mb=mapping_disk_mb(config, 'sam'))
     shell:
         """
         minimap2 -ax {params.method} -t {threads} \
-            {input.refs} {input.long_read} \
+            {input.index} {input.long_read} \
             > {output} 2> {log.stderr}
         """
 
+# streaming mode (see reads_mapping_on_reference_streaming)
+rule reads_LR_mapping_on_reference_streaming:
+    input:
+        # index of the bins we concatenated into a single FASTA file
+        index = "results/10_strain_profiling/refs/{ani}/{assembler_lr}/ref_genomes." + LONG_READ_PRESET + ".mmi",
+        # metagenome reads
+        long_read = "results/02_preprocess/fastp_long_read/{sample}" + sequences_file_end
+    output:
+        "results/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.sorted.bam"
+    conda:
+        "../envs/minimap2.yaml"
+    log:
+        stderr = "logs/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.stderr",
+        stderr_sort = "logs/10_strain_profiling/samtools/{ani}/{assembler_lr}/{sample}.sorting.stderr"
+    benchmark:
+        "benchmarks/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.mapping_sorting.benchmark.txt"
+    wildcard_constraints:
+        sample = samples_constraint(config, SAMPLES),
+        ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
+    params:
+        method = LONG_READ_PRESET,
+        # the threads of the job are shared by minimap2 and samtools sort
+        mapping_threads = lambda wildcards, threads: max(1, threads - mapping_option(config, 'sort_threads')),
+        sort_threads = mapping_option(config, 'sort_threads'),
+        sort_memory = mapping_option(config, 'sort_memory_per_thread'),
+        tmp_prefix = sort_tmp_prefix(config, "results/10_strain_profiling/minimap2/{ani}/{assembler_lr}/{sample}.sorted.bam")
+    threads: config['strains_profiling']['minimap2']['threads'] + mapping_option(config, 'sort_threads')
+    resources: **rule_resources(config, "reads_LR_mapping_on_reference_streaming", disk_mb=mapping_disk_mb(config, 'sorting'))
+    shell:
+        """
+        mkdir -p $(dirname {params.tmp_prefix}) \
+        && \
+        minimap2 -ax {params.method} -t {params.mapping_threads} \
+            {input.index} {input.long_read} 2> {log.stderr} \
+        | samtools sort -@ {params.sort_threads} -m {params.sort_memory} -T {params.tmp_prefix} \
+            -o {output} - 2> {log.stderr_sort}
+        """
+
 rule sam_to_bam_strains_profiling:
     input:
         sam = "results/10_strain_profiling/minimap2/{ani}/{assembler}/{sample}.sam"
     output:
-        bam = "results/10_strain_profiling/minimap2/{ani}/{assembler}/{sample}.bam"
+        bam = temp("results/10_strain_profiling/minimap2/{ani}/{assembler}/{sample}.bam")
     conda:
         "../envs/samtools.yaml"
     log:
@@ -208,15 +384,16 @@ rule sam_to_bam_strains_profiling:
     benchmark:
         "benchmarks/10_strain_profiling/samtools/{ani}/{assembler}/{sample}.sam_to_bam.benchmark.txt"
     wildcard_constraints:
-        sample = "|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + ASSEMBLER_LR),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     threads: config['binning'].get('samtools', {}).get('threads', 0)
+    resources: **rule_resources(config, "sam_to_bam_strains_profiling", disk_mb=mapping_disk_mb(config, 'bam'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools view --threads {threads} -o {output.bam} {input.sam} \
-            > {log.stdout} 2> {log.stderr} \
-        && rm {input.sam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 rule bam_sorting_strains_profiling:
@@ -233,15 +410,15 @@ rule bam_sorting_strains_profiling:
     benchmark:
         "benchmarks/10_strain_profiling/samtools/{ani}/{assembler}/{sample}.sorting.benchmark.txt"
     wildcard_constraints:
-        sample="|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + ASSEMBLER_LR),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
+    resources: **rule_resources(config, "bam_sorting_strains_profiling", disk_mb=mapping_disk_mb(config, 'sorting'))
+    priority: intermediates_priority(config)
     shell:
         """
         samtools sort -o {output.bam} {input.bam} \
-            > {log.stdout} 2> {log.stderr} \
-        && \
-        rm {input.bam}
+            > {log.stdout} 2> {log.stderr}
         """
 
 rule bam_indexing:
@@ -263,12 +440,13 @@ rule bam_indexing:
 # producing a scaffolds to bin file for inStrain (file with the contig <-> bin link)
 rule produce_scaffolds_to_bin_file:
     input:
-        bins = "results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani}/{assembler}/bins",
+        # the contig <-> bin link is read from the contigs membership index, not from the bins
+        membership_index = "results/08_bins_postprocessing/contigs_membership/{ani}/{assembler}.sqlite",
         refs = "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.fa"
     output:
         "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.stb"
     conda:
-        "../envs/drep.yaml"
+        "../envs/python.yaml"
     log:
         stdout = "logs/10_strain_profiling/inStrain/{ani}/{assembler}/stb.stdout",
         stderr = "logs/10_strain_profiling/inStrain/{ani}/{assembler}/stb.stderr"
@@ -279,7 +457,8 @@ rule produce_scaffolds_to_bin_file:
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     shell:
         """
-        parse_stb.py --reverse -f {input.bins}/* -o {output} \
+        python3 workflow/scripts/contigs_membership.py stb {input.membership_index} \
+            --ani {wildcards.ani} --assembler {wildcards.assembler} -o {output} \
             > {log.stdout} 2> {log.stderr}
         """
 
@@ -319,7 +498,7 @@ rule instrain_profiling:
         # predicted genes in references
         predicted_genes = "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genes.fa"
     output:
-        directory("results/10_strain_profiling/inStrain/{ani}/{assembler}/{sample}")
+        protected(directory("results/10_strain_profiling/inStrain/{ani}/{assembler}/{sample}"))
     conda:
         "../envs/instrain.yaml"
     log:
@@ -328,10 +507,11 @@ rule instrain_profiling:
     benchmark:
         "benchmarks/10_strain_profiling/inStrain/{ani}/{assembler}/{sample}.profile.benchmark.txt"
     wildcard_constraints:
-        sample = "|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER + ASSEMBLER_LR),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     threads: config['strains_profiling']['instrain']['threads']
+    resources: **rule_resources(config, "instrain_profiling")
     shell:
         """
         inStrain profile --output {output} -p {threads} \
@@ -347,7 +527,7 @@ rule instrain_comparing:
                                   sample=SAMPLES),
         stb = "results/10_strain_profiling/refs/{ani}/{assembler}/ref_genomes.stb"
     output:
-        directory("results/10_strain_profiling/inStrain/{ani}/{assembler}/compare")
+        protected(directory("results/10_strain_profiling/inStrain/{ani}/{assembler}/compare"))
     conda:
         "../envs/instrain.yaml"
     log:
@@ -387,7 +567,7 @@ rule floria_profiling:
     params:
         out_dir = "results/10_strain_profiling/floria/{ani}/{assembler}/{sample}"
     wildcard_constraints:
-        sample = "|".join(SAMPLES),
+        sample = samples_constraint(config, SAMPLES),
         assembler = "|".join(ASSEMBLER + HYBRID_ASSEMBLER),
         ani = DEREPLICATED_GENOMES_THRESHOLD_TO_PROFILE
     threads: config['strains_profiling'].get('floria', {}).get('threads', 0)
@@ -1,5 +1,117 @@
+import os
+import re
+import math
+import functools
+import yaml
 import pandas as pd
 
+# resources modeled by workflow/scripts/other_scripts/resources_model.py
+MODELED_RESOURCES = ['mem_mb', 'runtime', 'disk_mb']
+
+# types of FASTQ in the samples table
+READ_TYPES = ['R1', 'R2', 'long']
+
+# options of the mapping of reads (config['mapping']) when they are not given
+MAPPING_DEFAULTS = {'mode': 'streaming', 'sort_threads': 2, 'sort_memory_per_thread': '768M',
+                    'tmp_dir': None, 'index_bam': False}
+
+# minimap2 presets of the long reads, by technology (config['lr_technology'])
+LONG_READ_PRESETS = {'nanopore': 'map-ont', 'pacbio-hifi': 'map-hifi', 'pacbio': 'map-pb'}
+
+# minimum length of the contigs binned by VAMB (-m), VAMB refuses values below 250
+VAMB_MIN_CONTIG_LENGTH = 2000
+
+# priority of the rules consuming large temporary files when a concurrent write cap is given
+INTERMEDIATES_PRIORITY = 10
+
+# disk written by the mapping and sorting jobs, relative to the size of their input: an uncompressed SAM
+# is about 5 times larger than the gzipped reads and 2 to 4 times larger than its BAM, and sorting writes
+# temporary files about as large as the sorted output
+MAPPING_DISK_FACTORS = {'sam': 5, 'bam': 0.5, 'sorting': 2}
+
+class SampleSheet:
+    """
+    Samples table of the pipeline (config['samples']), parsed and validated once.
+    FASTQ are indexed by sample, so that input functions do not filter the table for each job
+
+    The table has three columns: 'sample' (path of the FASTQ), 'sample_id' and 'type'
+    ('R1', 'R2' or 'long')
+    """
+
+    def __init__(self, table_path: str):
+        self.table_path = table_path
+        self.df = pd.read_csv(table_path, sep="\t", dtype={"sample": str, "sample_id": str})
+
+        missing_columns = {'sample', 'sample_id', 'type'} - set(self.df.columns)
+        if missing_columns:
+            raise ValueError(f"Samples table {table_path} is missing the columns: {', '.join(sorted(missing_columns))}")
+
+        unknown_types = set(self.df['type']) - set(READ_TYPES)
+        if unknown_types:
+            raise ValueError(f"Samples table {table_path} has unknown read types: {', '.join(sorted(map(str, unknown_types)))} "
+                             f"(expected: {', '.join(READ_TYPES)})")
+
+        duplicated = self.df[self.df.duplicated(['sample_id', 'type'])]
+        if not duplicated.empty:
+            raise ValueError(f"Samples table {table_path} has several FASTQ of the same type for samples: "
+                             f"{', '.join(duplicated['sample_id'].astype(str).unique())}")
+
+        # FASTQ by type, then by sample (in the order of the table)
+        self.fastq = {read_type: dict(zip(df['sample_id'], df['sample']))
+                      for read_type, df in self.df.groupby('type', sort=False)}
+        for read_type in READ_TYPES:
+            self.fastq.setdefault(read_type, {})
+
+        paired = set(self.fastq['R1']) ^ set(self.fastq['R2'])
+        if paired:
+            raise ValueError(f"Samples table {table_path} has samples with only one of 'R1' and 'R2': {', '.join(sorted(map(str, paired)))}")
+
+    @property
+    def samples(self):
+        """
+        Samples with small reads (a new list, that can be modified)
+        """
+        return list(self.fastq['R1'])
+
+    @property
+    def samples_lr(self):
+        """
+        Samples with long reads (a new list, that can be modified)
+        """
+        return list(self.fastq['long'])
+
+    def fastq_pair(self, sample_id):
+        """
+        Returns the pair of FASTQ corresponding to a sample (small reads)
+        """
+        if sample_id not in self.fastq['R1']:
+            raise ValueError(f"Sample {sample_id} has no small reads in {self.table_path}")
+
+        return (self.fastq['R1'][sample_id], self.fastq['R2'][sample_id])
+
+    def fastq_long_read(self, sample_id):
+        """
+        Returns the long read FASTQ corresponding to a sample
+        """
+        if sample_id not in self.fastq['long']:
+            raise ValueError(f"Sample {sample_id} has no long reads in {self.table_path}")
+
+        return self.fastq['long'][sample_id]
+
+    def all_fastq(self):
+        """
+        Returns all the FASTQ
+        """
+        return set(self.df['sample'])
+
+@functools.lru_cache(maxsize=None)
+def load_sample_sheet(table_path: str):
+    """
+    This function returns the samples table, parsed once for all the rule modules
+    """
+
+    return SampleSheet(table_path)
+
 # get samples name
 def read_table(table_path: str):
        """
@@ -7,12 +119,7 @@ def read_table(table_path: str):
        (the ones with small-read experiments)
        """
 
-       df = pd.read_csv(table_path, sep="\t")
-       filtered_df = df[df['type'] == 'R1']
-
-       sample_id_list = filtered_df['sample_id'].unique().tolist()
-
-       return sample_id_list
+       return load_sample_sheet(table_path).samples
 
 def read_table_long_reads(table_path: str):
        """
@@ -20,42 +127,135 @@ def read_table_long_reads(table_path: str):
        have a long-read experiment
        """
 
-       df = pd.read_csv(table_path, sep="\t")
-       filtered_df = df[df['type'] == 'long']
+       return load_sample_sheet(table_path).samples_lr
 
-       sample_id_list = filtered_df['sample_id'].unique().tolist()
+def mapping_option(config: dict, option: str):
+    """
+    This function returns an option of the mapping of reads (config['mapping']), or its
+    default value (MAPPING_DEFAULTS) if it is not given
+    """
 
-       return sample_id_list
+    value = (config.get('mapping') or {}).get(option)
 
-def get_fastq_pair(df, sample_id):
-       """
-       This function returns the pair of FASTQ corresponding to a sample (small reads)
-       """
-       sample_df = df[df['sample_id'] == sample_id]
+    return MAPPING_DEFAULTS[option] if value is None else value
 
-       forward_read = sample_df[sample_df['type'] == 'R1']['sample'].values[0]
-       reverse_read = sample_df[sample_df['type'] == 'R2']['sample'].values[0]
+def streaming_mapping(config: dict):
+    """
+    This function returns True if reads are mapped in streaming mode (minimap2 piped into
+    samtools sort), False if the SAM and BAM intermediate files are written (mode 'sam')
+    """
 
-       return (forward_read, reverse_read)
+    mode = mapping_option(config, 'mode')
+    if mode not in ['streaming', 'sam']:
+        raise ValueError(f"Unknown mapping mode '{mode}' (expected: streaming or sam)")
 
-def get_fastq_long_read(df, sample_id):
-       """
-       This function returns the long read FASTQ corresponding to a sample
-       """
-       sample_df = df[df['sample_id'] == sample_id]
+    return mode == 'streaming'
 
-       long_read = sample_df[sample_df['type'] == 'long']['sample'].values[0]
+def sort_tmp_prefix(config: dict, bam: str):
+    """
+    This function returns the prefix of the temporary files of samtools sort (-T) when writing
+    `bam` (a path that can contain wildcards): in config['mapping']['tmp_dir'] if it is given,
+    next to the BAM otherwise
+    """
 
-       return long_read
+    tmp_dir = mapping_option(config, 'tmp_dir')
+    prefix = bam + ".tmp"
 
-def get_all_fastq(df):
-       """
-       This function returns all the FASTQ
-       """
+    return os.path.join(tmp_dir, prefix.replace("/", "_")) if tmp_dir else prefix
+
+def long_read_preset(config: dict):
+    """
+    This function returns the minimap2 preset (-x) of the long reads, according to their
+    technology (config['lr_technology'])
+    """
+
+    return LONG_READ_PRESETS.get(config.get('lr_technology', ''), "")
+
+def hybrid_mapping_threads(threads: int, sort_threads: int):
+    """
+    This function splits the threads of a hybrid mapping job between its short-read and long-read
+    mappings, run concurrently: each one gets half of them, shared between minimap2 and samtools
+    sort (which gets at most `sort_threads` additional threads). Returns the threads of minimap2 and
+    of samtools sort of each mapping
+    """
+
+    half = max(1, threads // 2)
+    sort_threads = min(sort_threads, half - 1)
+
+    return half - sort_threads, sort_threads
+
+def vamb_min_contig_length(config: dict):
+    """
+    This function returns the minimum length of the contigs binned by VAMB
+    (config['binning']['vamb']['min_contig_length'], VAMB_MIN_CONTIG_LENGTH by default),
+    given to VAMB (-m) and to the abundance file written for it, which must list the same contigs
+    """
+
+    value = ((config.get('binning') or {}).get('vamb') or {}).get('min_contig_length')
+
+    return VAMB_MIN_CONTIG_LENGTH if value is None else int(value)
+
+def shared_depth(config: dict):
+    """
+    This function returns True if SemiBin2 and VAMB use the depth table of the contigs computed
+    once per assembly (as MetaBAT 2 does) instead of reading the BAM again
+    (config['binning']['shared_depth'], True by default). Long-read binning always reads the BAM
+    """
+
+    value = (config.get('binning') or {}).get('shared_depth')
+
+    return True if value is None else bool(value)
+
+def trie_regex(words: list):
+    """
+    This function returns a regular expression matching exactly the given words, with their
+    common prefixes factored (e.g. 'S1|S10|S2' gives 'S(?:1(?:0)?|2)'). Unlike an alternation
+    of all the words, matching it does not depend on their number
+    """
 
-       sample = df['sample'].tolist()
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def node_regex(node):
+        alternatives = [re.escape(char) + node_regex(child) for char, child in sorted(node.items()) if char]
+        optional = '' in node
+        if not alternatives:
+            return ''
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        regex = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if optional:
+            regex = f"(?:{regex})?" if len(alternatives) == 1 else regex + "?"
+        return regex
+
+    return node_regex(trie)
+
+def samples_constraint(config: dict, samples: list):
+    """
+    This function returns the wildcard constraint of the samples, according to
+    config['sample_constraints']:
+    - 'enumerate': the alternation of all the samples, slow to match with thousands of samples
+    - 'trie' (default): the same samples, with their common prefixes factored
+    - 'pattern': any name made of the characters found in the samples names (the fastest; it
+       also matches names that are not samples, which is fine as long as they are not requested)
+    """
 
-       return set(sample)
+    mode = config.get('sample_constraints') or 'trie'
+    samples = list(dict.fromkeys(samples))
+
+    if mode == 'enumerate':
+        return "|".join(samples)
+    if mode == 'trie':
+        return trie_regex(samples)
+    if mode == 'pattern':
+        chars = sorted(set("".join(samples)))
+        return "[" + "".join(re.escape(char) for char in chars) + "]+" if chars else ""
+
+    raise ValueError(f"Unknown sample_constraints '{mode}' (expected: enumerate, trie or pattern)")
 
 def validate_assemblers(df: pd.DataFrame, assemblers: list):
     """
@@ -72,27 +272,23 @@ def validate_assemblers(df: pd.DataFrame, assemblers: list):
     ValueError: If the required input files are missing for any of the specified assemblers
     """
 
+    # read types available for each sample (one column by type)
+    types = pd.crosstab(df['sample_id'], df['type']).reindex(columns=READ_TYPES, fill_value=0) > 0
+    has_short_reads = types['R1'] & types['R2']
+
     # check if metaflye is selected and there are no long reads
     if 'metaflye' in assemblers:
-        if not any(df['type'] == 'long'):
+        if not types['long'].any():
             raise ValueError("Metaflye assembler requires at least one 'long' read file.")
     
     # check if hybridspades is selected and there is no combination of R1, R2, and long reads for any sample
     if 'hybridspades' in assemblers:
-        hybrid_valid = df.groupby('sample_id').apply(
-            lambda x: all(type_ in x['type'].values for type_ in ['R1', 'R2', 'long'])
-        ).any()
-        
-        if not hybrid_valid:
+        if not (has_short_reads & types['long']).any():
             raise ValueError("Hybridspaes assembler requires 'R1', 'R2', and 'long' read files for at least one sample.")
     
     # check if megahit or metaspades are selected and there are no R1 and R2 reads for any sample
     if any(asm in assemblers for asm in ['megahit', 'metaspades']):
-        sr_valid = df.groupby('sample_id').apply(
-            lambda x: all(type_ in x['type'].values for type_ in ['R1', 'R2'])
-        ).any()
-        
-        if not sr_valid:
+        if not has_short_reads.any():
             raise ValueError("Megahit and Metaspades assemblers require 'R1' and 'R2' read files for at least one sample.")
 
 def convert_to_si_units(value):
@@ -136,3 +332,116 @@ def convert_from_si_units_to_int(value):
     num = float(value[:-1])
 
     return int(num * units[unit])
+
+@functools.lru_cache(maxsize=None)
+def read_samples_input_size(table_path: str):
+    """
+    This function returns the total size (in bytes) of the FASTQ of each sample, which is
+    the input size the resources of the rules are modeled on. Missing files count for 0.
+    The FASTQ are only looked at once per sample sheet, not for every job and resource
+    """
+
+    df = load_sample_sheet(table_path).df
+    sizes = df['sample'].map(lambda path: os.path.getsize(path) if os.path.exists(path) else 0)
+
+    return sizes.groupby(df['sample_id']).sum().to_dict()
+
+@functools.lru_cache(maxsize=None)
+def load_resources_model(model_path: str):
+    """
+    This function returns the per-rule resources model written by
+    workflow/scripts/other_scripts/resources_model.py (empty if there is no model)
+    """
+
+    if not model_path or not os.path.exists(model_path):
+        return {}
+
+    with open(model_path) as f:
+        model = yaml.safe_load(f) or {}
+
+    return model.get('rules') or {}
+
+def predict_resource(coefficients: dict, input_size: float):
+    """
+    This function returns the value of a modeled resource for a job, given the size of
+    its input in bytes (the slope of the model is by GB)
+    """
+
+    return coefficients['intercept'] + coefficients['slope'] * input_size / 1e9
+
+def concurrent_write_cap(config: dict):
+    """
+    This function returns the cap in MB on the sum of the disk_mb of the jobs running at the same
+    time (config['resources']['concurrent_write_cap_mb']), None if there is none. It limits the disk
+    written concurrently, not the disk usage of the run
+    """
+
+    cap = (config.get('resources') or {}).get('concurrent_write_cap_mb')
+    if cap is not None and cap <= 0:
+        raise ValueError(f"The concurrent write cap must be positive (resources: concurrent_write_cap_mb: {cap})")
+
+    return cap
+
+def bound_by_write_cap(config: dict, disk_mb: int):
+    """
+    This function returns `disk_mb` bounded by the concurrent write cap, so that no job asks for more
+    than the whole cap (Snakemake could never schedule it)
+    """
+
+    cap = concurrent_write_cap(config)
+
+    return disk_mb if cap is None else min(disk_mb, cap)
+
+def mapping_disk_mb(config: dict, output: str):
+    """
+    This function returns the disk_mb of a mapping or sorting job writing a SAM, a BAM or a sorted
+    file (`output`: 'sam', 'bam' or 'sorting', see MAPPING_DISK_FACTORS), as a callable estimating it
+    for each job from the size of its input, bounded by the concurrent write cap
+
+    Usage in a rule: `resources: **rule_resources(config, "reads_mapping", disk_mb=mapping_disk_mb(config, 'sam'))`
+    """
+
+    factor = MAPPING_DISK_FACTORS[output]
+
+    def disk_mb_for_job(wildcards, input):
+        return bound_by_write_cap(config, max(1000, math.ceil(factor * input.size_mb)))
+
+    return disk_mb_for_job
+
+def intermediates_priority(config: dict):
+    """
+    This function returns the priority of the rules consuming large temporary files (SAM, unsorted
+    BAM, genes of each sample, copies of the bins...): with a concurrent write cap, they run before the jobs
+    writing new ones, so that temporary files are deleted as soon as possible
+
+    Usage in a rule: `priority: intermediates_priority(config)`
+    """
+
+    return INTERMEDIATES_PRIORITY if concurrent_write_cap(config) else 0
+
+def rule_resources(config: dict, rule: str, **defaults):
+    """
+    This function returns the resources (mem_mb, runtime, disk_mb) of a rule as callables
+    evaluated for each job, from the model given in the config ('resources: model').
+    Values are multiplied by 'resources: attempt_factor' at each new attempt (see --retries),
+    disk_mb is bounded by the concurrent write cap. Resources the model has no value for are taken from
+    `defaults`, if given, and Snakemake defaults apply otherwise
+
+    Usage in a rule: `resources: **rule_resources(config, "metaspades_assembly")`
+    """
+
+    resources_config = config.get('resources') or {}
+    model = load_resources_model(resources_config.get('model') or "").get(rule)
+    if not model:
+        return dict(defaults)
+    attempt_factor = resources_config.get('attempt_factor', 1.5)
+
+    def get_resource(resource):
+        def resource_for_job(wildcards, attempt):
+            sample = getattr(wildcards, 'sample', None) or getattr(wildcards, 'sample_lr', None)
+            input_size = read_samples_input_size(config['samples']).get(sample, 0) if sample else 0
+            value = max(1, math.ceil(predict_resource(model[resource], input_size) * attempt_factor ** (attempt - 1)))
+            return bound_by_write_cap(config, value) if resource == 'disk_mb' else value
+        return resource_for_job
+
+    return {**defaults, **{resource: get_resource(resource) for resource in MODELED_RESOURCES if resource in model}}
@@ -17,7 +17,7 @@ with open('../../../config/template_config.yaml', 'r') as f:
 PREPROCESSING = {k: v for k, v in defaults.items() if k in ['fastp', 'fastp_long_read', 'bowtie2', 'downsizing_for_hybrid']}
 ASSEMBLY = {k: v for k, v in defaults.items() if k in ['assembly', 'quast']}
 GENE_CATALOG = {k: v for k, v in defaults.items() if k in ['mmseqs2', 'representative_genes']}
-BINNING = {k: v for k, v in defaults.items() if k in ['binning', 'checkm2', 'bins_refinement', 'bins_postprocessing']}
+BINNING = {k: v for k, v in defaults.items() if k in ['mapping', 'binning', 'checkm2', 'bins_refinement', 'bins_postprocessing']}
 TAXO_PROFILING = {k: v for k, v in defaults.items() if k in ['taxonomic_profiling']}
 
 # writing the extracted configuration sections and the full defaults dictionary
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Builds and queries the contigs membership index of a run.
+
+The index is a SQLite file linking every binned contig to its assembler, sample,
+binner, refined bin and, for each ANI threshold, to the dereplicated (and quality
+filtered) bin it ended up in. The pipeline builds one index per (ANI, assembler) couple,
+after the filtration of its bins, by scanning the headers of the refined bins a single
+time. Downstream steps (scaffolds to bin file for inStrain, binning statistics, skani
+reports...) can then query it instead of re-reading every bin or guessing the sample
+from the bins path.
+
+Subcommands:
+    build   build the index from the `unduplicated.tsv` tables and the folders of
+            dereplicated bins
+    stb     write the scaffolds to bin file of the dereplicated bins of an
+            (ANI, assembler) couple
+    query   print the membership of one or several contigs
+"""
+
+import os
+import re
+import sys
+import itertools
+import sqlite3
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sequence_io
+from deduplicate_contigs_name import get_prefix, all_prefixed
+
+# patterns of the refined bins paths, used to retrieve the binner and the sample of a bin
+REFINED_BIN_PATTERNS = [
+    re.compile(r"07_bins_refinement/(?P<binner>binette)/(?P<assembler>[^/]+)/(?P<sample>[^/]+)/final_bins/[^/]+$"),
+    re.compile(r"05_binning/(?P<binner>[^/]+)/bins/(?P<assembler>[^/]+)/(?P<sample>[^/]+)/bins/[^/]+$"),
+]
+
+# pattern of the folders with the dereplicated and filtered bins
+DEREPLICATED_BINS_PATTERN = re.compile(
+    r"dereplicated_genomes_filtered_by_quality/(?P<ani>[^/]+)/(?P<assembler>[^/]+)/bins/?$"
+)
+
+SCHEMA = """
+CREATE TABLE bins (
+    bin_id INTEGER PRIMARY KEY,
+    assembler TEXT NOT NULL,
+    sample TEXT,
+    binner TEXT,
+    refined_bin TEXT NOT NULL,
+    refined_path TEXT NOT NULL,
+    unambiguous_bin TEXT NOT NULL
+);
+CREATE TABLE contigs (
+    contig TEXT NOT NULL,
+    bin_id INTEGER NOT NULL REFERENCES bins(bin_id)
+);
+CREATE TABLE dereplicated_bins (
+    ani TEXT NOT NULL,
+    bin_id INTEGER NOT NULL REFERENCES bins(bin_id),
+    dereplicated_bin TEXT NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX contigs_contig ON contigs(contig);
+CREATE INDEX contigs_bin ON contigs(bin_id);
+CREATE UNIQUE INDEX bins_unambiguous ON bins(assembler, unambiguous_bin);
+CREATE INDEX dereplicated_ani ON dereplicated_bins(ani, bin_id);
+"""
+
+# one row per (contig, dereplicated bin), contigs of bins not kept after
+# dereplication have a NULL ANI and dereplicated bin
+MEMBERSHIP_QUERY = """
+SELECT c.contig, b.assembler, b.sample, b.binner, b.refined_bin, d.ani, d.dereplicated_bin
+FROM contigs c
+JOIN bins b ON b.bin_id = c.bin_id
+LEFT JOIN dereplicated_bins d ON d.bin_id = c.bin_id
+"""
+
+MEMBERSHIP_COLUMNS = ["contig", "assembler", "sample", "binner", "refined_bin", "ani", "dereplicated_bin"]
+
+def parse_refined_bin_path(path: str):
+    """
+    Returns a dictionary with the binner, assembler and sample of a refined bin,
+    based on its path. Values are None if the path does not follow the pipeline layout
+    """
+    for pattern in REFINED_BIN_PATTERNS:
+        match = pattern.search(path)
+        if match:
+            return match.groupdict()
+    return {"binner": None, "assembler": None, "sample": None}
+
+def parse_dereplicated_bins_dir(path: str):
+    """
+    Returns the (ANI, assembler) of a folder of dereplicated and filtered bins
+    """
+    match = DEREPLICATED_BINS_PATTERN.search(path)
+    if match is None:
+        raise ValueError(f"Can't find the ANI and the assembler in the path: {path}")
+    return match.group("ani"), match.group("assembler")
+
+def read_unduplicated_table(table: str):
+    """
+    Yields (path, filename, unambiguous_filename) for each bin of an `unduplicated.tsv` table
+    """
+    with open(table) as f:
+        header = f.readline().rstrip("\n").split("\t")
+        if header != ["path", "filename", "unambiguous_filename"]:
+            raise ValueError(f"Unexpected header in {table}: {header}")
+        for line in f:
+            if line.strip():
+                yield tuple(line.rstrip("\n").split("\t"))
+
+def get_bin_contigs(bin_path: str):
+    """
+    Returns the contigs name (first word of the headers) of a bin
+    """
+    return [header.split()[0].decode() for header in sequence_io.iter_fasta_headers(bin_path)]
+
+def list_dereplicated_bins(bins_dir: str):
+    """
+    Returns the name (without extension) of the bins stored in a folder of dereplicated bins
+    """
+    return sorted(file[:-len(".fa")] for file in os.listdir(bins_dir) if file.endswith(".fa"))
+
+def build_index(unduplicated_tables: list, dereplicated_dirs: list, output: str, cpu: int = 1):
+    """
+    Builds the membership index in `output` from the tables linking the refined bins to their
+    unambiguous name (one per assembler) and from the folders of dereplicated and filtered bins.
+    Headers of the refined bins are read in parallel with `cpu` processes.
+
+    The index is written in a temporary file first, so `output` is either complete or absent
+    """
+    bins = []
+    for table in unduplicated_tables:
+        # bins are dereplicated per assembler, the tables are stored in genomes_list/{assembler}
+        assembler = os.path.basename(os.path.dirname(os.path.abspath(table)))
+        for path, filename, unambiguous_filename in read_unduplicated_table(table):
+            origin = parse_refined_bin_path(path)
+            bins.append({
+                "assembler": assembler,
+                "sample": origin["sample"],
+                "binner": origin["binner"],
+                "refined_bin": filename,
+                "refined_path": path,
+                # copies are decompressed, so the dereplicated bins never end with ".gz"
+                "unambiguous_bin": unambiguous_filename[:-len(".gz")]
+                                   if unambiguous_filename.endswith(".gz") else unambiguous_filename,
+            })
+    logging.info(f"{len(bins)} refined bins to index")
+
+    # scanning the headers of every bin once
+    paths = [bin["refined_path"] for bin in bins]
+    if cpu > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=cpu) as executor:
+            contigs = list(executor.map(get_bin_contigs, paths, chunksize=16))
+    else:
+        contigs = [get_bin_contigs(path) for path in paths]
+
+    tmp_output = f"{output}.tmp"
+    if os.path.exists(tmp_output):
+        os.remove(tmp_output)
+
+    conn = sqlite3.connect(tmp_output)
+    try:
+        conn.executescript(SCHEMA)
+        bin_ids = {}
+        for bin_id, (bin, bin_contigs) in enumerate(zip(bins, contigs)):
+            conn.execute("INSERT INTO bins VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (bin_id, bin["assembler"], bin["sample"], bin["binner"], bin["refined_bin"],
+                          bin["refined_path"], bin["unambiguous_bin"]))
+            conn.executemany("INSERT INTO contigs VALUES (?, ?)",
+                             ((contig, bin_id) for contig in bin_contigs))
+            bin_ids[(bin["assembler"], bin["unambiguous_bin"])] = bin_id
+        logging.info(f"{sum(len(c) for c in contigs)} binned contigs indexed")
+
+        # linking the dereplicated bins to the refined bins they come from
+        for bins_dir in dereplicated_dirs:
+            ani, assembler = parse_dereplicated_bins_dir(bins_dir)
+            dereplicated = list_dereplicated_bins(bins_dir)
+            rows = []
+            for name in dereplicated:
+                # dRep keeps the filename of the bins it selects
+                key = (assembler, f"{name}.fa")
+                if key not in bin_ids:
+                    raise ValueError(f"Dereplicated bin {name} ({bins_dir}) is not among the refined bins")
+                rows.append((ani, bin_ids[key], name))
+            conn.executemany("INSERT INTO dereplicated_bins VALUES (?, ?, ?)", rows)
+            logging.info(f"{len(rows)} dereplicated bins indexed for ANI {ani} and assembler {assembler}")
+
+        conn.executescript(INDEXES)
+        conn.commit()
+        conn.close()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_output)
+        raise
+
+    os.replace(tmp_output, output)
+
+def open_index(index: str):
+    """
+    Opens the membership index in read-only mode
+    """
+    if not os.path.exists(index):
+        raise FileNotFoundError(f"Contigs membership index not found: {index}")
+    return sqlite3.connect(f"file:{os.path.abspath(index)}?mode=ro", uri=True)
+
+def lookup_contig(conn, contig: str, assembler: str = None, sample: str = None):
+    """
+    Returns the membership rows (dictionaries) of a contig. As contigs names are only unique
+    within an assembly, the lookup can be restricted to an assembler and a sample
+    """
+    query = MEMBERSHIP_QUERY + " WHERE c.contig = ?"
+    params = [contig]
+    if assembler is not None:
+        query += " AND b.assembler = ?"
+        params.append(assembler)
+    if sample is not None:
+        query += " AND b.sample = ?"
+        params.append(sample)
+    return [dict(zip(MEMBERSHIP_COLUMNS, row)) for row in conn.execute(query, params)]
+
+def binned_contigs(conn, assembler: str, sample: str):
+    """
+    Returns a dictionary {contig: refined bin} of the contigs binned in an assembly
+    """
+    return dict(conn.execute(
+        "SELECT c.contig, b.refined_bin FROM contigs c JOIN bins b ON b.bin_id = c.bin_id "
+        "WHERE b.assembler = ? AND b.sample = ?", (assembler, sample)))
+
+def bins_samples(conn, assembler: str):
+    """
+    Returns a dictionary {unambiguous bin filename: sample} of the bins of an assembler
+    """
+    return dict(conn.execute("SELECT unambiguous_bin, sample FROM bins WHERE assembler = ?", (assembler,)))
+
+def iter_scaffolds_to_bin(conn, ani: str, assembler: str):
+    """
+    Yields (contig, bin filename) for every contig of the dereplicated bins of an
+    (ANI, assembler) couple. Contigs are named as in the dereplicated bins, i.e. prefixed
+    by the bin name, unless all of them already were (see `deduplicate_contigs_name.py`)
+    """
+    rows = conn.execute(
+        "SELECT d.dereplicated_bin, c.contig FROM dereplicated_bins d "
+        "JOIN contigs c ON c.bin_id = d.bin_id "
+        "JOIN bins b ON b.bin_id = d.bin_id "
+        "WHERE d.ani = ? AND b.assembler = ? ORDER BY d.dereplicated_bin, c.rowid",
+        (str(ani), assembler))
+    for dereplicated_bin, contigs in itertools.groupby(rows, key=lambda row: row[0]):
+        contigs = [contig for _, contig in contigs]
+        prefix = get_prefix(dereplicated_bin)
+        # same decision as when the bin was renamed, taken on all its headers
+        if not all_prefixed(contigs, prefix):
+            contigs = [prefix + contig for contig in contigs]
+        for contig in contigs:
+            yield contig, f"{dereplicated_bin}.fa"
+
+def write_scaffolds_to_bin(conn, ani: str, assembler: str, output: str):
+    """
+    Writes the scaffolds to bin file (contig <tab> bin filename) used by inStrain
+    """
+    contigs = 0
+    with open(output, 'w') as f:
+        for contig, bin_file in iter_scaffolds_to_bin(conn, ani, assembler):
+            f.write(f"{contig}\t{bin_file}\n")
+            contigs += 1
+    if contigs == 0:
+        logging.warning(f"No contig found for ANI {ani} and assembler {assembler}")
+    logging.info(f"{contigs} contigs written in {output}")
+
+def main():
+    """
+    Main program logic
+    """
+    parser = argparse.ArgumentParser(description="Build and query the contigs membership index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build the index")
+    build_parser.add_argument("--unduplicated", nargs="+", required=True,
+                              help="Tables linking the refined bins to their unambiguous name (unduplicated.tsv)")
+    build_parser.add_argument("--dereplicated", nargs="*", default=[],
+                              help="Folders with the dereplicated and filtered bins")
+    build_parser.add_argument("--cpu", type=int, default=1, help="Number of bins read in parallel (default: 1)")
+    build_parser.add_argument("-o", "--output", required=True, help="Index to create")
+
+    stb_parser = subparsers.add_parser("stb", help="Write the scaffolds to bin file of dereplicated bins")
+    stb_parser.add_argument("index", help="Contigs membership index")
+    stb_parser.add_argument("--ani", required=True, help="ANI threshold used for the dereplication")
+    stb_parser.add_argument("--assembler", required=True, help="Assembler")
+    stb_parser.add_argument("-o", "--output", required=True, help="Scaffolds to bin file")
+
+    query_parser = subparsers.add_parser("query", help="Print the membership of contigs")
+    query_parser.add_argument("index", help="Contigs membership index")
+    query_parser.add_argument("contigs", nargs="+", help="Contigs name")
+    query_parser.add_argument("--assembler", help="Only report contigs from this assembler")
+    query_parser.add_argument("--sample", help="Only report contigs from this sample")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "build":
+        build_index(args.unduplicated, args.dereplicated, args.output, args.cpu)
+    elif args.command == "stb":
+        conn = open_index(args.index)
+        write_scaffolds_to_bin(conn, args.ani, args.assembler, args.output)
+        conn.close()
+    elif args.command == "query":
+        conn = open_index(args.index)
+        print("\t".join(MEMBERSHIP_COLUMNS))
+        for contig in args.contigs:
+            for row in lookup_contig(conn, contig, args.assembler, args.sample):
+                print("\t".join("" if row[c] is None else str(row[c]) for c in MEMBERSHIP_COLUMNS))
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,30 @@
 #!/usr/bin/env python3
-""" 
+"""
 Ensure there is not duplicated headers in FASTA stored in a given folder, by adding in every header
 the filename
-Script to identify if two or more bins, stored in a given folder, share the same contig names. If so, 
+Script to identify if two or more bins, stored in a given folder, share the same contig names. If so,
 it deduplicate them in order to have unique contigs name
+
+Bins are rewritten in parallel and each rewrite is atomic (the renamed copy replaces the original
+in one `os.replace`). Bins whose headers are already prefixed are left untouched, so the script
+can safely be run again on the same folder. With `--manifest`, the bins renamed are recorded in a
+file (outside the folder, which only holds bins) and are not read again by later runs.
 """
 
 import os
+import sys
 import logging
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sequence_io
 
 # configuring logging for the script
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def list_fasta(dir: str):
-    """ 
+    """
     Returns a list of FASTA files stored in `dir`
     """
     fasta = []
@@ -25,49 +35,145 @@ def list_fasta(dir: str):
                 fasta.append(os.path.join(root, file))
     return fasta
 
-def rename_fasta_headers(fasta: list):
-    """ 
-    Renames the headers of all FASTA files in the list `fasta` by 
-    adding the filename as a prefix to each header.
-    """
-    for file_path in fasta:
-        # Extract the base filename without extension
-        base_name = os.path.basename(file_path).split('.')[0]
-
-        logging.info(f"Treating file: {base_name}")
-        
-        # Create a new file to write the updated fasta
-        new_file_path = f"{file_path}_renamed.fa"
-        
-        with open(file_path, 'r') as infile, open(new_file_path, 'w') as outfile:
-            for line in infile:
-                # If the line is a header, modify it
-                if line.startswith(">"):
-                    # Strip the newline and prefix with the filename
-                    new_header = f">{base_name}_{line[1:].strip()}\n"
-                    outfile.write(new_header)
-                else:
-                    # Write the sequence line as-is
-                    outfile.write(line)
-
-        # we delete the original file
-        os.remove(file_path)
-
-        # we rename the FASTA with the new contigs name as the original FASTA
-        os.rename(new_file_path, file_path)
-        logging.info(f"New file written in {os.path.basename(file_path)}")
+def get_prefix(file_path: str):
+    """
+    Returns the prefix added to the headers of `file_path` (its filename without extension)
+    """
+    return os.path.basename(file_path).split('.')[0] + "_"
+
+def file_signature(file_path: str):
+    """
+    Returns the (size, modification time) of a file, used to know if it changed since
+    it was renamed
+    """
+    stat = os.stat(file_path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def read_manifest(manifest: str):
+    """
+    Reads the manifest of already renamed bins into a dictionary {path: (size, mtime)}
+    """
+    renamed = {}
+    if manifest is None or not os.path.exists(manifest):
+        return renamed
+
+    with open(manifest) as f:
+        for line in f:
+            path, size, mtime = line.rstrip("\n").split("\t")
+            renamed[path] = (int(size), int(mtime))
+    return renamed
+
+def write_manifest(renamed: dict, manifest: str):
+    """
+    Atomically writes the manifest of renamed bins
+    """
+    tmp_manifest = f"{manifest}.tmp"
+    with open(tmp_manifest, 'w') as f:
+        for path, (size, mtime) in sorted(renamed.items()):
+            f.write(f"{path}\t{size}\t{mtime}\n")
+    os.replace(tmp_manifest, manifest)
+
+def all_prefixed(headers, prefix):
+    """
+    Returns True if there is at least one header and all of them start with `prefix`.
+    A bin is renamed as a whole: its headers are either all left as-is or all prefixed
+    """
+    prefixed = False
+    for header in headers:
+        if not header.startswith(prefix):
+            return False
+        prefixed = True
+    return prefixed
+
+def is_already_prefixed(file_path: str):
+    """
+    Returns True if every header of `file_path` already starts with its filename
+    """
+    return all_prefixed(sequence_io.iter_fasta_headers(file_path), get_prefix(file_path).encode())
+
+def rename_one_fasta(file_path: str):
+    """
+    Prefixes the headers of `file_path` with its filename, unless it was already done.
+    The renamed copy is written next to the original and swapped in atomically, so a
+    crash never leaves a partially renamed bin.
+
+    Returns True if the file was rewritten, False if it was already prefixed
+    """
+    base_name = os.path.basename(file_path).split('.')[0]
+
+    if is_already_prefixed(file_path):
+        logging.info(f"Already renamed, skipping: {base_name}")
+        return False
+
+    logging.info(f"Treating file: {base_name}")
+
+    # the temporary file does not end with ".fa" so it is never listed as a bin
+    tmp_file_path = f"{file_path}.renaming.tmp"
+
+    # prefixing every header with the filename, sequences are copied as-is
+    prefix = get_prefix(file_path).encode()
+    try:
+        sequence_io.rewrite_fasta_headers(file_path, tmp_file_path,
+                                          lambda header: prefix + header.strip())
+        # we replace the original FASTA by the one with the new contigs name
+        os.replace(tmp_file_path, file_path)
+    finally:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+
+    logging.info(f"New file written in {os.path.basename(file_path)}")
+    return True
+
+def rename_fasta_headers(fasta: list, cpu: int = 1, manifest: str = None):
+    """
+    Renames the headers of all FASTA files in the list `fasta` by
+    adding the filename as a prefix to each header, using `cpu` processes.
+
+    If a `manifest` path is given, bins recorded in it and unchanged since are skipped
+    without being read, and the manifest is updated at the end.
+    """
+    renamed = read_manifest(manifest)
+    manifest_dir = os.path.dirname(manifest) if manifest is not None else "."
+
+    # only bins that are new or changed since the last run have to be checked
+    to_process = [f for f in fasta
+                  if renamed.get(os.path.relpath(f, manifest_dir)) != file_signature(f)]
+    logging.info(f"{len(fasta) - len(to_process)} bins already renamed according to the manifest, "
+                 f"{len(to_process)} to check")
+
+    if cpu > 1 and len(to_process) > 1:
+        with ProcessPoolExecutor(max_workers=cpu) as executor:
+            future_to_file = {executor.submit(rename_one_fasta, f): f for f in to_process}
+            for future in as_completed(future_to_file):
+                # raising if a bin could not be renamed
+                future.result()
+    else:
+        for file_path in to_process:
+            rename_one_fasta(file_path)
+
+    if manifest is not None:
+        for file_path in to_process:
+            renamed[os.path.relpath(file_path, manifest_dir)] = file_signature(file_path)
+        write_manifest(renamed, manifest)
 
 def main():
-    """ 
+    """
     Main program logic
     """
     parser = argparse.ArgumentParser(description="Rename sequences of all FASTA stored in a given folder.")
     parser.add_argument('fasta_dir', help="Folder where the FASTA files are stored.")
+    parser.add_argument('--cpu', type=int, default=1, help="Number of FASTA files renamed in parallel (default: 1)")
+    parser.add_argument('--manifest', default=None,
+                        help="TSV file keeping track of the bins already renamed, outside of the FASTA folder (default: none, "
+                             "headers are checked)")
 
     args = parser.parse_args()
 
+    if args.manifest is not None and os.path.abspath(args.manifest).startswith(os.path.abspath(args.fasta_dir) + os.sep):
+        parser.error("The manifest must be stored outside of the FASTA folder")
+
     fastas = list_fasta(args.fasta_dir)
-    rename_fasta_headers(fastas)
+    rename_fasta_headers(fastas, cpu=args.cpu, manifest=args.manifest)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
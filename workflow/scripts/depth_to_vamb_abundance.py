@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Converts the depth table of the contigs of an assembly (written by
+jgi_summarize_bam_contig_depths, also read by MetaBAT 2 and SemiBin2) into the
+abundance file VAMB takes with --rpkm, so that VAMB doesn't read the BAM again.
+
+The abundance file has the layout of the `abundance.npz` VAMB 4 saves: the depth of the
+contigs VAMB keeps (at least `-m` bp long), the names of the samples, the minimum
+identity of the reads and the hash of the names of the contigs, checked by VAMB against
+the assembly.
+"""
+
+import argparse
+import hashlib
+import numpy as np
+import pandas as pd
+
+# minimum length of the contigs binned by the pipeline (VAMB -m, 'binning: vamb: min_contig_length' in the
+# config): the abundance must only contain the contigs VAMB keeps, so both must be given the same value
+VAMB_MIN_CONTIG_LENGTH = 2000
+# default of jgi_summarize_bam_contig_depths (--percentIdentity)
+JGI_MIN_IDENTITY = 0.97
+
+def read_depth_table(path: str):
+    """
+    Returns the depth table written by jgi_summarize_bam_contig_depths
+    """
+
+    depth = pd.read_csv(path, sep="\t", dtype={'contigName': str})
+
+    missing_columns = {'contigName', 'contigLen', 'totalAvgDepth'} - set(depth.columns)
+    if missing_columns:
+        raise ValueError(f"{path} is not a depth table, missing columns: {', '.join(sorted(missing_columns))}")
+
+    return depth
+
+def hash_contig_names(contig_names):
+    """
+    Returns the MD5 hash of the contig names, as computed by VAMB to check the
+    abundance matches the assembly
+    """
+
+    hasher = hashlib.md5()
+    for contig_name in contig_names:
+        hasher.update(contig_name.encode().rstrip())
+
+    return hasher.digest()
+
+def depth_to_abundance(depth: pd.DataFrame, min_length=VAMB_MIN_CONTIG_LENGTH, min_identity=JGI_MIN_IDENTITY):
+    """
+    Returns the arrays of the VAMB abundance file: the depth of the contigs at least
+    `min_length` bp long in each sample (columns between 'totalAvgDepth' and their
+    variance), the samples names, the minimum identity and the contig names hash
+    """
+
+    kept = depth[depth['contigLen'] >= min_length]
+    # one depth column per BAM, each one followed by its variance
+    samples = [column for column in depth.columns[3:] if not column.endswith("-var")]
+
+    return {
+        'matrix': np.ascontiguousarray(kept[samples].to_numpy(dtype=np.float32)),
+        'samplenames': np.array(samples, dtype=object),
+        'minid': min_identity,
+        # stored as an object, as a bytes array would drop trailing null bytes of the hash
+        'refhash': np.array(hash_contig_names(kept['contigName']), dtype=object),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a jgi_summarize_bam_contig_depths table into a VAMB abundance file (--rpkm).")
+    parser.add_argument("--depth", help="Depth table of the contigs (jgi_summarize_bam_contig_depths --outputDepth)", required=True)
+    parser.add_argument("--min_length", type=int, default=VAMB_MIN_CONTIG_LENGTH,
+                        help=f"Minimum length of the contigs, must be the -m given to VAMB (default: {VAMB_MIN_CONTIG_LENGTH})")
+    parser.add_argument("--min_identity", type=float, default=JGI_MIN_IDENTITY,
+                        help=f"Minimum identity of the reads the depth was computed with (default: {JGI_MIN_IDENTITY})")
+    parser.add_argument("--output", help="VAMB abundance file (.npz)", required=True)
+
+    args = parser.parse_args()
+
+    abundance = depth_to_abundance(read_depth_table(args.depth), args.min_length, args.min_identity)
+    print(f"{abundance['matrix'].shape[0]} contigs of at least {args.min_length} bp, "
+          f"samples: {', '.join(abundance['samplenames'])}")
+
+    with open(args.output, 'wb') as f:
+        np.savez_compressed(f, **abundance)
+
+if __name__ == "__main__":
+    main()
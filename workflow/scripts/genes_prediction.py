@@ -5,10 +5,13 @@ Prodigal
 
 import os
 import subprocess
+import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import gzip
 import argparse
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sequence_io
+
 
 def run_prodigal(input_file, output_file, dry_run=False):
     """
@@ -32,11 +35,9 @@ def process_file(file_path, output_dir):
 
     if file_path.endswith('.gz'):
         # in the case of a gzipped FASTA file, it temporarily un-gzip it to 
-        # process it with Prodigal
+        # process it with Prodigal (streamed by blocks, never fully loaded in memory)
         temporarily_file = output_file.replace('.genes.fna', '')
-        with gzip.open(file_path, 'rb') as f_in:
-            with open(temporarily_file, 'wb') as f_out:
-                f_out.write(f_in.read())
+        sequence_io.copy_sequence_file(file_path, temporarily_file)
 
         # running Prodigal using the un-gzipped file
         run_prodigal(temporarily_file, output_file)
@@ -10,7 +10,9 @@ import pandas as pd
 import sys
 import os
 import shutil
-import gzip
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sequence_io
 
 def get_bin_filename(bins_df: pd.DataFrame):
     """
@@ -60,16 +62,15 @@ def copy_rename(bins_df: pd.DataFrame, destination_folder: str):
     for index, row in bins_df.iterrows():
         source_path = row['path']
         dest_path = os.path.join(destination_folder, row['unambiguous_filename'])
-        print(f"Copying {source_path} to {dest_path}")
-        shutil.copy(source_path, dest_path)
-        
-        # check if the file is gzipped and uncompress it
+
+        # if the file is gzipped, it is uncompressed while being copied
         if source_path.endswith('.gz'):
-            with gzip.open(dest_path, 'rb') as f_in:
-                with open(dest_path[:-3], 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            os.remove(dest_path)  # remove the .gz file after uncompressing
-            dest_path = dest_path[:-3]  # update dest_path to the uncompressed file path
+            dest_path = dest_path[:-3]
+            print(f"Copying and uncompressing {source_path} to {dest_path}")
+            sequence_io.copy_sequence_file(source_path, dest_path)
+        else:
+            print(f"Copying {source_path} to {dest_path}")
+            shutil.copy(source_path, dest_path)
 
 
 if __name__ == "__main__":
@@ -1,40 +1,60 @@
-""" 
-Script for replacing space by a period in FASTA headers generated by MEGAHIT
+"""
+Script for replacing space by a period in FASTA headers generated by MEGAHIT.
+If the output file ends with ".gz", the assembly is compressed in the same pass
+(using several threads with --threads)
 """
 
+import os
 import sys
 import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sequence_io
 
-def replace_spaces_in_fasta(input_file, output_file):
+def replace_spaces_in_fasta(input_file, output_file, threads=1):
+    """
+    Rewrites `input_file` into `output_file` with spaces in headers replaced by periods.
+    Returns a dictionary with the number of contigs ('records'), of modified headers
+    ('modified') and of bases ('bases')
+    """
     logging.info(f"Opening input file: {input_file}")
-    
-    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-        modified_headers = 0
-        total_headers = 0
-
-        for line in infile:
-            if line.startswith('>'):
-                total_headers += 1
-                if ' ' in line:
-                    modified_headers += 1
-                    logging.debug(f"Modifying header: {line.strip()}")
-                    line = line.replace(' ', '.')
-            outfile.write(line)
+
+    # only the headers are rewritten, sequences are copied by blocks
+    stats = sequence_io.rewrite_fasta_headers(input_file, output_file,
+                                              lambda header: header.replace(b' ', b'.'),
+                                              threads=threads)
+    total_headers = stats['records']
+    modified_headers = stats['modified']
 
     logging.info(f"Finished processing. Total headers: {total_headers}, Modified headers: {modified_headers}")
+    logging.info(f"Total bases: {stats['bases']}")
     logging.info(f"Output written to: {output_file}")
 
+    return stats
+
+def write_stats(stats: dict, stats_file: str):
+    """
+    Writes the number of contigs and bases of the assembly in a TSV file
+    """
+    with open(stats_file, 'w') as f:
+        f.write("contigs\tbases\n")
+        f.write(f"{stats['records']}\t{stats['bases']}\n")
+
 if __name__ == "__main__":
     # Configure logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    if len(sys.argv) != 3:
-        print("Usage: python megahit_fasta_header_rename.py <input.fasta> <output.fasta>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Replace spaces by periods in the FASTA headers of a MEGAHIT assembly.")
+    parser.add_argument("input", help="MEGAHIT assembly (FASTA, can be gzipped)")
+    parser.add_argument("output", help="Output FASTA. It is compressed if it ends with '.gz'")
+    parser.add_argument("--threads", type=int, default=1, help="Threads used to compress the output (default: 1)")
+    parser.add_argument("--stats", help="Optional TSV to save the number of contigs and bases")
 
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    args = parser.parse_args()
 
     logging.info("Starting the header replacement process.")
-    replace_spaces_in_fasta(input_file, output_file)
-    logging.info("Process completed.")
\ No newline at end of file
+    stats = replace_spaces_in_fasta(args.input, args.output, args.threads)
+    if args.stats:
+        write_stats(stats, args.stats)
+    logging.info("Process completed.")
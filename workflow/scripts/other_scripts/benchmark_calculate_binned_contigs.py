@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# A CLI to benchmark calculate_binned_contigs.py on a synthetic results folder
+# (by default one MEGAHIT assembly of 2 million contigs and its Binette bins)
+
+import os
+import sys
+import time
+import gzip
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import calculate_binned_contigs as cbc
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark calculate_binned_contigs.py on a synthetic assembly.')
+
+    parser.add_argument('--contigs', type=int, default=2_000_000, help='Number of contigs by assembly (default: 2000000)')
+    parser.add_argument('--samples', type=int, default=1, help='Number of samples (default: 1)')
+    parser.add_argument('--bins', type=int, default=500, help='Number of bins by sample (default: 500)')
+    parser.add_argument('--binned-fraction', type=float, default=0.3, help='Fraction of the contigs put in a bin (default: 0.3)')
+    parser.add_argument('--min-len', type=int, default=200, help='Minimal contig length (default: 200)')
+    parser.add_argument('--max-len', type=int, default=2000, help='Maximal contig length (default: 2000)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator (default: 42)')
+    parser.add_argument('--workdir', help='Folder where the synthetic results are written (default: a temporary folder, removed at the end)')
+
+    return parser.parse_args()
+
+def write_synthetic_sample(results_dir: str, sample: str, n_contigs: int, n_bins: int,
+                           binned_fraction: float, min_len: int, max_len: int, rng):
+    """
+    Writes a gzipped MEGAHIT-like assembly and Binette bins for `sample`.
+    Returns the number of binned contigs
+    """
+    assembly_dir = os.path.join(results_dir, "03_assembly", "megahit", sample)
+    bins_dir = os.path.join(results_dir, "07_bins_refinement", "binette", "megahit", sample, "final_bins")
+    os.makedirs(assembly_dir, exist_ok=True)
+    os.makedirs(bins_dir, exist_ok=True)
+
+    lengths = rng.integers(min_len, max_len + 1, size=n_contigs)
+    # a long random sequence in which the contigs are sliced
+    pool = bytes(rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=max_len * 2))
+
+    with gzip.open(os.path.join(assembly_dir, "assembly.fa.gz"), "wb", compresslevel=1) as f:
+        for i, length in enumerate(lengths):
+            start = i % max_len
+            f.write(b">k141_%d flag=1 multi=2.0000 len=%d\n%s\n" % (i, length, pool[start:start + length]))
+
+    # each binned contig is put in a single bin
+    binned = rng.choice(n_contigs, size=int(n_contigs * binned_fraction), replace=False)
+    for bin_id, contigs in enumerate(np.array_split(binned, n_bins)):
+        with open(os.path.join(bins_dir, f"bin_{bin_id}.fa"), "wb") as f:
+            for i in contigs:
+                f.write(b">k141_%d flag=1 multi=2.0000 len=%d\n%s\n" % (i, lengths[i], pool[:lengths[i]]))
+
+    return len(binned)
+
+def main():
+    args = parse_arguments()
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix="binned_contigs_benchmark_")
+    results_dir = os.path.join(workdir, "results")
+    rng = np.random.default_rng(args.seed)
+
+    try:
+        start = time.perf_counter()
+        binned = 0
+        for i in range(args.samples):
+            binned += write_synthetic_sample(results_dir, f"sample_{i}", args.contigs, args.bins,
+                                             args.binned_fraction, args.min_len, args.max_len, rng)
+        print(f"Synthetic results written in {time.perf_counter() - start:.1f} s "
+              f"({args.samples} x {args.contigs} contigs, {binned} binned)")
+
+        start = time.perf_counter()
+        contigs_table = cbc.compute_contigs_assignation_for_an_assembler("megahit", results_dir, "binette")
+        counting = time.perf_counter() - start
+
+        start = time.perf_counter()
+        binned_contigs_rate = cbc.calculate_binned_contigs_rate(contigs_table)
+        rate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cbc.calculate_binned_bases_stats(contigs_table)
+        cbc.calculate_binned_rate_by_length(contigs_table)
+        length_weighted = time.perf_counter() - start
+
+        # every binned contig should have been found
+        assert int(contigs_table['assigned'].sum()) == binned
+
+        print(f"Counting: {counting:.1f} s ({len(contigs_table) / counting:,.0f} contigs/s)")
+        print(f"Binned rate: {rate:.2f} s")
+        print(f"Length-weighted statistics: {length_weighted:.2f} s")
+        print(f"Contigs table memory: {contigs_table.memory_usage(deep=True).sum() / 1024 ** 2:.0f} MiB")
+        print(binned_contigs_rate.to_string(index=False))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+"""
+Script to report, for a completed run, where the wall-clock time went, from the Snakemake's
+benchmark files:
+- the critical path (the chain of jobs, each waiting for the previous one, ending with the last job),
+- the CPU efficiency of each job, rule and stage (01_qc ... 10_strain_profiling):
+  cpu_time / (s x threads), and the reserved cores left idle.
+
+A job ends when its benchmark file is written (its modification time) and starts `s` seconds before.
+The threads of each rule are evaluated from its `threads:` directive with the config of the run.
+Dependencies between rules are read from `snakemake --forceall --d3dag` if given, otherwise any earlier
+job of the same sample (or a global one) can precede a job on the critical path. The same is done for the
+rules missing from the DAG, and for the whole run if the DAG has no dependencies (without `--forceall`,
+the DAG of a completed run has no job left to run).
+"""
+
+import os
+import re
+import sys
+import json
+import html
+import argparse
+import numpy as np
+import pandas as pd
+import yaml
+
+# the benchmarks are read using parse_benchmarks.py, stored in the same folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import parse_benchmarks as pb
+# the threads of some rules are computed with the functions stored with the rules of the pipeline
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "rules"))
+import utils
+
+# jobs ending less than TOLERANCE seconds after the start of another one can precede it
+# (benchmark files are written right after the end of the job)
+TOLERANCE = 5
+
+# a rule is over-provisioned below this CPU efficiency, and may be under-provisioned above the other
+OVER_PROVISIONED = 0.5
+UNDER_PROVISIONED = 0.9
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Critical path and CPU efficiency report of a completed run, from Snakemake benchmarks.')
+
+    parser.add_argument('benchmark_dir', help='Directory containing benchmark .txt files')
+    parser.add_argument('--config', required=True, help='Config (YAML) of the run, used to know the threads of each rule')
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Number of cores of the run, used for rules with 0 threads (default: the cores of this machine)")
+    parser.add_argument('--dag', required=False, help="Jobs DAG of the run in JSON ('snakemake --forceall --d3dag > dag.json'), used to know which rules depend on which")
+    parser.add_argument('--rules_dir', default=pb.RULES_DIR, help='Folder of the rules (.smk) of the pipeline (default: the rules of the pipeline)')
+    parser.add_argument('--cpu', type=int, default=1, help='Number of processes reading the benchmark files (default: 1)')
+    parser.add_argument('--tsv_output_jobs', required=True, help='File to save the efficiency of each job, and whether it is on the critical path, in TSV format')
+    parser.add_argument('--tsv_output_rules', required=True, help='File to save the efficiency of each rule in TSV format')
+    parser.add_argument('--tsv_output_stages', required=True, help='File to save the efficiency of each stage in TSV format')
+    parser.add_argument('--html_output', required=True, help='File to save the HTML report (sortable tables and Gantt chart)')
+
+    return parser.parse_args()
+
+def read_rules_threads(rules_dir: str, config: dict, cores: int):
+    """
+    Evaluates the `threads:` directive of every rule with the `config` of the run.
+    Returns {rule: threads}. Rules without `threads:` use 1 thread, 0 stands for all the cores
+    """
+    rules_threads = {}
+    for rules_file in sorted(os.listdir(rules_dir)):
+        if not rules_file.endswith(".smk"):
+            continue
+        with open(os.path.join(rules_dir, rules_file)) as f:
+            content = f.read()
+
+        for rule, body in re.findall(r"^rule\s+(\w+)\s*:(.*?)(?=^rule\s|\Z)", content, flags=re.M | re.S):
+            rules_threads[rule] = 1
+            # the expression can be on the same line or on the next ones, until the next directive
+            found = re.search(r"^\s+threads:(.*?)(?=^\s+\w+:|\Z)", body, flags=re.M | re.S)
+            if not found:
+                continue
+            expression = " ".join(line.split("#")[0].strip() for line in found.group(1).splitlines()).strip().rstrip(",")
+            try:
+                threads = int(eval(expression, {"config": config, **vars(utils)}))
+            except Exception:
+                print(f"Could not evaluate the threads of {rule} ({expression}), 1 thread is used")
+                threads = 1
+            # like Snakemake, threads are bounded by the cores of the run
+            rules_threads[rule] = cores if threads <= 0 else min(threads, cores)
+
+    return rules_threads
+
+def read_rules_dependencies(dag_path: str):
+    """
+    Reads the jobs DAG written by `snakemake --forceall --d3dag`.
+    Returns {rule: set of the rules it depends on, directly or not}, or None if the DAG has no dependencies
+    """
+    with open(dag_path) as f:
+        dag = json.load(f)
+
+    if not dag["links"]:
+        print(f"No dependencies in {dag_path} (was it written with 'snakemake --forceall --d3dag'?), "
+              "jobs of the same sample are used instead")
+        return None
+
+    rule_of_node = {node["id"]: node["value"]["rule"] for node in dag["nodes"]}
+    upstream = {rule: set() for rule in rule_of_node.values()}
+    for link in dag["links"]:
+        upstream[rule_of_node[link["v"]]].add(rule_of_node[link["u"]])
+
+    # rules without benchmark can stand between two rules, so dependencies are followed
+    ancestors = {}
+    for rule in upstream:
+        seen, to_visit = set(), list(upstream[rule])
+        while to_visit:
+            parent = to_visit.pop()
+            if parent not in seen:
+                seen.add(parent)
+                to_visit.extend(upstream.get(parent, ()))
+        ancestors[rule] = seen
+    return ancestors
+
+def read_jobs(benchmark_dir: str, cpu: int = 1, patterns: list = None):
+    """
+    Reads the benchmarks into one line by job, with its start and end times (seconds since epoch).
+    Repeated benchmarks of a job are averaged
+    """
+    tables = pb.list_tables(benchmark_dir)
+    benchmarks = pb.concatenate_benchmarks(tables, cpu, patterns)
+
+    numeric = [c for c in ['s', 'cpu_time', 'max_rss', 'mean_load'] if c in benchmarks.columns]
+    jobs = benchmarks.groupby('path', sort=False).agg(
+        {**{c: 'mean' for c in numeric}, **{c: 'first' for c in ['rule', 'sample', 'part', 'tool']}}).reset_index()
+
+    jobs['end'] = jobs['path'].map(lambda path: os.stat(path).st_mtime)
+    jobs['start'] = jobs['end'] - jobs['s']
+    return jobs
+
+def add_efficiency(jobs: pd.DataFrame, rules_threads: dict):
+    """
+    Adds the threads, the cores used on average, the CPU efficiency and the reserved cores left idle by each job
+    """
+    jobs['rule'] = jobs['rule'].fillna(jobs['tool'])
+    jobs['threads'] = jobs['rule'].map(rules_threads).fillna(1).astype(int)
+    jobs['used_cores'] = jobs['cpu_time'] / jobs['s'].where(jobs['s'] > 0)
+    jobs['efficiency'] = jobs['used_cores'] / jobs['threads']
+    jobs['wasted_cores'] = (jobs['threads'] - jobs['used_cores']).clip(lower=0)
+    jobs['wasted_core_hours'] = jobs['wasted_cores'] * jobs['s'] / 3600
+    return jobs
+
+def compute_critical_path(jobs: pd.DataFrame, rules_dependencies: dict = None, tolerance=TOLERANCE):
+    """
+    Returns the index of the jobs on the critical path, from the first one to the last one.
+    Going backward from the last job to end, the previous job is the last one to end before
+    it starts, among the jobs it can depend on
+    """
+    if jobs.empty:
+        return []
+
+    start = jobs['start'].to_numpy()
+    end = jobs['end'].to_numpy()
+    samples = jobs['sample'].to_numpy(dtype=object)
+    rules = jobs['rule'].to_numpy(dtype=object)
+    is_global = samples == 'global'
+
+    current = int(np.argmax(end))
+    path = [current]
+    while True:
+        candidates = (end <= start[current] + tolerance) & (np.arange(len(end)) != current)
+        if not is_global[current]:
+            candidates &= (samples == samples[current]) | is_global
+        # rules missing from the DAG fall back to the jobs of the same sample
+        if rules_dependencies is not None and rules[current] in rules_dependencies:
+            candidates &= np.isin(rules, list(rules_dependencies.get(rules[current], ())))
+        candidates &= ~np.isin(np.arange(len(end)), path)
+        if not candidates.any():
+            break
+        current = int(np.flatnonzero(candidates)[np.argmax(end[candidates])])
+        path.append(current)
+
+    return jobs.index[path[::-1]].tolist()
+
+def summarize_efficiency(jobs: pd.DataFrame, by: str):
+    """
+    Sums the time, CPU time and reserved cores of the jobs by rule or by stage
+    """
+    jobs = jobs.assign(reserved_core_hours=jobs['s'] * jobs['threads'] / 3600, cpu_hours=jobs['cpu_time'] / 3600,
+                       hours=jobs['s'] / 3600)
+    summary = jobs.groupby(by, sort=True).agg(
+        jobs=('path', 'count'),
+        threads=('threads', 'max'),
+        hours=('hours', 'sum'),
+        cpu_hours=('cpu_hours', 'sum'),
+        reserved_core_hours=('reserved_core_hours', 'sum'),
+        wasted_core_hours=('wasted_core_hours', 'sum'),
+        max_rss=('max_rss', 'max'),
+        critical_path_hours=('critical_path_hours', 'sum'),
+        wall_clock_start=('start', 'min'),
+        wall_clock_end=('end', 'max'),
+    ).reset_index()
+
+    summary['efficiency'] = summary['cpu_hours'] / summary['reserved_core_hours']
+    summary['mean_used_cores'] = summary['cpu_hours'] / summary['hours']
+    summary['wall_clock_hours'] = (summary['wall_clock_end'] - summary['wall_clock_start']) / 3600
+    # reserved cores left idle, on average along the wall-clock time of the stage or rule
+    summary['mean_wasted_cores'] = summary['wasted_core_hours'] / summary['wall_clock_hours'].where(summary['wall_clock_hours'] > 0)
+    summary = summary.drop(columns=['wall_clock_start', 'wall_clock_end'])
+
+    if by == 'rule':
+        summary['provisioning'] = np.select([summary['efficiency'] < OVER_PROVISIONED, summary['efficiency'] > UNDER_PROVISIONED],
+                                            ['over-provisioned', 'under-provisioned'], 'ok')
+        summary.loc[summary['efficiency'].isna(), 'provisioning'] = 'unknown'
+    return summary.sort_values('wasted_core_hours', ascending=False, ignore_index=True)
+
+def build_report(benchmark_dir: str, config: dict, cores: int, rules_dir: str = pb.RULES_DIR,
+                 dag_path: str = None, cpu: int = 1):
+    """
+    Returns the jobs, rules and stages tables of the report
+    """
+    jobs = read_jobs(benchmark_dir, cpu, pb.read_benchmark_patterns(rules_dir))
+    jobs = add_efficiency(jobs, read_rules_threads(rules_dir, config, cores))
+
+    rules_dependencies = read_rules_dependencies(dag_path) if dag_path else None
+    critical_path = compute_critical_path(jobs, rules_dependencies)
+    jobs['critical_path'] = jobs.index.isin(critical_path)
+    jobs['critical_path_hours'] = np.where(jobs['critical_path'], jobs['s'] / 3600, 0.0)
+
+    # times relative to the start of the run
+    origin = jobs['start'].min()
+    jobs['start'] = jobs['start'] - origin
+    jobs['end'] = jobs['end'] - origin
+    jobs = jobs.sort_values('start', ignore_index=True)
+
+    return jobs, summarize_efficiency(jobs, 'rule'), summarize_efficiency(jobs, 'part')
+
+def html_table(df: pd.DataFrame, table_id: str):
+    """
+    Returns an HTML table whose columns can be sorted by clicking on their header
+    """
+    header = "".join(f"<th onclick=\"sortTable('{table_id}', {i})\">{html.escape(str(c))}</th>" for i, c in enumerate(df.columns))
+    rows = []
+    for row in df.itertuples(index=False):
+        cells = "".join(f"<td>{value:.2f}</td>" if isinstance(value, float) else f"<td>{html.escape(str(value))}</td>" for value in row)
+        rows.append(f"<tr>{cells}</tr>")
+    return f"<table id=\"{table_id}\"><thead><tr>{header}</tr></thead><tbody>{''.join(rows)}</tbody></table>"
+
+def gantt_chart(jobs: pd.DataFrame, width=1200, lane_height=14):
+    """
+    Returns an SVG Gantt chart of the run, with a lane by rule (ordered by their first job).
+    Bars are colored by stage, jobs on the critical path are outlined in red
+    """
+    lanes = jobs.groupby('rule', sort=False)['start'].min().sort_values().index.tolist()
+    lane_of_rule = {rule: i for i, rule in enumerate(lanes)}
+    stages = sorted(jobs['part'].unique())
+    colors = {stage: f"hsl({int(360 * i / max(len(stages), 1))}, 60%, 60%)" for i, stage in enumerate(stages)}
+
+    label_width = 260
+    scale = (width - label_width) / max(jobs['end'].max(), 1)
+    height = lane_height * len(lanes) + 20
+
+    elements = []
+    for rule, i in lane_of_rule.items():
+        elements.append(f"<text x=\"0\" y=\"{i * lane_height + 11}\" font-size=\"10\">{html.escape(str(rule))}</text>")
+    for job in jobs.itertuples(index=False):
+        x = label_width + job.start * scale
+        bar_width = max((job.end - job.start) * scale, 1)
+        outline = ' stroke="red" stroke-width="2"' if job.critical_path else ''
+        elements.append(f"<rect x=\"{x:.1f}\" y=\"{lane_of_rule[job.rule] * lane_height + 2}\" width=\"{bar_width:.1f}\" "
+                        f"height=\"{lane_height - 4}\" fill=\"{colors[job.part]}\"{outline}>"
+                        f"<title>{html.escape(f'{job.rule} ({job.sample}): {job.s:.0f} s, {job.threads} threads, efficiency {job.efficiency:.2f}')}</title></rect>")
+    # time axis, in hours
+    total_hours = jobs['end'].max() / 3600
+    for tick in np.linspace(0, total_hours, 6):
+        x = label_width + tick * 3600 * scale
+        elements.append(f"<text x=\"{x:.1f}\" y=\"{height - 4}\" font-size=\"10\">{tick:.1f} h</text>")
+
+    legend = " ".join(f"<span style=\"background:{color}\">&nbsp;{html.escape(stage)}&nbsp;</span>" for stage, color in colors.items())
+    return f"<p>{legend}</p><svg width=\"{width}\" height=\"{height}\">{''.join(elements)}</svg>"
+
+def write_html_report(jobs: pd.DataFrame, rules: pd.DataFrame, stages: pd.DataFrame, output: str):
+    critical = jobs[jobs['critical_path']]
+    with open(output, 'w') as f:
+        f.write("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Run report</title><style>"
+                "body{font-family:sans-serif} table{border-collapse:collapse;font-size:12px} "
+                "td,th{border:1px solid #ccc;padding:2px 6px} th{cursor:pointer;background:#eee}"
+                "</style><script>"
+                "function sortTable(id, column) {"
+                " var table = document.getElementById(id), body = table.tBodies[0];"
+                " var rows = Array.from(body.rows), ascending = table.dataset.column == column && table.dataset.order != 'asc';"
+                " rows.sort(function(a, b) {"
+                "  var x = a.cells[column].textContent, y = b.cells[column].textContent, nx = parseFloat(x), ny = parseFloat(y);"
+                "  var order = (isNaN(nx) || isNaN(ny)) ? x.localeCompare(y) : nx - ny;"
+                "  return ascending ? order : -order; });"
+                " rows.forEach(function(row) { body.appendChild(row); });"
+                " table.dataset.column = column; table.dataset.order = ascending ? 'asc' : 'desc'; }"
+                "</script></head><body>")
+        f.write(f"<h1>Run report</h1><p>Wall-clock time: {jobs['end'].max() / 3600:.2f} h, "
+                f"critical path: {len(critical)} jobs, {critical['s'].sum() / 3600:.2f} h of jobs.</p>")
+        f.write("<h2>Gantt chart</h2>")
+        f.write(gantt_chart(jobs))
+        f.write("<h2>Stages</h2>")
+        f.write(html_table(stages, "stages"))
+        f.write("<h2>Rules</h2>")
+        f.write(html_table(rules, "rules"))
+        f.write("<h2>Critical path</h2>")
+        f.write(html_table(critical[['rule', 'sample', 'part', 'threads', 's', 'start', 'end', 'efficiency']], "critical_path"))
+        f.write("</body></html>")
+
+def main():
+    args = parse_arguments()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+
+    jobs, rules, stages = build_report(args.benchmark_dir, config, args.cores, args.rules_dir, args.dag, args.cpu)
+
+    jobs.to_csv(args.tsv_output_jobs, sep='\t', index=False)
+    rules.to_csv(args.tsv_output_rules, sep='\t', index=False)
+    stages.to_csv(args.tsv_output_stages, sep='\t', index=False)
+    write_html_report(jobs, rules, stages, args.html_output)
+
+    print(f"Report saved to {args.html_output}")
+
+if __name__ == '__main__':
+    main()
@@ -2,29 +2,72 @@
 
 # A CLI to compute the number of binned and not binned assemblies' contigs produced by the pipeline
 
-import pyfastx
 import os
+import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-def parse_arguments():
-    parser = argparse.ArgumentParser(description='Count assembly contigs assigned to a bin.')
+# the shared sequence I/O helpers are stored in workflow/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import sequence_io
+import contigs_membership
+from deduplicate_contigs_name import get_prefix
 
-    parser.add_argument('--assembler', required=True, choices=['megahit', 'metaflye', 
-                                                               'hybridspades', 'metaspades'], 
-                        help='The assembly we should use')
-    parser.add_argument('--results-dir', required=True, help="Folder storing the pipeline results. Typically named 'results': /path/to/pipeline/results")
-    parser.add_argument('--type', required=True, choices=['binette', 'dereplicated_and_filtered'], help='Type of bins')
-    parser.add_argument('--tsv_output_binned_contigs', required=True, help='File to save the list of contigs and their number of assignation in bins in TSV format')
-    parser.add_argument('--tsv_output_binned_rate', required=True, help='File to save the binning rate of contigs in TSV format')
+# where the assemblies are stored in the results folder, by assembler
+ASSEMBLIES_SUBDIR = {
+    "megahit": "megahit",
+    "metaflye": os.path.join("LR", "metaflye"),
+    "hybridspades": "hybridspades",
+    "metaspades": "metaspades",
+}
 
-    return parser.parse_args()
+# quality tiers of the bins (MIMAG-like thresholds), a contig gets the best tier of the
+# bins it was assigned to
+QUALITY_TIERS = ["unbinned", "unknown", "low", "medium", "high"]
 
-def read_fasta(assembly_path: str):
-    return pyfastx.Fasta(assembly_path, full_name=True)
+# upper bounds (excluded) of the contigs length classes, the last class has no upper bound
+LENGTH_BUCKETS = [1000, 2500, 5000, 10000, 50000]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Count assembly contigs assigned to a bin.')
 
-def prepare_contigs_table(assembly: pyfastx.Fasta):
+    parser.add_argument('--assembler', required=True, nargs='+', choices=list(ASSEMBLIES_SUBDIR),
+                        help='The assemblies we should use (several can be given)')
+    parser.add_argument('--results-dir', required=True, help="Folder storing the pipeline results. Typically named 'results': /path/to/pipeline/results")
+    parser.add_argument('--type', required=True, nargs='+', choices=['binette', 'dereplicated_and_filtered'], help='Types of bins (both can be given)')
+    parser.add_argument('--ani', help="ANI threshold of the dereplicated bins to use (required with '--type dereplicated_and_filtered')")
+    parser.add_argument('--cpu', type=int, default=1, help='Number of samples processed in parallel (default: 1)')
+    parser.add_argument('--tsv_output_binned_contigs', required=True, help="File to save the list of contigs and their number of assignation in bins in TSV format. "
+                                                                           "With several assemblers or types, it must contain '{assembler}' and/or '{type}'")
+    parser.add_argument('--tsv_output_binned_rate', required=True, help="File to save the binning rate of contigs in TSV format. "
+                                                                        "With several assemblers or types, it must contain '{assembler}' and/or '{type}'")
+
+    parser.add_argument('--tsv_output_binned_bases', help="Optional file to save, by sample, the binned bases, the binned N50 and the binned bases by bin quality tier in TSV format. "
+                                                          "With several assemblers or types, it must contain '{assembler}' and/or '{type}'")
+    parser.add_argument('--tsv_output_binned_by_length', help="Optional file to save the binning rates by contigs length class in TSV format. "
+                                                              "With several assemblers or types, it must contain '{assembler}' and/or '{type}'")
+
+    args = parser.parse_args()
+
+    if 'dereplicated_and_filtered' in args.type and args.ani is None:
+        parser.error("--ani is required with '--type dereplicated_and_filtered'")
+
+    # one output file by (assembler, type) couple
+    for output in [args.tsv_output_binned_contigs, args.tsv_output_binned_rate,
+                   args.tsv_output_binned_bases, args.tsv_output_binned_by_length]:
+        if output is None:
+            continue
+        if len(args.assembler) > 1 and '{assembler}' not in output:
+            parser.error(f"'{{assembler}}' is missing from {output} while several assemblers are given")
+        if len(args.type) > 1 and '{type}' not in output:
+            parser.error(f"'{{type}}' is missing from {output} while several types are given")
+
+    return args
+
+def prepare_contigs_table(assembly_path: str):
     """
     Returns a pandas Dataframe with assembly contigs in rows and a column 
     that will be used to count binned contigs
@@ -33,37 +76,86 @@ def prepare_contigs_table(assembly: pyfastx.Fasta):
     a bin
     """
 
-    # initializing an empty list to hold the contigs name
+    # initializing empty lists to hold the contigs name and length
     contigs_name = []
+    contigs_len = []
 
-    # iterating over the FASTA sequence to retrieve the contigs name
-    for seq in assembly:
-        seq_name = seq.name
-        contigs_name.append({'contig': seq_name, 'assigned': 0, 
-                             'len': len(seq.seq)})
+    # iterating over the FASTA headers to retrieve the contigs name and length
+    # (sequences are only counted, never decoded)
+    for header, length in sequence_io.iter_fasta_lengths(assembly_path):
+        contigs_name.append(header.decode())
+        contigs_len.append(length)
 
-    # Convert the list of dictionaries to a pandas DataFrame
-    contigs_table = pd.DataFrame(contigs_name).sort_values(by="contig")
+    contigs_table = pd.DataFrame({'contig': contigs_name,
+                                  'assigned': np.zeros(len(contigs_name), dtype=np.int32),
+                                  'len': contigs_len}).sort_values(by="contig")
 
     return contigs_table
 
-def compute_contigs_in_bins(bin_path: str, contigs_table: pd.DataFrame):
+def index_contigs(contigs_table: pd.DataFrame):
+    """
+    Returns a dictionary {contig: row position in `contigs_table`}, so a binned
+    contig is found in constant time instead of by scanning the whole table
     """
-    Extracts the contigs assigned to the bins and fill the contigs table 
-    according to it
+    return {contig: position for position, contig in enumerate(contigs_table['contig'])}
+
+def compute_contigs_in_bins(bin_path: str, contigs_index: dict, counts: np.ndarray,
+                            strip_prefix: bool = False, tiers: np.ndarray = None, tier: int = 1):
     """
+    Extracts the contigs assigned to the bin and adds 1 to their counter in `counts`
+    (one counter per row of the contigs table, see `index_contigs`)
 
-    bin = read_fasta(bin_path)
+    If `tiers` is given, the quality tier of the contigs (index in `QUALITY_TIERS`) is raised
+    to the `tier` of the bin
+
+    With `strip_prefix`, the bin name added to the headers by `deduplicate_contigs_name.py`
+    is removed to retrieve the contig name of the assembly
+    """
 
-    # for each contig of the bin, it adds 1 to the 'assigned' colum corresponding
-    # to the contig
-    for seq in bin:
-        if seq.name in contigs_table['contig'].values:
-            contigs_table.loc[contigs_table['contig'] == seq.name, 'assigned'] += 1
+    prefix = get_prefix(bin_path).encode() if strip_prefix else b""
+
+    positions = []
+    for header in sequence_io.iter_fasta_headers(bin_path):
+        if prefix and header.startswith(prefix):
+            header = header[len(prefix):]
+        contig_name = header.decode()
+        position = contigs_index.get(contig_name)
+        if position is not None:
+            positions.append(position)
         else:
-            print(f'Contig {seq.name} was not found in the contigs table')
+            print(f'Contig {contig_name} was not found in the contigs table')
             print('Please check that this contig pertains to the assembly')
 
+    # unlike `counts[positions] += 1`, np.add.at counts repeated positions
+    positions = np.asarray(positions, dtype=np.intp)
+    np.add.at(counts, positions, 1)
+    if tiers is not None:
+        np.maximum.at(tiers, positions, tier)
+
+    return counts
+
+def count_contigs_in_bins(bin_files: list, contigs_table: pd.DataFrame, strip_prefix: bool = False,
+                          bins_quality: dict = None):
+    """
+    Fills the `assigned` column of the contigs table with the number of bins of
+    `bin_files` each contig was found in, and the `quality_tier` column with the
+    best quality tier of these bins (`bins_quality` links bins filename to their tier)
+    """
+
+    # the table is indexed once for all the bins of the sample
+    contigs_index = index_contigs(contigs_table)
+    counts = contigs_table['assigned'].to_numpy(dtype=np.int32, copy=True)
+    tiers = np.zeros(len(contigs_table), dtype=np.int8)
+    unknown = QUALITY_TIERS.index("unknown")
+
+    # calculating contigs assignation
+    for bin_path in bin_files:
+        tier = bins_quality.get(os.path.basename(bin_path), unknown) if bins_quality else unknown
+        counts = compute_contigs_in_bins(bin_path, contigs_index, counts, strip_prefix, tiers, tier)
+
+    contigs_table['assigned'] = counts
+    contigs_table['quality_tier'] = pd.Categorical.from_codes(tiers, categories=QUALITY_TIERS, ordered=True)
+
     return contigs_table
 
 def compute_contigs_for_all_bins(bins_directory: str, contigs_table: pd.DataFrame):
@@ -75,75 +167,200 @@ def compute_contigs_for_all_bins(bins_directory: str, contigs_table: pd.DataFram
     # listing all .fa files in bins_directory (= all bins)
     bin_files = [os.path.join(bins_directory, f) for f in os.listdir(bins_directory) if f.endswith('.fa')]
 
-    # calculating contigs assignation
-    for bin_path in tqdm(bin_files, desc="Processing bins"):
-        contigs_table = compute_contigs_in_bins(bin_path, contigs_table)
+    return count_contigs_in_bins(bin_files, contigs_table)
 
-        # deleting the index file generated by pyfastx
-        index_file_path = bin_path + '.fxi'
-        if os.path.exists(index_file_path):
-            os.remove(index_file_path)
+def get_quality_tier(completeness: float, contamination: float):
+    """
+    Returns the quality tier (index in `QUALITY_TIERS`) of a bin
+    """
+    if completeness > 90 and contamination < 5:
+        return QUALITY_TIERS.index("high")
+    if completeness >= 50 and contamination < 10:
+        return QUALITY_TIERS.index("medium")
+    return QUALITY_TIERS.index("low")
+
+def read_bins_quality(quality_report: str, name_column: str, completeness_column: str,
+                      contamination_column: str, filename_template: str):
+    """
+    Returns a dictionary {bin filename: quality tier} from a quality report, or an empty
+    dictionary if the report does not exist
+    """
+    if not os.path.exists(quality_report):
+        print(f"No quality report found at {quality_report}, bins quality will be unknown")
+        return {}
 
-    return contigs_table
+    report = pd.read_csv(quality_report, sep="\t")
+    return {filename_template.format(name): get_quality_tier(completeness, contamination)
+            for name, completeness, contamination in zip(report[name_column], report[completeness_column],
+                                                         report[contamination_column])}
+
+def read_binette_bins_quality(results_dir: str, assembler: str, sample: str):
+    """
+    Returns the quality tier of the bins refined by Binette for a sample
+    """
+    return read_bins_quality(os.path.join(results_dir, "07_bins_refinement", "binette", assembler, sample,
+                                          "final_bins_quality_reports.tsv"),
+                             "bin_id", "completeness", "contamination", "bin_{}.fa")
+
+def read_dereplicated_bins_quality(results_dir: str, assembler: str, ani: str):
+    """
+    Returns the quality tier of the dereplicated bins, estimated by CheckM2 in the pipeline
+    """
+    return read_bins_quality(os.path.join(results_dir, "08_bins_postprocessing", "dereplicated_genomes_filtered_by_quality",
+                                          str(ani), assembler, "checkm2", "quality_report.tsv"),
+                             "Name", "Completeness", "Contamination", "{}.fa")
+
+def list_dereplicated_bins_by_sample(results_dir: str, assembler: str, ani: str):
+    """
+    Returns a dictionary {sample: [dereplicated bins path]}. Dereplicated bins are stored
+    together for all samples, their sample is read from the contigs membership index
+    """
+
+    bins_folder = os.path.join(results_dir, "08_bins_postprocessing", "dereplicated_genomes_filtered_by_quality",
+                               str(ani), assembler, "bins")
+    if not os.path.exists(bins_folder):
+        print(f"No bins folder found at {bins_folder}")
+        return {}
+
+    index = os.path.join(results_dir, "08_bins_postprocessing", "contigs_membership", str(ani), f"{assembler}.sqlite")
+    conn = contigs_membership.open_index(index)
+    bins_samples = contigs_membership.bins_samples(conn, assembler)
+    conn.close()
+
+    bins_by_sample = {}
+    unindexed_bins = []
+    for bin_file in sorted(os.listdir(bins_folder)):
+        if not bin_file.endswith('.fa'):
+            continue
+        if bin_file not in bins_samples:
+            unindexed_bins.append(bin_file)
+            continue
+        bins_by_sample.setdefault(bins_samples[bin_file], []).append(os.path.join(bins_folder, bin_file))
+
+    # their contigs can't be attributed to a sample, the index is older than the bins
+    if unindexed_bins:
+        raise ValueError(f"Dereplicated bins not found in the contigs membership index {index}: "
+                         f"{', '.join(unindexed_bins)}")
+
+    return bins_by_sample
+
+def compute_contigs_assignation_for_a_sample(assembly_path: str, sample: str, bins: dict,
+                                             bins_quality: dict = None):
+    """
+    Reads the contigs of an assembly once and counts their assignation for each type of bins.
+    `bins` is a dictionary {type: list of bins path, or None if there is no bins} and
+    `bins_quality` a dictionary {type: {bin filename: quality tier}}.
+
+    Returns a dictionary {type: contigs table}
+    """
+
+    # preparing the contigs table
+    contigs_table = prepare_contigs_table(assembly_path)
+
+    # adding a column with the sample id, it will be useful when we will concatenate
+    # the dataframes
+    contigs_table['sample'] = sample
+
+    tables = {}
+    for method_of_production, bin_files in bins.items():
+        if bin_files is None:
+            continue
+        tables[method_of_production] = count_contigs_in_bins(
+            bin_files, contigs_table.copy(),
+            # dereplicated bins contigs are prefixed with the bin name
+            strip_prefix=method_of_production == "dereplicated_and_filtered",
+            bins_quality=(bins_quality or {}).get(method_of_production))
+
+    return tables
+
+def _compute_contigs_assignation_for_a_sample(task: tuple):
+    return compute_contigs_assignation_for_a_sample(*task)
+
+def compute_contigs_assignation(results_dir: str, assemblers: list, methods_of_production: list,
+                                ani: str = None, cpu: int = 1):
+    """
+    Computes the contigs assignation of every sample for several assemblers and types of bins,
+    processing `cpu` samples in parallel. Each assembly is read only once, whatever the number
+    of types of bins. Nothing is written in `results_dir`.
+
+    Returns a dictionary {(assembler, type): contigs table of all samples}
+    """
+
+    tasks = []
+    for assembler in assemblers:
+        assemblies_dir = os.path.join(results_dir, "03_assembly", ASSEMBLIES_SUBDIR[assembler])
+        if not os.path.exists(assemblies_dir):
+            print(f"No assemblies folder found at {assemblies_dir}")
+            continue
+
+        if "dereplicated_and_filtered" in methods_of_production:
+            dereplicated_bins = list_dereplicated_bins_by_sample(results_dir, assembler, ani)
+            dereplicated_bins_quality = read_dereplicated_bins_quality(results_dir, assembler, ani)
+
+        # iterating over each sample in the assemblies_dir
+        for sample in os.listdir(assemblies_dir):
+            assembly_path = os.path.join(assemblies_dir, sample, "assembly.fa.gz")
+
+            # checking if the assembly file exists
+            if not os.path.exists(assembly_path):
+                print(f'No assembly found for sample {sample}')
+                continue
+
+            # defining the bins of the sample based on the type
+            bins = {}
+            bins_quality = {}
+            for method_of_production in methods_of_production:
+                if method_of_production == "binette":
+                    bins_folder = os.path.join(results_dir, "07_bins_refinement", "binette", assembler, sample, "final_bins")
+                    if os.path.exists(bins_folder):
+                        bins[method_of_production] = [os.path.join(bins_folder, f) for f in os.listdir(bins_folder)
+                                                      if f.endswith('.fa')]
+                        bins_quality[method_of_production] = read_binette_bins_quality(results_dir, assembler, sample)
+                    else:
+                        print(f"No bins folder found at {bins_folder}")
+                        bins[method_of_production] = None
+                elif method_of_production == "dereplicated_and_filtered":
+                    bins[method_of_production] = dereplicated_bins.get(sample, [])
+                    bins_quality[method_of_production] = dereplicated_bins_quality
+
+            tasks.append((assembler, (assembly_path, sample, bins, bins_quality)))
+
+    # storing the results of each (assembler, type) in a list, samples are kept in order
+    contigs_table_lists = {}
+    if cpu > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=cpu) as executor:
+            results = executor.map(_compute_contigs_assignation_for_a_sample, [task for _, task in tasks])
+            results = list(tqdm(results, total=len(tasks), desc="Processing samples"))
+    else:
+        results = [compute_contigs_assignation_for_a_sample(*task)
+                   for _, task in tqdm(tasks, desc="Processing samples")]
+
+    for (assembler, _), tables in zip(tasks, results):
+        for method_of_production, contigs_table in tables.items():
+            contigs_table_lists.setdefault((assembler, method_of_production), []).append(contigs_table)
+
+    contigs_tables = {}
+    for key, contigs_table_list in contigs_table_lists.items():
+        contigs_table = pd.concat(contigs_table_list, ignore_index=True)
+        # the sample name is repeated for every contig, it is stored only once per sample
+        contigs_table['sample'] = contigs_table['sample'].astype('category')
+        contigs_tables[key] = contigs_table
+
+    return contigs_tables
 
 def compute_contigs_assignation_for_an_assembler(assembler: str, results_dir: str,
-                                                 method_of_production: str):
+                                                 method_of_production: str, ani: str = None):
     
     """
     `method_of_production`: "binette" or "dereplicated_and_filtered".
     It is used to guess where are the produced bins stored (after refinement
     for "binette" and after dereplication and filtration based on bin quality for 
-    "dereplicated_and_filtered")
+    "dereplicated_and_filtered", in which case `ani` is needed)
     """
-    
-    assemblies_dir = os.path.join(results_dir, "03_assembly")
-    
-    if assembler == "metaflye":
-        assemblies_dir = os.path.join(assemblies_dir, "LR", "metaflye")
-    elif assembler == "hybridspades":
-        assemblies_dir = os.path.join(assemblies_dir, "hybridspades")
-    elif assembler == "megahit":
-        assemblies_dir = os.path.join(assemblies_dir, "megahit")
-    elif assembler == "metaspades":
-        assemblies_dir = os.path.join(assemblies_dir, "metaspades")
-
-    # storing the results in a list
-    contigs_table_list = []
-
-    # iterating over each sample in the assemblies_dir
-    for sample in os.listdir(assemblies_dir):
-        sample_dir = os.path.join(assemblies_dir, sample)
-        assembly_path = os.path.join(sample_dir, "assembly.fa.gz")
-        
-        # checking if the assembly file exists
-        if os.path.exists(assembly_path):
-            # reading the assembly
-            assembly = read_fasta(assembly_path)
-
-            # preparing the contigs table
-            contigs_table = prepare_contigs_table(assembly)
-
-            # adding a column with the sample id, it will be useful when we will concatenate
-            # the dataframes
-            contigs_table['sample'] = sample
-
-            # defining the bins folder path based on the type
-            if method_of_production == "binette":
-                bins_folder = os.path.join(results_dir, "07_bins_refinement", "binette", assembler, sample, "final_bins") 
-            elif method_of_production == "dereplicated_and_filtered":
-                bins_folder = os.path.join(results_dir, "08_bins_postprocessing", "dereplicated_genomes_filtered_by_quality", assembler, "bins")
-
-            # computing contigs assignation calculation
-            if os.path.exists(bins_folder):
-                contigs_table = compute_contigs_for_all_bins(bins_folder, contigs_table)
-
-                contigs_table_list.append(contigs_table)
-            else:
-                print(f"No bins folder found at {bins_folder}")
-        else:
-            print(f'No assembly found for sample {sample}')
 
-    return pd.concat(contigs_table_list, ignore_index=True)
+    contigs_tables = compute_contigs_assignation(results_dir, [assembler], [method_of_production], ani)
+
+    return contigs_tables[(assembler, method_of_production)]
 
 
 def calculate_binned_contigs_rate(contigs_table: pd.DataFrame):
@@ -151,26 +368,156 @@ def calculate_binned_contigs_rate(contigs_table: pd.DataFrame):
     Calculates the percentage of binned contigs by sample
     """
 
-    # Group by sample and calculate the rate of assigned contigs
-    binned_contigs_rate = contigs_table.groupby('sample').apply(lambda df: (100 * (df['assigned'] > 0).sum() / len(df))).reset_index()
-
-    # Rename columns for clarity
-    binned_contigs_rate.columns = ['sample', 'binned_rate']
+    # counting binned and total contigs by sample in one vectorized groupby
+    grouped = (contigs_table['assigned'] > 0).groupby(contigs_table['sample'], observed=True)
+    binned = grouped.sum()
+    binned_contigs_rate = pd.DataFrame({'sample': binned.index.astype(str),
+                                        'binned_rate': (100 * binned / grouped.size()).to_numpy()})
 
     return binned_contigs_rate
 
+def get_length_classes(length_buckets: list = LENGTH_BUCKETS):
+    """
+    Returns the labels of the contigs length classes
+    """
+    bounds = [0] + list(length_buckets)
+    return ([f"<{length_buckets[0]}"]
+            + [f"{low}-{high}" for low, high in zip(bounds[1:], bounds[2:])]
+            + [f">={length_buckets[-1]}"])
+
+def compute_n50(lengths: np.ndarray, groups: np.ndarray, n_groups: int):
+    """
+    Returns the N50 of the contigs of each group (0 for a group without contigs),
+    without looping over the groups
+    """
+    n50 = np.zeros(n_groups, dtype=np.int64)
+    if len(lengths) == 0:
+        return n50
+
+    # contigs sorted by group, then from the longest to the shortest
+    order = np.lexsort((-lengths, groups))
+    sorted_lengths = lengths[order]
+    sorted_groups = groups[order]
+
+    totals = np.bincount(groups, weights=lengths, minlength=n_groups).astype(np.int64)
+    before_group = np.concatenate(([0], np.cumsum(totals)[:-1]))
+    cumulated = np.cumsum(sorted_lengths) - before_group[sorted_groups]
+
+    # the N50 is the length of the first contig reaching half of the group length
+    reached = np.flatnonzero(2 * cumulated >= totals[sorted_groups])
+    reached_groups, first = np.unique(sorted_groups[reached], return_index=True)
+    n50[reached_groups] = sorted_lengths[reached[first]]
+
+    return n50
+
+def count_binning_by_sample_length_and_tier(contigs_table: pd.DataFrame, length_buckets: list = LENGTH_BUCKETS):
+    """
+    Returns the number of contigs and of bases of the contigs table in two arrays of shape
+    (samples, length classes, quality tiers), computed with a single bincount each
+    """
+    samples = contigs_table['sample'].cat.codes.to_numpy(dtype=np.int64)
+    n_samples = len(contigs_table['sample'].cat.categories)
+    lengths = contigs_table['len'].to_numpy(dtype=np.int64)
+    buckets = np.searchsorted(length_buckets, lengths, side='right')
+    tiers = contigs_table['quality_tier'].cat.codes.to_numpy(dtype=np.int64)
+
+    shape = (n_samples, len(length_buckets) + 1, len(QUALITY_TIERS))
+    flat_index = np.ravel_multi_index((samples, buckets, tiers), shape)
+    size = int(np.prod(shape))
+
+    contigs = np.bincount(flat_index, minlength=size).reshape(shape)
+    bases = np.bincount(flat_index, weights=lengths, minlength=size).astype(np.int64).reshape(shape)
+
+    return contigs, bases
+
+def _rate(binned: np.ndarray, total: np.ndarray):
+    # NaN (empty cell in the TSV) when there is nothing to bin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, 100 * binned / total, np.nan)
+
+def calculate_binned_bases_stats(contigs_table: pd.DataFrame):
+    """
+    Calculates, by sample, the number and the percentage of binned bases, the N50 of the
+    assembly and of the binned contigs, and the binned bases by bin quality tier
+    """
+    contigs, bases = count_binning_by_sample_length_and_tier(contigs_table)
+
+    # summing over the length classes, the first tier being the unbinned contigs
+    contigs_by_tier = contigs.sum(axis=1)
+    bases_by_tier = bases.sum(axis=1)
+
+    samples = contigs_table['sample'].cat.codes.to_numpy(dtype=np.int64)
+    lengths = contigs_table['len'].to_numpy(dtype=np.int64)
+    binned = contigs_table['assigned'].to_numpy() > 0
+    n_samples = len(contigs_table['sample'].cat.categories)
+
+    stats = pd.DataFrame({
+        'sample': contigs_table['sample'].cat.categories.astype(str),
+        'contigs': contigs_by_tier.sum(axis=1),
+        'binned_contigs': contigs_by_tier[:, 1:].sum(axis=1),
+        'bases': bases_by_tier.sum(axis=1),
+        'binned_bases': bases_by_tier[:, 1:].sum(axis=1),
+    })
+    stats['binned_bases_rate'] = _rate(stats['binned_bases'].to_numpy(), stats['bases'].to_numpy())
+    stats['n50'] = compute_n50(lengths, samples, n_samples)
+    stats['binned_n50'] = compute_n50(lengths[binned], samples[binned], n_samples)
+    for i, tier in enumerate(QUALITY_TIERS[1:], start=1):
+        stats[f'binned_bases_{tier}'] = bases_by_tier[:, i]
+
+    return stats
+
+def calculate_binned_rate_by_length(contigs_table: pd.DataFrame, length_buckets: list = LENGTH_BUCKETS):
+    """
+    Calculates, by sample and contigs length class, the percentage of binned contigs and
+    bases, and the binned bases by bin quality tier
+    """
+    contigs, bases = count_binning_by_sample_length_and_tier(contigs_table, length_buckets)
+    n_samples, n_classes, _ = contigs.shape
+
+    # one row by (sample, length class)
+    contigs = contigs.reshape(n_samples * n_classes, -1)
+    bases = bases.reshape(n_samples * n_classes, -1)
+
+    by_length = pd.DataFrame({
+        'sample': np.repeat(contigs_table['sample'].cat.categories.astype(str), n_classes),
+        'length_class': np.tile(get_length_classes(length_buckets), n_samples),
+        'contigs': contigs.sum(axis=1),
+        'binned_contigs': contigs[:, 1:].sum(axis=1),
+        'bases': bases.sum(axis=1),
+        'binned_bases': bases[:, 1:].sum(axis=1),
+    })
+    by_length['binned_rate'] = _rate(by_length['binned_contigs'].to_numpy(), by_length['contigs'].to_numpy())
+    by_length['binned_bases_rate'] = _rate(by_length['binned_bases'].to_numpy(), by_length['bases'].to_numpy())
+    for i, tier in enumerate(QUALITY_TIERS[1:], start=1):
+        by_length[f'binned_bases_{tier}'] = bases[:, i]
+
+    return by_length
+
 
 def main():
     args = parse_arguments()
 
-    results = compute_contigs_assignation_for_an_assembler(args.assembler,
-                                                           args.results_dir,
-                                                           args.type)
-    binned_contigs_rate = calculate_binned_contigs_rate(results)
-    
-    # exporting the results
-    results.to_csv(args.tsv_output_binned_contigs, index=False, sep="\t")
-    binned_contigs_rate.to_csv(args.tsv_output_binned_rate, index=False, sep="\t")
+    contigs_tables = compute_contigs_assignation(args.results_dir, args.assembler, args.type,
+                                                 args.ani, args.cpu)
+
+    for (assembler, method_of_production), results in contigs_tables.items():
+        binned_contigs_rate = calculate_binned_contigs_rate(results)
+
+        # exporting the results
+        results.to_csv(args.tsv_output_binned_contigs.format(assembler=assembler, type=method_of_production),
+                       columns=['contig', 'assigned', 'len', 'sample'], index=False, sep="\t")
+        binned_contigs_rate.to_csv(args.tsv_output_binned_rate.format(assembler=assembler, type=method_of_production),
+                                   index=False, sep="\t")
+
+        # length-weighted statistics, computed from the same contigs table
+        if args.tsv_output_binned_bases:
+            calculate_binned_bases_stats(results).to_csv(
+                args.tsv_output_binned_bases.format(assembler=assembler, type=method_of_production),
+                index=False, sep="\t")
+        if args.tsv_output_binned_by_length:
+            calculate_binned_rate_by_length(results).to_csv(
+                args.tsv_output_binned_by_length.format(assembler=assembler, type=method_of_production),
+                index=False, sep="\t")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
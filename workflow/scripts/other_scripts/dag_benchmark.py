@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the construction of the DAG of the pipeline for large cohorts.
+
+For each number of samples, a synthetic samples table is generated (empty FASTQ files, small
+and long reads for each sample), and `snakemake -n` is timed with each mode of wildcard
+constraints of the samples (`sample_constraints` in the config). The job table printed by the
+dry-run is compared between modes: it must not depend on the mode.
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+import subprocess
+import re
+import pandas as pd
+import yaml
+
+MODES = ['enumerate', 'trie', 'pattern']
+SIZES = [100, 1000, 10000]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Time `snakemake -n` for synthetic samples tables of increasing size.')
+
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='Numbers of samples (default: 100 1000 10000)')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES, help='Modes of sample wildcard constraints to compare (default: all)')
+    parser.add_argument('--config', default='config/template_config.yaml', help='Config the runs are based on (default: config/template_config.yaml)')
+    parser.add_argument('--snakefile', default='workflow/Snakefile', help='Snakefile of the pipeline (default: workflow/Snakefile)')
+    parser.add_argument('--short_reads_only', action='store_true', help='Generate samples without long reads (the config must not use long-read or hybrid assemblers)')
+    parser.add_argument('--output_dir', default='dag_benchmark', help='Folder where samples tables, configs and results are saved (default: dag_benchmark)')
+    parser.add_argument('--snakemake_args', default='', help="Other arguments given to Snakemake, e.g. '--use-conda'")
+
+    return parser.parse_args()
+
+def write_samples_table(n_samples: int, output_dir: str, long_reads=True):
+    """
+    Writes a samples table of `n_samples` synthetic samples, whose FASTQ are empty files,
+    and returns its path
+    """
+    fastq_dir = os.path.join(output_dir, "fastq")
+    os.makedirs(fastq_dir, exist_ok=True)
+
+    rows = []
+    for i in range(n_samples):
+        sample_id = f"SYN{i:06d}"
+        files = [(f"{sample_id}_1.fastq.gz", "R1"), (f"{sample_id}_2.fastq.gz", "R2")]
+        if long_reads:
+            files.append((f"{sample_id}_long_1.fastq.gz", "long"))
+        for file_name, read_type in files:
+            path = os.path.join(fastq_dir, file_name)
+            if not os.path.exists(path):
+                open(path, 'w').close()
+            rows.append((path, sample_id, read_type))
+
+    table_path = os.path.join(output_dir, f"samples_{n_samples}.tsv")
+    pd.DataFrame(rows, columns=['sample', 'sample_id', 'type']).to_csv(table_path, sep='\t', index=False)
+    return table_path
+
+def write_config(base_config: dict, samples_table: str, mode: str, output: str):
+    config = copy.deepcopy(base_config)
+    config['samples'] = samples_table
+    config['sample_constraints'] = mode
+
+    with open(output, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+def parse_job_table(output: str):
+    """
+    Returns the job table (count of jobs by rule) printed by a Snakemake dry-run
+    """
+    jobs = {}
+    in_table = False
+
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("job") and "count" in line:
+            in_table = True
+            continue
+        if not in_table:
+            continue
+        if line.startswith("total"):
+            break
+        parts = re.split(r'\s{2,}', line)
+        if len(parts) == 2 and parts[1].isdigit():
+            jobs[parts[0]] = int(parts[1])
+
+    return jobs
+
+def time_dry_run(snakefile: str, config_path: str, snakemake_args: str):
+    """
+    Runs `snakemake -n` and returns its wall-clock time (in seconds) and its job table
+    """
+    cmd = ['snakemake', '-n', '--cores', '1', '-s', snakefile, '--configfile', config_path] + snakemake_args.split()
+    print(" ".join(cmd))
+
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+
+    if result.returncode != 0:
+        sys.exit(f"Snakemake failed:\n{result.stderr}\n{result.stdout}")
+    return seconds, parse_job_table(result.stdout)
+
+def main():
+    args = parse_arguments()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    with open(args.config) as f:
+        base_config = yaml.safe_load(f)
+
+    results = []
+    for n_samples in args.sizes:
+        samples_table = write_samples_table(n_samples, args.output_dir, not args.short_reads_only)
+
+        reference_jobs = None
+        for mode in args.modes:
+            config_path = os.path.join(args.output_dir, f"config_{n_samples}_{mode}.yaml")
+            write_config(base_config, samples_table, mode, config_path)
+
+            seconds, jobs = time_dry_run(args.snakefile, config_path, args.snakemake_args)
+            # the first mode is the reference the job tables are compared to
+            if reference_jobs is None:
+                reference_jobs = jobs
+            results.append({'samples': n_samples, 'mode': mode, 'seconds': seconds, 'jobs': sum(jobs.values()),
+                            'same_jobs': jobs == reference_jobs})
+
+    results = pd.DataFrame(results)
+    results.to_csv(os.path.join(args.output_dir, "dag_benchmark.tsv"), sep='\t', index=False)
+    print(results.to_string(index=False))
+
+    if not results['same_jobs'].all():
+        sys.exit("The job tables differ between modes of sample constraints")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,35 @@
 """
 Script to produce a unique TSV made of the results of the Snakemake's
 benchmark directive
+
+Benchmark files are matched against the benchmark patterns of the rules (read from
+workflow/rules/*.smk) to know their rule and sample. They can be read in parallel, and
+a cache (Parquet or Feather, requires pyarrow) keeps the files already read, so that only
+new or modified files are read on the next run.
 """
 
 import argparse
 import os
 import re
+import sys
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+# folder where the rules of the pipeline are stored
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "rules")
+
+# columns of the benchmark files kept as text (the others are numbers)
+TEXT_COLUMNS = {"h:m:s"}
+
+# wildcards holding the sample name in benchmark patterns
+SAMPLE_WILDCARDS = ["sample", "sample_lr"]
+
+# columns identifying a job when comparing two runs, and the metrics compared (higher is worse)
+JOB_COLUMNS = ['rule', 'part', 'tool', 'sample']
+COMPARED_METRICS = ['s', 'max_rss', 'io_in', 'io_out']
+
 def get_sample_name_from_path(path: str):
     """
     Extracts the sample name from the benchmark file path.
@@ -28,6 +50,97 @@ def get_sample_name_from_path(path: str):
     sample_name = basename.split('.')[0]  # Extract part before the first dot
     return sample_name
 
+def read_benchmark_patterns(rules_dir: str = RULES_DIR):
+    """
+    Reads the benchmark patterns of every rule stored in `rules_dir`.
+    Returns a list of (rule, compiled regex), the regex having a named group by wildcard.
+    Patterns with the longest fixed part come first, so that the most specific pattern
+    is matched first (e.g. '{sample}.rename.benchmark.txt' before '{sample}.benchmark.txt')
+    """
+    patterns = []
+    for rules_file in sorted(os.listdir(rules_dir)):
+        if not rules_file.endswith(".smk"):
+            continue
+        rule = None
+        with open(os.path.join(rules_dir, rules_file)) as f:
+            for line in f:
+                rule_match = re.match(r"^\s*rule\s+(\w+)\s*:", line)
+                if rule_match:
+                    rule = rule_match.group(1)
+                    continue
+                for pattern in re.findall(r"[\"'](benchmarks/[^\"']+)[\"']", line):
+                    patterns.append((rule, pattern))
+
+    compiled = []
+    for rule, pattern in patterns:
+        compiled.append((len(re.sub(r"\{[^}]*\}", "", pattern)), rule, wildcard_pattern_to_regex(pattern)))
+    compiled.sort(key=lambda item: -item[0])
+    return [(rule, regex) for _, rule, regex in compiled]
+
+def wildcard_pattern_to_regex(pattern: str):
+    """
+    Converts a Snakemake pattern ('benchmarks/03_assembly/megahit/{sample}.benchmark.txt')
+    into a regex matching the end of a path, with a named group by wildcard
+    """
+    regex = ""
+    seen = set()
+    for literal, wildcard in re.findall(r"([^{]*)(?:\{([^}]*)\})?", pattern):
+        regex += re.escape(literal)
+        if wildcard:
+            # a wildcard found twice in a pattern must have the same value
+            wildcard = wildcard.split(",")[0].strip()
+            regex += f"(?P={wildcard})" if wildcard in seen else f"(?P<{wildcard}>[^/]+)"
+            seen.add(wildcard)
+    return re.compile(r"(?:^|/)" + regex + "$")
+
+def match_benchmark_path(path: str, patterns: list):
+    """
+    Returns the rule and the wildcards of the first pattern matching `path`,
+    or (None, {}) if no pattern matches
+    """
+    path = path.replace(os.sep, "/")
+    for rule, regex in patterns:
+        found = regex.search(path)
+        if found:
+            return rule, found.groupdict()
+    return None, {}
+
+def get_sample_name(path: str, wildcards: dict, rule: str):
+    """
+    Returns the sample of a benchmark file from the wildcards of its rule pattern ('global' if the
+    pattern has no sample). Paths matching no rule fall back to `get_sample_name_from_path`
+    """
+    if rule is None:
+        return get_sample_name_from_path(path)
+    for wildcard in SAMPLE_WILDCARDS:
+        if wildcard in wildcards:
+            return wildcards[wildcard]
+    return 'global'
+
+def parse_value(column: str, value: str):
+    if column in TEXT_COLUMNS:
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+def parse_benchmark_file(path: str):
+    """
+    Minimal parser of a benchmark file (a TSV with a header and one line by repeat).
+    Returns the header and the parsed lines
+    """
+    with open(path) as f:
+        header = tuple(f.readline().rstrip("\n").split("\t"))
+        rows = []
+        for line in f:
+            if line.strip():
+                rows.append([parse_value(column, value) for column, value in zip(header, line.rstrip("\n").split("\t"))])
+    return header, rows
+
+def parse_benchmark_files(paths: list):
+    return [parse_benchmark_file(path) for path in paths]
+
 def list_tables(path: str):
     """
     Finds all benchmark tables in the given folder.
@@ -66,47 +179,253 @@ def extract_part_and_tool(path: str):
     
     return part, tool
 
-def concatenate_benchmarks(list_tables: list):
+def concatenate_benchmarks(list_tables: list, cpu: int = 1, patterns: list = None):
     """
     Produce a single DataFrame by concatenating all benchmark tables.
-    Adds columns for sample name, directory, part, and tool.
+    Adds columns for sample name, directory, part, tool and rule.
+    Files are read by `cpu` processes
     """
-    all_dataframes = []
+    if patterns is None:
+        patterns = read_benchmark_patterns()
+
+    # reading the files, by chunks when several processes are used
+    if cpu > 1 and len(list_tables) > 1:
+        chunk_size = max(1, math.ceil(len(list_tables) / (cpu * 4)))
+        chunks = [list_tables[i:i + chunk_size] for i in range(0, len(list_tables), chunk_size)]
+        with ProcessPoolExecutor(max_workers=cpu) as executor:
+            parsed = [table for tables in executor.map(parse_benchmark_files, chunks) for table in tables]
+    else:
+        parsed = parse_benchmark_files(list_tables)
 
-    for table_path in list_tables:
-        sample_name = get_sample_name_from_path(table_path)
+    # grouping the lines of files sharing the same header
+    rows_by_header = {}
+    for table_path, (header, rows) in zip(list_tables, parsed):
+        rule, wildcards = match_benchmark_path(table_path, patterns)
+        sample_name = get_sample_name(table_path, wildcards, rule)
         part, tool = extract_part_and_tool(table_path)
-        
-        # loading the benchmark file into a DataFrame
-        df = pd.read_csv(table_path, sep='\t')  # Assuming the benchmark files are TSV
 
-        # adding columns for the sample, path, part, and tool
-        df['sample'] = sample_name
-        df['path'] = table_path
-        df['part'] = part
-        df['tool'] = tool
+        # adding columns for the sample, path, part, tool and rule
+        for row in rows:
+            rows_by_header.setdefault(header, []).append(row + [sample_name, table_path, part, tool, rule])
 
-        all_dataframes.append(df)
+    all_dataframes = [pd.DataFrame(rows, columns=list(header) + ['sample', 'path', 'part', 'tool', 'rule'])
+                      for header, rows in rows_by_header.items()]
 
     # concatenating all the DataFrames into one
+    if not all_dataframes:
+        return pd.DataFrame(columns=['sample', 'path', 'part', 'tool', 'rule'])
     final_df = pd.concat(all_dataframes, ignore_index=True)
-    
-    return final_df
+
+    # benchmark columns first, as in the benchmark files
+    columns = [c for c in final_df.columns if c not in ('sample', 'path', 'part', 'tool', 'rule')]
+    return final_df[columns + ['sample', 'path', 'part', 'tool', 'rule']]
+
+def read_cache(cache_path: str):
+    """
+    Reads the benchmarks already ingested (Parquet or Feather, according to the extension)
+    """
+    if not os.path.exists(cache_path):
+        return None
+    if cache_path.endswith(".feather"):
+        return pd.read_feather(cache_path)
+    return pd.read_parquet(cache_path)
+
+def write_cache(df: pd.DataFrame, cache_path: str):
+    """
+    Atomically writes the ingested benchmarks (Parquet or Feather, according to the extension)
+    """
+    tmp_path = f"{cache_path}.tmp"
+    if cache_path.endswith(".feather"):
+        df.reset_index(drop=True).to_feather(tmp_path)
+    else:
+        df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+def split_cached_tables(list_tables: list, cached_df: pd.DataFrame):
+    """
+    Compares the benchmark files with the ones already ingested (by path and modification time).
+    Returns the cached lines still valid, the files to read and their modification times
+    """
+    mtimes = {table_path: os.stat(table_path).st_mtime_ns for table_path in list_tables}
+    if cached_df is None or cached_df.empty:
+        return None, list_tables, mtimes
+
+    # lines of files that were removed or modified since are dropped
+    valid = cached_df['path'].map(mtimes).eq(cached_df['mtime_ns'])
+    cached_df = cached_df[valid]
+    known = set(cached_df['path'])
+    return cached_df, [t for t in list_tables if t not in known], mtimes
+
+def concatenate_benchmarks_incrementally(list_tables: list, cache_path: str, cpu: int = 1, patterns: list = None):
+    """
+    Same as `concatenate_benchmarks`, only reading files that are new or modified since the
+    last run. The cache is updated with them
+    """
+    cached_df, to_read, mtimes = split_cached_tables(list_tables, read_cache(cache_path))
+    print(f"{len(list_tables) - len(to_read)} benchmark files already ingested, {len(to_read)} to read")
+
+    new_df = concatenate_benchmarks(to_read, cpu, patterns)
+    new_df['mtime_ns'] = new_df['path'].map(mtimes).astype('int64')
+
+    final_df = new_df if cached_df is None else pd.concat([cached_df, new_df], ignore_index=True)
+    write_cache(final_df, cache_path)
+
+    return final_df.drop(columns=['mtime_ns'])
+
+def load_benchmarks(path: str, cpu: int = 1, patterns: list = None):
+    """
+    Loads the benchmarks of a run: a benchmarks folder, a TSV produced by this script,
+    or a cache (.parquet or .feather)
+    """
+    if os.path.isdir(path):
+        benchmarks = concatenate_benchmarks(list_tables(path), cpu, patterns)
+    elif path.endswith((".parquet", ".feather")):
+        benchmarks = read_cache(path).drop(columns=['mtime_ns'], errors='ignore')
+    else:
+        benchmarks = pd.read_csv(path, sep='\t')
+
+    # benchmarks matching no rule (or older TSVs) are identified by their part and tool
+    if 'rule' not in benchmarks.columns:
+        benchmarks['rule'] = None
+    benchmarks['rule'] = benchmarks['rule'].fillna(benchmarks['part'] + "/" + benchmarks['tool'])
+    return benchmarks
+
+def summarize_jobs(benchmarks: pd.DataFrame, metrics: list):
+    """
+    Returns, for each job and metric, the mean, variance and number of its runs (repeats)
+    """
+    values = benchmarks[JOB_COLUMNS + metrics].copy()
+    values[metrics] = values[metrics].apply(pd.to_numeric, errors='coerce')
+    grouped = values.groupby(JOB_COLUMNS)[metrics]
+    return pd.concat({'mean': grouped.mean(), 'var': grouped.var(), 'n': grouped.count()}, axis=1)
+
+def compare_rule_metric(baseline: pd.DataFrame, candidate: pd.DataFrame):
+    """
+    Compares a metric of the jobs of a rule found in both runs (DataFrames with 'mean', 'var' and 'n'
+    by job, aligned). Returns the totals of both runs and the z-score of the difference.
+
+    The noise is estimated from the repeats of the jobs (jobs without repeats get the relative
+    variance of the other jobs). Without any repeat, it is estimated from the dispersion of the
+    ratios between the jobs of both runs (at least 2 jobs). Otherwise, the z-score is unknown (NaN)
+    """
+    baseline_total, candidate_total = baseline['mean'].sum(), candidate['mean'].sum()
+    delta = candidate_total - baseline_total
+
+    repeated = (baseline['n'] >= 2) & (candidate['n'] >= 2)
+    if repeated.any():
+        # squared coefficients of variation of the repeated jobs, used for the others
+        cv2_baseline = (baseline.loc[repeated, 'var'] / baseline.loc[repeated, 'mean'] ** 2).replace(np.inf, np.nan).mean()
+        cv2_candidate = (candidate.loc[repeated, 'var'] / candidate.loc[repeated, 'mean'] ** 2).replace(np.inf, np.nan).mean()
+        var_baseline = baseline['var'].where(repeated, cv2_baseline * baseline['mean'] ** 2).fillna(0)
+        var_candidate = candidate['var'].where(repeated, cv2_candidate * candidate['mean'] ** 2).fillna(0)
+        noise = math.sqrt((var_baseline / baseline['n'].clip(lower=1) + var_candidate / candidate['n'].clip(lower=1)).sum())
+    elif len(baseline) >= 2:
+        ratios = (candidate['mean'] / baseline['mean']).replace(np.inf, np.nan).dropna()
+        noise = ratios.std() / math.sqrt(len(ratios)) * baseline_total if len(ratios) >= 2 else math.nan
+    else:
+        noise = math.nan
+
+    if noise == 0:
+        z = 0.0 if delta == 0 else math.copysign(math.inf, delta)
+    else:
+        z = delta / noise
+    return baseline_total, candidate_total, z
+
+def compare_benchmarks(baseline: pd.DataFrame, candidate: pd.DataFrame, metrics: list = COMPARED_METRICS,
+                       threshold=0.1, z_threshold=2.0, min_baseline=1.0):
+    """
+    Aligns the jobs of two runs (by rule, part, tool and sample) and compares the metrics of each rule.
+    A metric of a rule regressed when it increased by more than `threshold` (relative) and the increase is
+    above the noise (z-score >= `z_threshold`, or the noise is unknown). Rules whose baseline total is
+    below `min_baseline` (seconds or MB) are too small to be compared
+    """
+    metrics = [m for m in metrics if m in baseline.columns and m in candidate.columns]
+    baseline_jobs, candidate_jobs = summarize_jobs(baseline, metrics), summarize_jobs(candidate, metrics)
+    common = baseline_jobs.index.intersection(candidate_jobs.index)
+
+    results = []
+    for rule in sorted(common.get_level_values('rule').unique()):
+        rule_jobs = common[common.get_level_values('rule') == rule]
+        for metric in metrics:
+            rule_baseline = baseline_jobs.loc[rule_jobs, [('mean', metric), ('var', metric), ('n', metric)]].droplevel(1, axis=1)
+            rule_candidate = candidate_jobs.loc[rule_jobs, [('mean', metric), ('var', metric), ('n', metric)]].droplevel(1, axis=1)
+            # jobs with the metric in both runs
+            known = rule_baseline['mean'].notna() & rule_candidate['mean'].notna()
+            if not known.any():
+                continue
+            baseline_total, candidate_total, z = compare_rule_metric(rule_baseline[known], rule_candidate[known])
+            relative_delta = (candidate_total - baseline_total) / baseline_total if baseline_total > 0 else math.nan
+            results.append({'rule': rule, 'metric': metric, 'jobs': int(known.sum()),
+                            'repeats': int(min(rule_baseline.loc[known, 'n'].min(), rule_candidate.loc[known, 'n'].min())),
+                            'baseline': baseline_total, 'candidate': candidate_total,
+                            'delta': candidate_total - baseline_total, 'relative_delta': relative_delta, 'z_score': z})
+
+    comparison = pd.DataFrame(results, columns=['rule', 'metric', 'jobs', 'repeats', 'baseline', 'candidate',
+                                                'delta', 'relative_delta', 'z_score'])
+    comparison['significant'] = comparison['z_score'].abs() >= z_threshold
+    comparison['regression'] = (comparison['baseline'] >= min_baseline) & (comparison['relative_delta'] > threshold) \
+        & (comparison['significant'] | comparison['z_score'].isna())
+    return comparison
+
+def main_compare(argv: list):
+    """
+    CLI logic of `parse_benchmarks.py compare ...`
+    """
+    parser = argparse.ArgumentParser(prog="parse_benchmarks.py compare",
+                                     description="Compare the benchmarks of two runs by rule, and exit with an error if a rule regressed")
+    parser.add_argument("baseline", help="Benchmarks of the reference run: a benchmarks folder, a TSV produced by this script or a cache (.parquet, .feather)")
+    parser.add_argument("candidate", help="Benchmarks of the run to check, in the same formats")
+    parser.add_argument("--tsv_output", help="File to save the comparison of each rule and metric in TSV format")
+    parser.add_argument("--metrics", nargs='+', default=COMPARED_METRICS, help="Metrics to compare, higher being worse (default: s max_rss io_in io_out)")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative increase of a metric considered as a regression (default: 0.1)")
+    parser.add_argument("--z_threshold", type=float, default=2.0, help="Increase, in standard deviations of the noise estimated from the repeats, needed for a regression (default: 2.0)")
+    parser.add_argument("--min_baseline", type=float, default=1.0, help="Rules whose metric is below this value in the baseline (seconds or MB) are never regressions (default: 1.0)")
+    parser.add_argument("--cpu", type=int, default=1, help="Number of processes reading the benchmark files (default: 1)")
+    parser.add_argument("--rules_dir", default=RULES_DIR, help="Folder of the rules (.smk) whose benchmark patterns are used to parse the paths (default: the rules of the pipeline)")
+    args = parser.parse_args(argv)
+
+    patterns = read_benchmark_patterns(args.rules_dir)
+    baseline = load_benchmarks(args.baseline, args.cpu, patterns)
+    candidate = load_benchmarks(args.candidate, args.cpu, patterns)
+
+    comparison = compare_benchmarks(baseline, candidate, args.metrics, args.threshold, args.z_threshold, args.min_baseline)
+    if args.tsv_output:
+        comparison.to_csv(args.tsv_output, sep='\t', index=False)
+
+    regressions = comparison[comparison['regression']]
+    print(f"{comparison['rule'].nunique()} rules compared, {len(regressions)} regressions")
+    if not regressions.empty:
+        print(regressions[['rule', 'metric', 'baseline', 'candidate', 'relative_delta', 'z_score']].to_string(index=False))
+        return 1
+    return 0
 
 def main():
     """ 
     CLI logic
     """
-    parser = argparse.ArgumentParser(description="Concatenate Snakemake benchmark results into a single TSV")
+    # comparing two runs: parse_benchmarks.py compare BASELINE CANDIDATE ...
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        sys.exit(main_compare(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description="Concatenate Snakemake benchmark results into a single TSV "
+                                                 "(use 'parse_benchmarks.py compare -h' to compare two runs)")
     parser.add_argument("benchmark_dir", help="Directory containing benchmark .txt files")
     parser.add_argument("output_tsv", help="Output file to save the concatenated TSV")
+    parser.add_argument("--cpu", type=int, default=1, help="Number of processes reading the benchmark files (default: 1)")
+    parser.add_argument("--cache", help="Parquet (.parquet) or Feather (.feather) file keeping the benchmarks already read, "
+                                        "so that only new or modified files are read (requires pyarrow)")
+    parser.add_argument("--rules_dir", default=RULES_DIR, help="Folder of the rules (.smk) whose benchmark patterns are used to parse the paths (default: the rules of the pipeline)")
     args = parser.parse_args()
 
     # getting list of all benchmark files
     tables = list_tables(args.benchmark_dir)
+    patterns = read_benchmark_patterns(args.rules_dir)
 
     # concatenating the benchmarks into a single DataFrame
-    final_df = concatenate_benchmarks(tables)
+    if args.cache:
+        final_df = concatenate_benchmarks_incrementally(tables, args.cache, args.cpu, patterns)
+    else:
+        final_df = concatenate_benchmarks(tables, args.cpu, patterns)
 
     # saving the final DataFrame as a TSV file
     final_df.to_csv(args.output_tsv, sep='\t', index=False)
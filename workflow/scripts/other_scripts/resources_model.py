@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Script to learn, from the benchmarks of previous runs (the TSV produced by parse_benchmarks.py),
+a model of the resources used by each rule:
+- mem_mb from the maximal resident memory ('max_rss'),
+- runtime (minutes) from the wall-clock time ('s'),
+- disk_mb from the written data ('io_out'),
+as a function of the size of the FASTQ of the sample.
+
+For each rule, the model is a line covering every observed job (fitted by least squares,
+then raised so that no job is above it) increased by a safety margin. Rules run once for
+all samples, or observed on too few input sizes, get a constant (the maximal observed value).
+
+The YAML written is read by the rules of the pipeline (`resources: model` in the config).
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import yaml
+
+# the functions reading the model are stored with the rules of the pipeline
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "rules"))
+from utils import read_samples_input_size, MODELED_RESOURCES
+
+# benchmark column and conversion factor of each modeled resource
+BENCHMARK_METRICS = {'mem_mb': ('max_rss', 1), 'runtime': ('s', 1 / 60), 'disk_mb': ('io_out', 1)}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Learn a per-rule resources model from Snakemake benchmarks.')
+
+    parser.add_argument('benchmarks_tsv', help='TSV produced by parse_benchmarks.py')
+    parser.add_argument('output', help='Where to save the resources model (YAML)')
+    parser.add_argument('--samples', required=True, help='Samples table of the pipeline (the one given in the config), used to get the size of the FASTQ of each sample')
+    parser.add_argument('--margin', type=float, default=1.2, help='Factor applied to the model, as a safety margin (default: 1.2)')
+    parser.add_argument('--min_sizes', type=int, default=3, help='Minimal number of distinct input sizes to fit a line, otherwise the maximal value is used (default: 3)')
+
+    return parser.parse_args()
+
+def fit_envelope(input_sizes: np.ndarray, values: np.ndarray, margin=1.2, min_sizes=3):
+    """
+    Fits `values` against `input_sizes` (GB) with a line covering every point, multiplied by `margin`.
+    Returns the coefficients {'intercept', 'slope'} (slope by GB)
+    """
+    known = ~np.isnan(values)
+    input_sizes, values = input_sizes[known], values[known]
+    if len(values) == 0:
+        return None
+
+    slope = 0.0
+    if len(np.unique(input_sizes)) >= min_sizes:
+        # a resource is not expected to decrease with the input size
+        slope = max(float(np.polyfit(input_sizes, values, 1)[0]), 0.0)
+    # raising the line to have every job below it
+    intercept = max(float(np.max(values - slope * input_sizes)), 0.0)
+
+    return {'intercept': round(intercept * margin, 3), 'slope': round(slope * margin, 3)}
+
+def fit_resources_model(benchmarks: pd.DataFrame, samples_input_size: dict, margin=1.2, min_sizes=3):
+    """
+    Fits the model of each resource, for each rule found in the benchmarks.
+    Returns {rule: {'jobs': number of jobs, resource: coefficients}}
+    """
+    # benchmarks of older versions of the pipeline are not linked to a rule
+    benchmarks = benchmarks[benchmarks['rule'].notna()]
+
+    model = {}
+    for rule, rule_benchmarks in benchmarks.groupby('rule', sort=True):
+        input_sizes = rule_benchmarks['sample'].map(samples_input_size)
+        if input_sizes.notna().any():
+            rule_benchmarks = rule_benchmarks[input_sizes.notna()]
+            input_sizes = input_sizes[input_sizes.notna()].to_numpy(dtype=float) / 1e9
+        else:
+            # the rule does not depend on a sample: a constant is fitted
+            input_sizes = np.zeros(len(rule_benchmarks))
+
+        model[rule] = {'jobs': len(rule_benchmarks)}
+        for resource in MODELED_RESOURCES:
+            column, factor = BENCHMARK_METRICS[resource]
+            values = pd.to_numeric(rule_benchmarks[column], errors='coerce').to_numpy(dtype=float) * factor
+            coefficients = fit_envelope(input_sizes, values, margin, min_sizes)
+            if coefficients is not None:
+                model[rule][resource] = coefficients
+
+    return model
+
+def write_resources_model(model: dict, output: str, margin: float):
+    with open(output, 'w') as f:
+        f.write("# written by resources_model.py: resource = intercept + slope * (size of the FASTQ of the sample, in GB)\n")
+        yaml.safe_dump({'margin': margin, 'rules': model}, f, sort_keys=False)
+
+def main():
+    args = parse_arguments()
+
+    benchmarks = pd.read_csv(args.benchmarks_tsv, sep='\t')
+    if 'rule' not in benchmarks.columns:
+        raise ValueError(f"No 'rule' column in {args.benchmarks_tsv}, please produce it with the current parse_benchmarks.py")
+
+    samples_input_size = read_samples_input_size(args.samples)
+    model = fit_resources_model(benchmarks, samples_input_size, args.margin, args.min_sizes)
+    write_resources_model(model, args.output, args.margin)
+
+    print(f"Resources model of {len(model)} rules saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
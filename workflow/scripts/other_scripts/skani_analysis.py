@@ -5,13 +5,41 @@ import os
 import json
 import shutil
 import subprocess
-import re
+import sys
+import hashlib
+import tempfile
+import functools
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from collections import namedtuple
 from tqdm import tqdm
 from venn import venn
 
+# the shared pipeline helpers are stored in workflow/scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from contigs_membership import parse_refined_bin_path
+
+# sparse Skani results: the pairs of bins (indexes in `bin_names`) with their ANI.
+# Every bin is paired with itself (ANI of 100) so that bins similar to no other one are kept
+SkaniEdges = namedtuple("SkaniEdges", ["bin_names", "bin_1", "bin_2", "ani"])
+
+# header of the TSV storing sparse Skani results
+SKANI_EDGES_COLUMNS = ["bin_1", "bin_2", "ani"]
+
+# Skani preset used for every comparison, sketches included: the ANI of sketches depends on
+# the options they were built with, whatever the options given to `skani dist`
+SKANI_SKETCH_OPTIONS = ['--medium']
+
+# files of the persistent sketch store used by `compare --sketch_store`:
+# the hash of each bin (by path, size and modification time), the sketches (named by hash),
+# the bins already compared against all the others, and their pairs of similar bins (by hash).
+# Sketches, compared bins and pairs are stored in a subfolder named after the sketch options
+SKETCH_STORE_HASHES = "bins_hashes.tsv"
+SKETCH_STORE_SKETCHES = "sketches"
+SKETCH_STORE_COMPARED = "compared_bins.txt"
+SKETCH_STORE_EDGES = "edges.tsv"
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Perform Skani analysis on bins.\nRetrieves info related to bins recovered from one assembly approach.')
     subparsers = parser.add_subparsers(dest = 'subparser')
@@ -26,10 +54,14 @@ def parse_arguments():
     compare_parser.add_argument('--tmp', required=True, help='Temporary directory for intermediate files')
     compare_parser.add_argument('--output_file', required=True, help='File to save the output results (Skani matrix)')
     compare_parser.add_argument('--tsv_output', required=True, help='File to save the Skani matrix in TSV format')
+    compare_parser.add_argument('--matrix_cache', required=False, help="Binary (memory-mapped) copy of the Skani matrix, that 'cluster' can open instead of the TSV (default: TSV_OUTPUT with a '.npy' extension)")
     compare_parser.add_argument('--ani_threshold', type=float, required=True, default=99.9, help="Minimal ANI to consider two bins as the same (default: 99.9)")
     compare_parser.add_argument('--json_output', required=True, help='File to save the bins similarity results according to assembly methods (JSON)')
     compare_parser.add_argument('--venn_diagram', required=True, help='Where to save the Venn diagram')
     compare_parser.add_argument('--cpu', type=int, required=True, help='Number of CPU cores to use')
+    compare_parser.add_argument('--debug', action='store_true', help='Print every pair of bins found with an identity above ANI_THRESHOLD')
+    compare_parser.add_argument('--sparse', action='store_true', help="Only keep the pairs of similar bins (Skani sparse output) instead of the full matrix. TSV_OUTPUT is then a list of pairs (bin_1, bin_2, ani), that 'cluster' can read too")
+    compare_parser.add_argument('--sketch_store', required=False, help="Persistent folder of Skani sketches and pairs of similar bins, kept between runs: only the bins never seen before are sketched and compared against all the others. Implies '--sparse'")
 
     # checking results
     check_parser = subparsers.add_parser('check', help="Recovering the taxonomical annotation and quality of bins obtained from only one assembly approach or from a given assembly")
@@ -44,6 +76,7 @@ def parse_arguments():
     clusters_parser = subparsers.add_parser('cluster', help="Recovering the groups of bins that share a certain identity threshold")
 
     clusters_parser.add_argument('--tsv_results', required=True, help='Path to matrix (TSV) produced using "skani_analysis.py compare"')
+    clusters_parser.add_argument('--matrix_cache', required=False, help="Binary copy of the matrix produced using 'skani_analysis.py compare', used instead of the TSV when up to date (default: TSV_RESULTS with a '.npy' extension)")
     clusters_parser.add_argument('--quality', action='store_true', help='Retrieve the CheckM2 metrics for the bins')
     clusters_parser.add_argument('--threshold', type=int, required=True, default=97,
                                  help='Minimal identity to consider two bins as being in the same cluster (default: 97)')
@@ -52,151 +85,553 @@ def parse_arguments():
 
     return parser.parse_args()
 
-def symlink_bins(src_dir, tmp_dir):
+def list_refined_bins(src_dir):
     """
-    Create symbolic links for bin files from a source directory to a temporary directory.
-    This function scans through the source directory, identifies bin files with the '.fa' extension
-    within the 'final_bins' subdirectories of each sample, and creates symbolic links to these bin files
-    in the temporary directory. It also generates a 'list_bins.txt' file in the temporary directory
-    containing the paths to all the created symbolic links.
+    Lists the bin files with the '.fa' extension within the 'final_bins' subdirectories of each sample.
+    Returns a dictionary {new bin name: absolute path}, bins being renamed '{assembly}.{sample}.{bin}'
     """
-    if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
-    
-    list_bins = []
-
-    print("Creating symlinks for bins files")
+    bins = {}
     for assembly in os.listdir(src_dir):
         assembly_dir = os.path.join(src_dir, assembly)
-        print(f"Creating symlinks for bins from {assembly} assembly (progress bar displays samples)")
+        print(f"Listing bins from {assembly} assembly (progress bar displays samples)")
         if os.path.isdir(assembly_dir):
             for sample in tqdm(os.listdir(assembly_dir)):
                 sample_dir = os.path.join(assembly_dir, sample, 'final_bins')
                 if os.path.exists(sample_dir):
                     for bin_file in os.listdir(sample_dir):
                         if bin_file.endswith('.fa'):
-                            src_bin = os.path.join(sample_dir, bin_file)
-                            src_bin = os.path.abspath(src_bin)
-                            new_bin_name = f"{assembly}.{sample}.{bin_file}"
-                            dst_bin = os.path.join(tmp_dir, new_bin_name)
-                            os.symlink(src_bin, dst_bin)
-                            list_bins.append(dst_bin)
-    
-    print("Creating the list_bins.txt file")
-    list_bins_path = os.path.join(tmp_dir, 'list_bins.txt')
-    with open(list_bins_path, 'w') as f:
-        for bin_path in list_bins:
-            f.write(bin_path + '\n')
-    
-    return list_bins_path
+                            src_bin = os.path.abspath(os.path.join(sample_dir, bin_file))
+                            bins[f"{assembly}.{sample}.{bin_file}"] = src_bin
+    return bins
 
-def symlink_bins_dereplicated(src_dir, tmp_dir):
+def list_dereplicated_bins(src_dir):
     """
-    Symlinks and renames dereplicated bin files from source directory to a temporary directory.
-    This function scans through the source directory for assemblies, finds the bin files within each assembly,
-    creates symbolic links to these bin files in the temporary directory with a new naming convention, and 
-    generates a list of these new paths in a text file.
+    Lists the dereplicated bin files of each assembly.
+    Returns a dictionary {new bin name: absolute path}, bins being renamed '{assembly}.{bin}'
     """
-    if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
-    
-    list_bins = []
-
-    print("Symlinking and renaming dereplicated bins files")
+    bins = {}
     for assembly in os.listdir(src_dir):
         assembly_dir = os.path.join(src_dir, assembly, 'bins')
         if os.path.exists(assembly_dir):
-            print(f"Symlinking and renaming bins from {assembly} assembly")
+            print(f"Listing bins from {assembly} assembly")
             for bin_file in tqdm(os.listdir(assembly_dir)):
                 if bin_file.endswith('.fa'):
-                    src_bin = os.path.join(assembly_dir, bin_file)
-                    src_bin = os.path.abspath(src_bin)
-                    new_bin_name = f"{assembly}.{bin_file}"
-                    dst_bin = os.path.join(tmp_dir, new_bin_name)
-                    os.symlink(src_bin, dst_bin)
-                    list_bins.append(dst_bin)
-    
-    print("Creating the list_bins.txt file")
-    list_bins_path = os.path.join(tmp_dir, 'list_bins.txt')
+                    src_bin = os.path.abspath(os.path.join(assembly_dir, bin_file))
+                    bins[f"{assembly}.{bin_file}"] = src_bin
+    return bins
+
+def symlink_bins_list(bins, tmp_dir, list_name='list_bins.txt'):
+    """
+    Creates in `tmp_dir` a symbolic link named after each key of `bins` ({name: path}) and
+    a file listing the paths to all the created symbolic links. Returns the path of this list
+    """
+    if not os.path.exists(tmp_dir):
+        os.makedirs(tmp_dir)
+
+    list_bins = []
+    for new_bin_name, src_bin in bins.items():
+        dst_bin = os.path.join(tmp_dir, new_bin_name)
+        os.symlink(src_bin, dst_bin)
+        list_bins.append(dst_bin)
+
+    print(f"Creating the {list_name} file")
+    list_bins_path = os.path.join(tmp_dir, list_name)
     with open(list_bins_path, 'w') as f:
         for bin_path in list_bins:
             f.write(bin_path + '\n')
 
     return list_bins_path
 
-def run_skani(list_bins_path, output_file, cpu):
+def symlink_bins(src_dir, tmp_dir):
+    """
+    Create symbolic links for bin files from a source directory to a temporary directory.
+    This function scans through the source directory, identifies bin files with the '.fa' extension
+    within the 'final_bins' subdirectories of each sample, and creates symbolic links to these bin files
+    in the temporary directory. It also generates a 'list_bins.txt' file in the temporary directory
+    containing the paths to all the created symbolic links.
+    """
+    print("Creating symlinks for bins files")
+    return symlink_bins_list(list_refined_bins(src_dir), tmp_dir)
+
+def symlink_bins_dereplicated(src_dir, tmp_dir):
+    """
+    Symlinks and renames dereplicated bin files from source directory to a temporary directory.
+    This function scans through the source directory for assemblies, finds the bin files within each assembly,
+    creates symbolic links to these bin files in the temporary directory with a new naming convention, and 
+    generates a list of these new paths in a text file.
+    """
+    print("Symlinking and renaming dereplicated bins files")
+    return symlink_bins_list(list_dereplicated_bins(src_dir), tmp_dir)
+
+def run_skani(list_bins_path, output_file, cpu, sparse=False):
     print("Running Skani analysis")
-    cmd = ['skani', 'triangle', '--medium', '-t', str(cpu), '-l', list_bins_path, '-o', output_file, '--full-matrix']
+    cmd = ['skani', 'triangle', *SKANI_SKETCH_OPTIONS, '-t', str(cpu), '-l', list_bins_path, '-o', output_file]
+    # the sparse output only lists the pairs of similar bins, instead of a N x N matrix
+    cmd.append('--sparse' if sparse else '--full-matrix')
     subprocess.run(cmd, check=True)
 
-def read_phylip_lower_triangular(filepath):
+def read_skani_sparse(filepath, list_bins_path):
+    """
+    Reads the sparse output of `skani triangle --sparse` into `SkaniEdges`. The bins are the
+    ones listed in `list_bins_path` (bins without any similar bin are absent from Skani output)
+    """
+    with open(list_bins_path) as f:
+        bin_names = [os.path.basename(line.strip()) for line in f if line.strip()]
+    bins_index = {bin_name: i for i, bin_name in enumerate(bin_names)}
+
+    pairs = pd.read_csv(filepath, sep="\t", usecols=["Ref_file", "Query_file", "ANI"],
+                        dtype={"Ref_file": str, "Query_file": str, "ANI": np.float32})
+    bin_1 = pairs["Ref_file"].map(lambda path: bins_index[os.path.basename(path)]).to_numpy(dtype=np.int32)
+    bin_2 = pairs["Query_file"].map(lambda path: bins_index[os.path.basename(path)]).to_numpy(dtype=np.int32)
+
+    # adding the pair of each bin with itself
+    diagonal = np.arange(len(bin_names), dtype=np.int32)
+    return SkaniEdges(bin_names,
+                      np.concatenate([diagonal, bin_1]),
+                      np.concatenate([diagonal, bin_2]),
+                      np.concatenate([np.full(len(bin_names), 100, dtype=np.float32),
+                                      pairs["ANI"].to_numpy(dtype=np.float32)]))
+
+def write_skani_edges(edges, output_path):
+    """
+    Saves sparse Skani results as a TSV with one pair of bins by line
+    """
+    names = np.array(edges.bin_names, dtype=object)
+    pd.DataFrame({"bin_1": names[edges.bin_1], "bin_2": names[edges.bin_2], "ani": edges.ani}) \
+        .to_csv(output_path, sep="\t", index=False, columns=SKANI_EDGES_COLUMNS)
+
+def read_skani_edges(filepath):
+    """
+    Reads sparse Skani results saved by `write_skani_edges`
+    """
+    pairs = pd.read_csv(filepath, sep="\t", dtype={"bin_1": str, "bin_2": str, "ani": np.float32})
+
+    # bins are numbered in their order of appearance
+    codes, bin_names = pd.factorize(pd.concat([pairs["bin_1"], pairs["bin_2"]], ignore_index=True))
+    return SkaniEdges(bin_names.tolist(),
+                      codes[:len(pairs)].astype(np.int32),
+                      codes[len(pairs):].astype(np.int32),
+                      pairs["ani"].to_numpy(dtype=np.float32))
+
+def hash_bin(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 of the content of a bin file
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def write_atomically(df, output_path, **kwargs):
+    """
+    Writes a DataFrame as a TSV through a temporary file, so an interrupted run never
+    leaves a truncated file in the sketch store
+    """
+    tmp_path = f"{output_path}.tmp"
+    df.to_csv(tmp_path, sep="\t", index=False, **kwargs)
+    os.replace(tmp_path, output_path)
+
+def get_bins_hashes(bins, store_dir):
+    """
+    Returns {bin name: content hash} for the bins ({name: path}). Hashes are cached in the store
+    by (path, size, modification time), so only new or modified bins are read
+    """
+    hashes_path = os.path.join(store_dir, SKETCH_STORE_HASHES)
+    cached = {}
+    if os.path.exists(hashes_path):
+        known = pd.read_csv(hashes_path, sep="\t", dtype={"path": str, "size": np.int64, "mtime_ns": np.int64, "hash": str})
+        cached = {(path, size, mtime): bin_hash for path, size, mtime, bin_hash
+                  in known[["path", "size", "mtime_ns", "hash"]].itertuples(index=False)}
+
+    bins_hashes = {}
+    records = []
+    for bin_name, path in tqdm(bins.items()):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in cached:
+            cached[key] = hash_bin(path)
+        bins_hashes[bin_name] = cached[key]
+        records.append((*key, cached[key]))
+
+    write_atomically(pd.DataFrame(records, columns=["path", "size", "mtime_ns", "hash"]), hashes_path)
+    return bins_hashes
+
+def get_sketch_params_dir(store_dir, options=SKANI_SKETCH_OPTIONS):
+    """
+    Returns the folder of the store with the sketches (and their pairs) built with `options`,
+    so that sketches built with other options are never compared with them
+    """
+    return os.path.join(store_dir, "sketch" + "".join(f"_{option.lstrip('-')}" for option in options))
+
+def get_sketch_path(store_dir, bin_hash):
+    return os.path.join(store_dir, SKETCH_STORE_SKETCHES, f"{bin_hash}.fa.sketch")
+
+def run_skani_sketch(list_bins_path, output_dir, cpu):
+    cmd = ['skani', 'sketch', *SKANI_SKETCH_OPTIONS, '-t', str(cpu), '-l', list_bins_path, '-o', output_dir]
+    subprocess.run(cmd, check=True)
+
+def run_skani_dist(query_list_path, reference_list_path, output_file, cpu):
+    cmd = ['skani', 'dist', *SKANI_SKETCH_OPTIONS, '-t', str(cpu), '--ql', query_list_path, '--rl', reference_list_path, '-o', output_file]
+    subprocess.run(cmd, check=True)
+
+def sketch_new_bins(bins, bins_hashes, store_dir, tmp_dir, cpu):
+    """
+    Sketches the bins whose content was never sketched. Bins are symlinked as '{hash}.fa'
+    before sketching, so Skani reports them by hash whatever their current name
+    """
+    sketches_dir = os.path.join(store_dir, SKETCH_STORE_SKETCHES)
+    os.makedirs(sketches_dir, exist_ok=True)
+
+    to_sketch = {}
+    for bin_name, bin_hash in bins_hashes.items():
+        if not os.path.exists(get_sketch_path(store_dir, bin_hash)):
+            to_sketch[f"{bin_hash}.fa"] = bins[bin_name]
+    print(f"{len(to_sketch)} bins to sketch, {len(set(bins_hashes.values())) - len(to_sketch)} already sketched")
+    if not to_sketch:
+        return
+
+    staging_dir = tempfile.mkdtemp(prefix="skani_sketch_", dir=tmp_dir)
+    try:
+        list_bins_path = symlink_bins_list(to_sketch, os.path.join(staging_dir, "bins"))
+        run_skani_sketch(list_bins_path, os.path.join(staging_dir, "sketches"), cpu)
+        # sketches are only added to the store once complete
+        for bin_file in to_sketch:
+            os.replace(os.path.join(staging_dir, "sketches", f"{bin_file}.sketch"),
+                       os.path.join(sketches_dir, f"{bin_file}.sketch"))
+    finally:
+        shutil.rmtree(staging_dir)
+
+def read_skani_dist(filepath):
+    """
+    Reads the output of `skani dist` on sketches of the store, into pairs of hashes
+    """
+    pairs = pd.read_csv(filepath, sep="\t", usecols=["Ref_file", "Query_file", "ANI"],
+                        dtype={"Ref_file": str, "Query_file": str, "ANI": np.float32})
+    to_hash = lambda paths: paths.map(os.path.basename).str.replace(r"\.fa$", "", regex=True)
+    return pd.DataFrame({"hash_1": to_hash(pairs["Ref_file"]), "hash_2": to_hash(pairs["Query_file"]),
+                         "ani": pairs["ANI"]})
+
+def merge_hash_pairs(pairs, new_pairs):
+    """
+    Merges pairs of hashes, keeping each unordered pair of distinct bins once (with its highest ANI)
     """
-    A function to read the Skani results (Phylip lower triangular matrix) into a 
-    numpy matrix and to return it as a pandas dataframe for having the dimensions
-    names
+    pairs = pd.concat([pairs, new_pairs], ignore_index=True)
+    hash_1 = np.minimum(pairs["hash_1"].to_numpy(dtype=object), pairs["hash_2"].to_numpy(dtype=object))
+    hash_2 = np.maximum(pairs["hash_1"].to_numpy(dtype=object), pairs["hash_2"].to_numpy(dtype=object))
+    pairs = pd.DataFrame({"hash_1": hash_1, "hash_2": hash_2, "ani": pairs["ani"].to_numpy(dtype=np.float32)})
+    pairs = pairs[pairs["hash_1"] != pairs["hash_2"]]
+    return pairs.sort_values("ani", ascending=False, kind="stable") \
+                .drop_duplicates(subset=["hash_1", "hash_2"]) \
+                .sort_values(["hash_1", "hash_2"], ignore_index=True)
+
+def compare_new_bins(bins_hashes, store_dir, tmp_dir, output_file, cpu):
+    """
+    Compares the bins never compared before against all the bins of the store (new ones included)
+    and adds their pairs of similar bins to the store. Returns all the pairs of the store
+    """
+    edges_path = os.path.join(store_dir, SKETCH_STORE_EDGES)
+    compared_path = os.path.join(store_dir, SKETCH_STORE_COMPARED)
+
+    compared = []
+    if os.path.exists(compared_path):
+        with open(compared_path) as f:
+            compared = [line.strip() for line in f if line.strip()]
+    pairs = pd.read_csv(edges_path, sep="\t", dtype={"hash_1": str, "hash_2": str, "ani": np.float32}) \
+        if os.path.exists(edges_path) else pd.DataFrame({"hash_1": [], "hash_2": [], "ani": []})
+
+    known = set(compared)
+    new = sorted(set(bins_hashes.values()) - known)
+    print(f"{len(new)} new bins to compare against {len(compared) + len(new)} bins")
+    if not new:
+        # keeping an (empty) Skani output for this run
+        pd.DataFrame(columns=["Ref_file", "Query_file", "ANI"]).to_csv(output_file, sep="\t", index=False)
+        return pairs
+
+    staging_dir = tempfile.mkdtemp(prefix="skani_dist_", dir=tmp_dir)
+    try:
+        query_list_path = os.path.join(staging_dir, "query_sketches.txt")
+        reference_list_path = os.path.join(staging_dir, "reference_sketches.txt")
+        with open(query_list_path, 'w') as f:
+            f.writelines(get_sketch_path(store_dir, bin_hash) + '\n' for bin_hash in new)
+        with open(reference_list_path, 'w') as f:
+            f.writelines(get_sketch_path(store_dir, bin_hash) + '\n' for bin_hash in compared + new)
+
+        # only new-vs-all pairs are computed, the others are already in the store
+        run_skani_dist(query_list_path, reference_list_path, output_file, cpu)
+    finally:
+        shutil.rmtree(staging_dir)
+
+    pairs = merge_hash_pairs(pairs, read_skani_dist(output_file))
+    write_atomically(pairs, edges_path)
+    # the bins are only recorded as compared once their pairs are saved
+    with open(f"{compared_path}.tmp", 'w') as f:
+        f.writelines(bin_hash + '\n' for bin_hash in compared + new)
+    os.replace(f"{compared_path}.tmp", compared_path)
+
+    return pairs
+
+def build_skani_edges_from_hash_pairs(bins_hashes, pairs):
+    """
+    Builds `SkaniEdges` for the bins ({name: hash}) from the pairs of hashes of the store.
+    Bins with the same content are paired with an ANI of 100
+    """
+    bin_names = list(bins_hashes)
+    bins_df = pd.DataFrame({"bin": np.arange(len(bin_names), dtype=np.int32), "hash": list(bins_hashes.values())})
+
+    # pairs of bins of this run only
+    similar = pairs.merge(bins_df.rename(columns={"bin": "bin_1", "hash": "hash_1"}), on="hash_1") \
+                   .merge(bins_df.rename(columns={"bin": "bin_2", "hash": "hash_2"}), on="hash_2")
+    identical = bins_df.merge(bins_df, on="hash", suffixes=("_1", "_2"))
+    identical = identical[identical["bin_1"] < identical["bin_2"]].assign(ani=np.float32(100))
+    similar = pd.concat([similar[["bin_1", "bin_2", "ani"]], identical[["bin_1", "bin_2", "ani"]]], ignore_index=True) \
+                .sort_values(["bin_1", "bin_2"], ignore_index=True)
+
+    # adding the pair of each bin with itself
+    diagonal = np.arange(len(bin_names), dtype=np.int32)
+    return SkaniEdges(bin_names,
+                      np.concatenate([diagonal, similar["bin_1"].to_numpy(dtype=np.int32)]),
+                      np.concatenate([diagonal, similar["bin_2"].to_numpy(dtype=np.int32)]),
+                      np.concatenate([np.full(len(bin_names), 100, dtype=np.float32),
+                                      similar["ani"].to_numpy(dtype=np.float32)]))
+
+def compare_incrementally(bins, store_dir, tmp_dir, output_file, cpu):
+    """
+    Compares the bins ({name: path}) using the persistent sketch store `store_dir`: only new bins are
+    sketched, and only their pairs with the bins of the store are computed by Skani.
+    Returns sparse Skani results (`SkaniEdges`) for the given bins
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    print("Hashing bins")
+    bins_hashes = get_bins_hashes(bins, store_dir)
+
+    params_dir = get_sketch_params_dir(store_dir)
+    os.makedirs(params_dir, exist_ok=True)
+
+    print("Sketching new bins")
+    sketch_new_bins(bins, bins_hashes, params_dir, tmp_dir, cpu)
+
+    print("Running Skani analysis on new bins")
+    pairs = compare_new_bins(bins_hashes, params_dir, tmp_dir, output_file, cpu)
+
+    return build_skani_edges_from_hash_pairs(bins_hashes, pairs)
+
+def read_phylip_lower_triangular(filepath, cache_path=None):
+    """
+    A function to read the Skani results (Phylip lower triangular or full matrix) into a
+    symmetric float32 numpy matrix and to return it as a pandas dataframe for having the
+    dimensions names. As before, only the lower triangle of the file is used.
+
+    The file is streamed line by line. If `cache_path` is given, the matrix is written into
+    a memory-mapped `.npy` file (see `save_skani_matrix_names` and `load_skani_matrix`)
+    instead of being held in memory
     """
     with open(filepath, 'r') as file:
-        lines = file.readlines()
+        # get the number of elements
+        num_elements = int(file.readline().strip())
+
+        # initialize an empty float32 array, on disk if a cache is requested
+        # (a new memory-mapped file is filled with zeros)
+        if cache_path is not None:
+            matrix = np.lib.format.open_memmap(cache_path, mode='w+', dtype=np.float32,
+                                               shape=(num_elements, num_elements))
+        else:
+            matrix = np.zeros((num_elements, num_elements), dtype=np.float32)
+        bin_names = []
 
-    # get the number of elements
-    num_elements = int(lines[0].strip())
+        # fill the lower triangle of the array, one line at a time
+        for i, line in enumerate(file):
+            elements = line.split(None, 1)
+            values = np.array(elements[1].split() if len(elements) > 1 else [], dtype=np.float32)
 
-    # initialize an empty numpy array
-    matrix = np.zeros((num_elements, num_elements))
-    bin_names = []
+            bin_names.append(os.path.basename(elements[0]))
+            # the diagonal is only known with a full matrix
+            values = values[:i + 1]
+            matrix[i, :len(values)] = values
 
-    # fill the numpy array with values
-    for i in range(1, len(lines)):
-        elements = lines[i].strip().split()
-        values = list(map(float, elements[1:]))
+    mirror_lower_triangle(matrix)
 
-        bin_name = os.path.basename(elements[0])
-        bin_names.append(bin_name)
-        
-        matrix[i-1, :len(values)] = values
-        matrix[:len(values), i-1] = values
+    if cache_path is not None:
+        matrix.flush()
+        save_skani_matrix_names(bin_names, cache_path)
 
-    skani_results = pd.DataFrame(matrix, index=bin_names, columns=bin_names)
+    skani_results = pd.DataFrame(matrix, index=bin_names, columns=bin_names, copy=False)
     return skani_results
 
-def build_shared_bins_dictionary_dereplicated(skani_results, threshold=99.9):
+def mirror_lower_triangle(matrix, block_size=1024):
+    """
+    Copies the lower triangle of a square matrix into its upper triangle, by blocks of rows
+    so that a memory-mapped matrix is never fully loaded
+    """
+    num_elements = matrix.shape[0]
+    for start in range(0, num_elements, block_size):
+        end = min(start + block_size, num_elements)
+        # the square block on the diagonal
+        block = matrix[start:end, start:end]
+        matrix[start:end, start:end] = np.tril(block) + np.tril(block, -1).T
+        # the rows of the block, right of the diagonal block, are the columns of the rows below
+        if end < num_elements:
+            matrix[start:end, end:] = matrix[end:, start:end].T
+
+def get_skani_matrix_names_path(cache_path):
+    return f"{cache_path}.names.txt"
+
+def save_skani_matrix_names(bin_names, cache_path):
+    """
+    Saves the bins name of a cached matrix next to it (one name per line)
+    """
+    with open(get_skani_matrix_names_path(cache_path), 'w') as f:
+        for bin_name in bin_names:
+            f.write(bin_name + '\n')
+
+def get_skani_matrix_cache_path(tsv_path):
+    """
+    Returns the default path of the binary cache of a Skani matrix saved in TSV format
+    """
+    return f"{os.path.splitext(tsv_path)[0]}.npy"
+
+def load_skani_matrix(tsv_path, cache_path=None):
+    """
+    Loads a Skani matrix produced by `skani_analysis.py compare` as a DataFrame, or as
+    `SkaniEdges` if it was run with `--sparse`.
+
+    The binary cache (memory-mapped, so only the parts used are read) is preferred when it
+    exists and is not older than the TSV, otherwise the TSV is read
+    """
+    with open(tsv_path) as f:
+        if f.readline().rstrip('\n').split('\t') == SKANI_EDGES_COLUMNS:
+            return read_skani_edges(tsv_path)
+
+    if cache_path is None:
+        cache_path = get_skani_matrix_cache_path(tsv_path)
+    names_path = get_skani_matrix_names_path(cache_path)
+
+    if (os.path.exists(cache_path) and os.path.exists(names_path)
+            and (not os.path.exists(tsv_path) or os.path.getmtime(cache_path) >= os.path.getmtime(tsv_path))):
+        print(f"Opening the cached Skani matrix {cache_path}")
+        matrix = np.load(cache_path, mmap_mode='r')
+        with open(names_path) as f:
+            bin_names = [line.rstrip('\n') for line in f]
+        return pd.DataFrame(matrix, index=bin_names, columns=bin_names, copy=False)
+
+    return pd.read_csv(tsv_path, sep="\t", index_col=0)
+
+def build_shared_bins_dictionary_dereplicated(skani_results, threshold=99.9, debug=False, block_size=1024):
     """
     Builds a dictionary with each key being a bin and the values being the 
     assemblies where a bin was found with identity >= `threshold`
 
+    The matrix is compared to the threshold by blocks of rows, and the columns are grouped
+    by assembly (the prefix of the bins name), so no Python loop runs over the pairs of bins.
+    With `debug`, every pair of similar bins is printed.
+
     Will only work on dereplicated bins set
     """
+    # comparing in the precision of the matrix (float32 when parsed from Skani output)
+    matrix = skani_results.values
+    threshold = matrix.dtype.type(threshold)
+
+    bin_names = skani_results.index.tolist()
+    # assemblies are sorted, so are the lists of assemblies built from them
+    assemblies, assembly_codes = np.unique([bin_name.split('.')[0] for bin_name in bin_names], return_inverse=True)
+    assembly_columns = [assembly_codes == code for code in range(len(assemblies))]
+
     # initialize an empty dictionary to store shared bins
     shared_bins_dict = {}
 
-    # iterate over rows (bins)
-    for i in range(skani_results.shape[0]):
-        bin_name = skani_results.index[i]
-        shared_with = []
-
-        print(f"Current bin {bin_name}")
+    for start in range(0, matrix.shape[0], block_size):
+        block = np.asarray(matrix[start:start + block_size])
+        rows = np.arange(block.shape[0])
 
-        # iterate over columns (bins)
-        for j in range(skani_results.shape[1]):
-            if i != j:
-                percentage_identity = skani_results.iloc[i, j]
-                if percentage_identity >= threshold:
-                    print(f"Found identity of {percentage_identity}% between {bin_name} and {skani_results.columns[j]}")
-                    other_bin_name = skani_results.columns[j].split('.')[0]  # Get the bin name with assembly prefix
-                    shared_with.append(other_bin_name)
+        similar = block >= threshold
+        # a bin is not compared to itself
+        similar[rows, rows + start] = False
 
-        # add the original assembly (index name) to the list
-        original_assembly = bin_name.split('.')[0]
-        shared_with.append(original_assembly)
+        if debug:
+            for i, j in zip(*np.nonzero(similar)):
+                print(f"Found identity of {block[i, j]}% between {bin_names[start + i]} and {bin_names[j]}")
 
-        # convert the list to a sorted unique list of strings
-        shared_with = sorted(set(shared_with))
+        # assemblies where each bin was found, including its own
+        found = np.column_stack([similar[:, columns].any(axis=1) for columns in assembly_columns])
+        found[rows, assembly_codes[start:start + block.shape[0]]] = True
 
-        # add to the dictionary with the bin name as key
-        shared_bins_dict[bin_name] = shared_with
+        for i in rows:
+            shared_bins_dict[bin_names[start + i]] = assemblies[found[i]].tolist()
 
     return shared_bins_dict
 
+def build_shared_bins_dictionary_from_edges(edges, threshold=99.9):
+    """
+    Same as `build_shared_bins_dictionary_dereplicated`, from sparse Skani results:
+    only the pairs of bins are read, never a N x N matrix
+
+    Will only work on dereplicated bins set
+    """
+    threshold = np.float32(threshold)
+    assemblies = np.array([bin_name.split('.')[0] for bin_name in edges.bin_names], dtype=object)
+
+    # pairs of distinct bins sharing enough identity, in both directions
+    similar = (edges.ani >= threshold) & (edges.bin_1 != edges.bin_2)
+    bins = np.concatenate([edges.bin_1[similar], edges.bin_2[similar]])
+    others = np.concatenate([edges.bin_2[similar], edges.bin_1[similar]])
+
+    # each bin is at least found in its own assembly
+    shared = pd.DataFrame({"bin": np.concatenate([np.arange(len(edges.bin_names)), bins]),
+                           "assembly": np.concatenate([assemblies, assemblies[others]])})
+    shared = shared.drop_duplicates().sort_values(["bin", "assembly"])
+
+    shared_with = shared.groupby("bin", sort=True)["assembly"].agg(list)
+    return {edges.bin_names[i]: assemblies_list for i, assemblies_list in shared_with.items()}
+
+def union_find_components(num_elements, bin_1, bin_2):
+    """
+    Returns, for each element, the smallest element of its connected component, given the
+    edges (`bin_1[k]`, `bin_2[k]`). Uses a union-find with path compression
+    """
+    parent = np.arange(num_elements)
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in zip(bin_1.tolist(), bin_2.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # the smallest element is kept as root, so clusters are numbered by their first bin
+            if root_a < root_b:
+                parent[root_b] = root_a
+            else:
+                parent[root_a] = root_b
+
+    return np.array([find(x) for x in range(num_elements)], dtype=np.int64)
+
+def build_clusters_bins_dictionary_from_edges(edges, threshold=99.9):
+    """
+    Builds a dictionary with each key being a "cluster" and the values being a list of bins that share >= `threshold` identity,
+    directly or through other bins of the cluster, from sparse Skani results.
+    Clusters are numbered (from '1') in the order of their first bin, and bins are listed in their order
+    """
+    similar = edges.ani >= np.float32(threshold)
+    roots = union_find_components(len(edges.bin_names), edges.bin_1[similar], edges.bin_2[similar])
+
+    # of the form: {'1': ['bin1', 'bin2', 'bin3'], '2: ['bin4', 'bin5']}
+    clusters_dict = {}
+    cluster_numbers = {}
+    for i, root in enumerate(roots.tolist()):
+        if root not in cluster_numbers:
+            cluster_numbers[root] = str(len(cluster_numbers) + 1)
+            clusters_dict[cluster_numbers[root]] = []
+        clusters_dict[cluster_numbers[root]].append(edges.bin_names[i])
+
+    return clusters_dict
+
 def build_assembly_bins_dictionary_dereplicated(shared_bins_dict):
     """
     Builds a dictionary of set with each key being an assembly method
@@ -215,117 +650,116 @@ def build_assembly_bins_dictionary_dereplicated(shared_bins_dict):
 
     return assembly_bins_dict
 
-def build_clusters_bins_dictionary(skani_results: pd.DataFrame, threshold=99.9):
+def build_clusters_bins_dictionary(skani_results: pd.DataFrame, threshold=99.9, block_size=1024):
     """
     Builds a dictionary with each key being a "cluster" and the values being a list of bins that share >= `threshold` identity
-    The idea is to iterate over `skani_results`'s bins, and for each bin not already assigned in a cluster check if it shares identity with other bins,
-    if so, add them to the same cluster
+    (directly or through other bins of the cluster).
+    The pairs of similar bins are extracted with `np.nonzero` on blocks of rows of the matrix (so a memory-mapped matrix
+    is never fully loaded), then grouped with a union-find (see `build_clusters_bins_dictionary_from_edges`)
     """
 
-    already_checked_bins =[]
+    # comparing in the precision of the matrix (float32 when parsed from Skani output)
+    matrix = skani_results.values
+    threshold = matrix.dtype.type(threshold)
+
+    bin_1 = [np.array([], dtype=np.int32)]
+    bin_2 = [np.array([], dtype=np.int32)]
+    ani = [np.array([], dtype=np.float32)]
+    for start in range(0, matrix.shape[0], block_size):
+        block = np.asarray(matrix[start:start + block_size])
+        rows, cols = np.nonzero(block >= threshold)
+        # the matrix is symmetric, the lower triangle is enough
+        lower = rows + start > cols
+        rows, cols = rows[lower], cols[lower]
+        bin_1.append((rows + start).astype(np.int32))
+        bin_2.append(cols.astype(np.int32))
+        ani.append(block[rows, cols].astype(np.float32))
+
+    edges = SkaniEdges(skani_results.index.tolist(), np.concatenate(bin_1), np.concatenate(bin_2),
+                       np.concatenate(ani))
+
     # of the form: {'1': ['bin1', 'bin2', 'bin3'], '2: ['bin4', 'bin5']}
-    clusters_dict = {}
-    # dictionary to quiclky find the cluster of a bin
-    # of the form: {'bin1': '1', 'bin2': '1', 'bin3': '1', 'bin4': '2', 'bin5': '2'}
-    clusters_index = {}
-
-    for idx, row in skani_results.iterrows():
-        if idx not in already_checked_bins:
-            for col, value in row.items():
-                # those two bins share identity, so they are in the same cluster
-                if value >= threshold:
-                    if idx != col:
-                        # if col has already been added to a cluster, we add idx to the same cluster
-                        if col in clusters_index:
-                            cluster = clusters_index[col]
-                            clusters_dict[cluster].append(idx)
-                            clusters_index[idx] = cluster
-                            already_checked_bins.append(idx)
-                        # if idx has not been added to any cluster, we create a new one and add it to it
-                        elif idx not in clusters_index:
-                            new_cluster = str(len(clusters_dict) + 1)
-                            clusters_dict[new_cluster] = [idx, col]
-                            clusters_index[idx] = new_cluster
-                            clusters_index[col] = new_cluster
-                            already_checked_bins.append(idx)
-                            already_checked_bins.append(col)
-                        # if idx has been added to a cluster, but col has not, we add col to the same cluster
-                        else:
-                            cluster = clusters_index[idx]
-                            clusters_dict[cluster].append(col)
-                            clusters_index[col] = cluster
-                            already_checked_bins.append(col)
-
-            # if idx has not been added to any cluster, we create a new one and add it to it
-            if idx not in clusters_index:
-                new_cluster = str(len(clusters_dict) + 1)
-                clusters_dict[new_cluster] = [idx]
-                clusters_index[idx] = new_cluster
-                already_checked_bins.append(idx)
-
-    assert len(clusters_index) == skani_results.shape[0], "The number of clusters does not match the number of bins in the Skani results"
+    clusters_dict = build_clusters_bins_dictionary_from_edges(edges, threshold)
+
+    assert sum(len(bins) for bins in clusters_dict.values()) == skani_results.shape[0], "The number of clusters does not match the number of bins in the Skani results"
 
     return clusters_dict
 
-def checkm_metrics_bins_clusters(clusters_dict: dict, ani_threshold=97):
+@functools.lru_cache(maxsize=None)
+def load_unduplicated_table(method: str):
     """
-    Retrieves the CheckM metrics for each bin in a cluster and returns a DataFrame with the metrics
+    Loads once the table linking the bins of an assembly method to their unambiguous name,
+    indexed by unambiguous name
     """
-    # dictionary to store paths for corresponding name files based on assembly method
-    corresponding_names_paths = {
-        'hybridspades': "results/08_bins_postprocessing/genomes_list/hybridspades/unduplicated.tsv",
-        'metaflye': "results/08_bins_postprocessing/genomes_list/metaflye/unduplicated.tsv",
-        'megahit': "results/08_bins_postprocessing/genomes_list/megahit/unduplicated.tsv",
-        'metaspades': "results/08_bins_postprocessing/genomes_list/metaspades/unduplicated.tsv"
-    }
-
-    for method, path in corresponding_names_paths.items():
-        if os.path.isfile(path):
-            corresponding_names_paths[method] = pd.read_csv(path, sep="\t")
+    file_path = f"results/08_bins_postprocessing/genomes_list/{method}/unduplicated.tsv"
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File '{file_path}' does not exist.")
+    return pd.read_csv(file_path, sep="\t").set_index('unambiguous_filename')
 
-    checkm_results_dir = f"results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani_threshold}"
-
-    # preparing a dictionary to store the results
-    results = {
-        'cluster': [],
-        'assembly': [],
-        'bin': [],
-        'contamination': [],
-        'completeness': [],
-        'contig_n50': [],
-        'genome_size': []
-    }
-
-    for cluster, bins in tqdm(clusters_dict.items()):
-        for bin in bins:
-            # extracting the method from the bin name using regex
-            method_match = re.match(r'^(hybridspades|metaflye|metaspades|megahit)', bin)
-            if method_match:
-                method = method_match.group(1)
-            else:
-                raise ValueError(f"Could not identify the assembly method from bin name: {bin}")
-
-            bin = bin.replace(f"{method}.", "")
-            bin = bin.replace(".fa", "")
+@functools.lru_cache(maxsize=None)
+def load_checkm2_report(checkm_results_dir: str, method: str):
+    """
+    Loads once the CheckM2 results of the dereplicated bins of an assembly method
+    """
+    checkm2_quality_report = os.path.join(checkm_results_dir, method, "checkm2", "quality_report.tsv")
+    return pd.read_csv(checkm2_quality_report, sep="\t")
 
-            # constructing the path to the CheckM2 results table and loading it
-            checkm2_quality_report = os.path.join(checkm_results_dir, method, "checkm2", "quality_report.tsv")
-            checkm2_results_df = pd.read_csv(checkm2_quality_report, sep="\t")[['Name', 'Completeness', 'Contamination', 'Contig_N50', 'Genome_Size']]
+@functools.lru_cache(maxsize=None)
+def load_gtdb_taxonomy(gtdb_tk_results_dir: str, method: str, sample_name: str):
+    """
+    Loads once the GTDB-Tk bacterial and archaeal summaries of a sample, indexed by genome.
+    Bacterial annotations take precedence
+    """
+    summaries = []
+    for domain in ["bac120", "ar53"]:
+        summary = os.path.join(gtdb_tk_results_dir, method, sample_name, f"gtdbtk.{domain}.summary.tsv")
+        # the bacterial summary is expected, the archaeal one is optional
+        if domain == "bac120" or os.path.isfile(summary):
+            summaries.append(pd.read_csv(summary, sep="\t", usecols=["user_genome", "classification"]))
+    taxonomy = pd.concat(summaries, ignore_index=True).drop_duplicates(subset="user_genome", keep="first")
+    return taxonomy.set_index("user_genome")["classification"]
+
+def split_assembly_method(bins: pd.Series):
+    """
+    Returns the assembly method and the name without method and extension of bins named
+    as in the Skani results ('{method}.{bin}.fa')
+    """
+    methods = bins.str.extract(r'^(hybridspades|metaflye|metaspades|megahit)', expand=False)
+    if methods.isna().any():
+        raise ValueError(f"Could not identify the assembly method from bin name: {bins[methods.isna()].iloc[0]}")
+    names = [bin.replace(f"{method}.", "").replace(".fa", "") for bin, method in zip(bins, methods)]
+    return methods, names
 
-            # filtering the results to keep only the rows related to this bin
-            checkm2_results_df = checkm2_results_df[checkm2_results_df['Name'] == bin]
+def checkm_metrics_bins_clusters(clusters_dict: dict, ani_threshold=97):
+    """
+    Retrieves the CheckM metrics for each bin in a cluster and returns a DataFrame with the metrics.
+    Each CheckM2 report is read once and joined on all the bins of its assembly method
+    """
+    checkm_results_dir = f"results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{ani_threshold}"
 
-            # storing the results
-            results['cluster'].append(cluster)
-            results['assembly'].append(method)
-            results['bin'].append(bin)
-            results['contamination'].append(checkm2_results_df['Contamination'].values[0])
-            results['completeness'].append(checkm2_results_df['Completeness'].values[0])
-            results['contig_n50'].append(checkm2_results_df['Contig_N50'].values[0])
-            results['genome_size'].append(checkm2_results_df['Genome_Size'].values[0])
+    # one row by bin, in the order of the clusters
+    bins = pd.DataFrame([(cluster, bin) for cluster, cluster_bins in clusters_dict.items() for bin in cluster_bins],
+                        columns=['cluster', 'bin'])
+    bins['assembly'], bins['bin'] = split_assembly_method(bins['bin'])
+
+    metrics = []
+    for method in bins['assembly'].unique():
+        checkm2_results_df = load_checkm2_report(checkm_results_dir, method)[['Name', 'Completeness', 'Contamination', 'Contig_N50', 'Genome_Size']]
+        metrics.append(checkm2_results_df.assign(assembly=method))
+    metrics = pd.concat(metrics, ignore_index=True) if metrics else pd.DataFrame(
+        columns=['Name', 'Completeness', 'Contamination', 'Contig_N50', 'Genome_Size', 'assembly'])
+
+    # joining the metrics of all the bins at once
+    results_df = bins.merge(metrics, how='left', left_on=['assembly', 'bin'], right_on=['assembly', 'Name'])
+    missing = results_df['Name'].isna()
+    if missing.any():
+        raise ValueError(f"No CheckM2 results found for bin {results_df.loc[missing, 'bin'].iloc[0]} "
+                         f"({results_df.loc[missing, 'assembly'].iloc[0]})")
 
     # returning the results as a DataFrame
-    results_df = pd.DataFrame(results)
+    results_df = results_df.rename(columns={'Contamination': 'contamination', 'Completeness': 'completeness',
+                                            'Contig_N50': 'contig_n50', 'Genome_Size': 'genome_size'})
+    results_df = results_df[['cluster', 'assembly', 'bin', 'contamination', 'completeness', 'contig_n50', 'genome_size']]
 
     # summarize the results by cluster
     summary_df = results_df.groupby('cluster').agg(
@@ -382,101 +816,60 @@ def get_bins_by_assembly_method(assembly_bins_dict, assembly: str):
 
     return {assembly: assembly_bins_dict[assembly]}
 
-def get_original_bin_name(corresponding_df: pd.DataFrame, bin_name: str):
-    return corresponding_df[corresponding_df['unambiguous_filename'] == bin_name]['filename'].values[0]
-
-def get_original_bin_path(corresponding_df: pd.DataFrame, bin_name: str):
-    return corresponding_df[corresponding_df['unambiguous_filename'] == bin_name]['path'].values[0]
-
 def get_sample_name_from_bins_refinement_path(path):
-    pattern = re.compile("(megahit|metaspades|hybridspades|metaflye)\/(.*)\/final")
-    match = pattern.search(path)
-
-    if match:
-        sample_name = match.group(2)
-        return sample_name
-    
-def get_gtdb_taxo_from_bin_name(gtdb_tk_res: pd.DataFrame, bin: str):
-    bin_without_extension = bin.replace(".fa", "")
-    
-    try:
-        taxonomical_classification = gtdb_tk_res[gtdb_tk_res["user_genome"] == bin_without_extension]["classification"].values[0]
-        return taxonomical_classification
-    except IndexError:
-        # if nothing was found, it returns None
-        return None
+    return parse_refined_bin_path(path)['sample']
 
 def get_bins_taxo(assembly_bins_dict):
     """
     Gets the bin taxonomy using the GTDB-Tk annotation obtained by the pipeline.
     The function is generalized to handle any assembly method provided in assembly_bins_dict.
+
+    Tables are read once (by assembly method, or by sample for GTDB-Tk) and joined on the bins.
     """
     gtdb_tk_results_dir = "results/08_bins_postprocessing/gtdb_tk/"
-    
-    # dictionary to store paths for corresponding name files based on assembly method
-    corresponding_names_paths = {
-        'hybridspades': "results/08_bins_postprocessing/genomes_list/hybridspades/unduplicated.tsv",
-        'metaflye': "results/08_bins_postprocessing/genomes_list/metaflye/unduplicated.tsv",
-        'megahit': "results/08_bins_postprocessing/genomes_list/megahit/unduplicated.tsv",
-        'metaspades': "results/08_bins_postprocessing/genomes_list/metaspades/unduplicated.tsv"
-    }
 
     # checking if the GTDB-Tk results directory exists
     if not os.path.isdir(gtdb_tk_results_dir):
         raise FileNotFoundError(f"Folder '{gtdb_tk_results_dir}' does not exist.")
-    
+
     # checking if the corresponding name files exist for the provided assembly methods
     for method in assembly_bins_dict.keys():
-        if method in corresponding_names_paths:
-            file_path = corresponding_names_paths[method]
-            if not os.path.isfile(file_path):
-                raise FileNotFoundError(f"File '{file_path}' does not exist.")
-            # load the corresponding names DataFrame for the current method
-            corresponding_names_paths[method] = pd.read_csv(file_path, sep="\t")
-        else:
+        if method not in ['hybridspades', 'metaflye', 'megahit', 'metaspades']:
             raise ValueError(f"No corresponding name file defined for assembly method '{method}'.")
+        load_unduplicated_table(method)
 
-    # preparing a dictionary to store the results
-    results = {
-        'assembly': [],
-        'original_bin_name': [],
-        'renamed_bin': [],
-        'gtdb_classification': []
-    }
+    processed_dataframes = []
 
     # looping over each assembly method in the dictionary
     for method, bins in tqdm(assembly_bins_dict.items()):
-        for bin in bins:
-            if method in bin:
-                bin = bin.replace(f"{method}.", "")
-
-                # getting the original name of the bin before renaming
-                original_name = get_original_bin_name(corresponding_names_paths[method], bin)
-                # getting the original path to determine the sample name
-                path = get_original_bin_path(corresponding_names_paths[method], bin)
-                # extracting the sample name from the bin's path
-                sample_name = get_sample_name_from_bins_refinement_path(path)
-
-                # constructing the path to the GTDB-Tk bacterial summary file and loading it
-                gtdb_taxo_annotation_bact = os.path.join(gtdb_tk_results_dir, method, sample_name, "gtdbtk.bac120.summary.tsv")
-                gtdb_taxo_annotation_bact_df = pd.read_csv(gtdb_taxo_annotation_bact, sep="\t")
-
-                # trying to retrieve the taxonomy using the bacterial GTDB-Tk output
-                taxonomy = get_gtdb_taxo_from_bin_name(gtdb_taxo_annotation_bact_df, original_name)
-                # if no taxonomy was found, check if the bin might be archaeal
-                if taxonomy is None:
-                    gtdb_taxo_annotation_arch = os.path.join(gtdb_tk_results_dir, method, sample_name, "gtdbtk.ar53.summary.tsv")
-                    gtdb_taxo_annotation_arch_df = pd.read_csv(gtdb_taxo_annotation_arch, sep="\t")
-                    taxonomy = get_gtdb_taxo_from_bin_name(gtdb_taxo_annotation_arch_df, original_name)
-
-                # storing the results
-                results['assembly'].append(method)
-                results['original_bin_name'].append(original_name)
-                results['renamed_bin'].append(bin)
-                results['gtdb_classification'].append(taxonomy)
+        bins = [bin.replace(f"{method}.", "") for bin in bins if method in bin]
+
+        # getting the original name and path of the bins before renaming
+        corresponding_df = load_unduplicated_table(method)
+        unknown = [bin for bin in bins if bin not in corresponding_df.index]
+        if unknown:
+            raise ValueError(f"Bin {unknown[0]} not found in the bins of {method}")
+        method_df = pd.DataFrame({'assembly': method,
+                                  'original_bin_name': corresponding_df.loc[bins, 'filename'].to_numpy(),
+                                  'renamed_bin': bins,
+                                  'path': corresponding_df.loc[bins, 'path'].to_numpy()})
+
+        # extracting the sample name from the bin's path
+        method_df['sample'] = method_df['path'].map(get_sample_name_from_bins_refinement_path)
+
+        # retrieving the taxonomy, reading the GTDB-Tk results once by sample
+        method_df['gtdb_classification'] = None
+        for sample_name, sample_df in method_df.groupby('sample', sort=False):
+            taxonomy = load_gtdb_taxonomy(gtdb_tk_results_dir, method, sample_name)
+            genomes = sample_df['original_bin_name'].str.replace(".fa", "", regex=False)
+            method_df.loc[sample_df.index, 'gtdb_classification'] = genomes.map(taxonomy).astype(object).where(genomes.isin(taxonomy.index), None)
+
+        processed_dataframes.append(method_df[['assembly', 'original_bin_name', 'renamed_bin', 'gtdb_classification']])
 
     # returning the results as a DataFrame
-    return pd.DataFrame(results)
+    if not processed_dataframes:
+        return pd.DataFrame(columns=['assembly', 'original_bin_name', 'renamed_bin', 'gtdb_classification'])
+    return pd.concat(processed_dataframes, ignore_index=True)
 
 def get_bins_quality(bins_taxonomy: pd.DataFrame, ani_threshold: int):
     """
@@ -503,9 +896,8 @@ def get_bins_quality(bins_taxonomy: pd.DataFrame, ani_threshold: int):
         # filtering the results to keep only the rows related to this assembly method
         taxonomy_df_filtered = bins_taxonomy[bins_taxonomy['assembly'] == assembly]
 
-        # loading the corresponding results table into a DataFrame
-        checkm2_results = os.path.join(dereplication_checkm_qc_dir, assembly, "checkm2", "quality_report.tsv")
-        checkm2_results_df = pd.read_csv(checkm2_results, sep="\t")[['Name', 'Completeness', 'Contamination']]
+        # loading the corresponding results table into a DataFrame (read once by assembly)
+        checkm2_results_df = load_checkm2_report(dereplication_checkm_qc_dir, assembly)[['Name', 'Completeness', 'Contamination']]
                 
         # joining it on the GTDB taxonomy we recovered
         taxonomy_df_filtered = pd.merge(taxonomy_df_filtered, checkm2_results_df, how="left",
@@ -523,22 +915,43 @@ def subcommand_compare(args):
     """
     if args.bins == 'refined':
         src_dir = 'results/07_bins_refinement/binette'
-        list_bins_path = symlink_bins(src_dir, args.tmp)
     elif args.bins == 'dereplicated':
         src_dir = f'results/08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/{args.drep_ani}'
-        list_bins_path = symlink_bins_dereplicated(src_dir, args.tmp)
 
-    run_skani(list_bins_path, args.output_file, args.cpu)
+    if not args.sketch_store:
+        list_bins_path = symlink_bins(src_dir, args.tmp) if args.bins == 'refined' else symlink_bins_dereplicated(src_dir, args.tmp)
+        run_skani(list_bins_path, args.output_file, args.cpu, args.sparse)
 
-    # Read the Skani result and save as TSV
-    skani_matrix = read_phylip_lower_triangular(args.output_file)
-    skani_matrix.to_csv(args.tsv_output, sep='\t', index=True, header=True)
+    if args.sketch_store:
+        # only bins absent from the store are sketched and compared, results are always sparse
+        args.sparse = True
+        bins = list_refined_bins(src_dir) if args.bins == 'refined' else list_dereplicated_bins(src_dir)
+        skani_results = compare_incrementally(bins, args.sketch_store, args.tmp, args.output_file, args.cpu)
+        write_skani_edges(skani_results, args.tsv_output)
 
-    print(f"Skani matrix saved to {args.tsv_output}")
+        print(f"Skani pairs of similar bins saved to {args.tsv_output} (sketch store: {args.sketch_store})")
+    elif args.sparse:
+        # Read the pairs of similar bins and save them as TSV
+        skani_results = read_skani_sparse(args.output_file, list_bins_path)
+        write_skani_edges(skani_results, args.tsv_output)
+
+        print(f"Skani pairs of similar bins saved to {args.tsv_output}")
+    else:
+        # Read the Skani result (into its binary cache) and save as TSV
+        matrix_cache = args.matrix_cache if args.matrix_cache else get_skani_matrix_cache_path(args.tsv_output)
+        skani_results = read_phylip_lower_triangular(args.output_file, matrix_cache)
+        skani_results.to_csv(args.tsv_output, sep='\t', index=True, header=True)
+        # the cache must not look older than the TSV
+        os.utime(matrix_cache)
+
+        print(f"Skani matrix saved to {args.tsv_output} and {matrix_cache}")
 
     print(f"Now drawing a Venn diagram if possible")
     if args.bins == 'dereplicated':
-        shared_bins = build_shared_bins_dictionary_dereplicated(skani_matrix, args.ani_threshold)
+        if args.sparse:
+            shared_bins = build_shared_bins_dictionary_from_edges(skani_results, args.ani_threshold)
+        else:
+            shared_bins = build_shared_bins_dictionary_dereplicated(skani_results, args.ani_threshold, args.debug)
         bins_by_assembly = build_assembly_bins_dictionary_dereplicated(shared_bins)
 
         # exporting the bins_by_assembly into a JSON
@@ -583,11 +996,14 @@ def subcommand_cluster(args):
     Handling `skani_analysis.py cluster ...`
     """
 
-    # reading the TSV file as a DataFrame
-    skani_results = pd.read_csv(args.tsv_results, sep="\t", index_col=0)
+    # opening the matrix, from its binary cache if possible
+    skani_results = load_skani_matrix(args.tsv_results, args.matrix_cache)
 
     # building the clusters dictionary
-    clusters_dict = build_clusters_bins_dictionary(skani_results, args.threshold)
+    if isinstance(skani_results, SkaniEdges):
+        clusters_dict = build_clusters_bins_dictionary_from_edges(skani_results, args.threshold)
+    else:
+        clusters_dict = build_clusters_bins_dictionary(skani_results, args.threshold)
 
     # getting the quality of the bins in each cluster
     bins_quality, summary_quality = checkm_metrics_bins_clusters(clusters_dict, args.threshold)
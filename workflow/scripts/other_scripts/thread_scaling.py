@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""
+Harness measuring how the heavy rules of the pipeline scale with their number of threads.
+
+The pipeline is first run up to the selected rules (on the simulated metagenome of
+.test/unit by default). Then, for each number of threads, the selected rules are forced to run
+again with this number of threads (the `threads` key of each rule in the config) and
+`benchmark_repeats` runs by job, alone on the machine (`--cores` is the number of threads).
+The threads of a streaming mapping job are shared between minimap2 and samtools sort, so
+both are set to add up to the measured number of threads.
+Everything runs with the conda environments already created by the pipeline: create them
+beforehand (`snakemake --use-conda --conda-create-envs-only`) to run offline.
+
+The speedup and the parallel efficiency of each rule are plotted, and the number of threads
+to use is recommended: the largest one keeping an efficiency above MIN_EFFICIENCY.
+"""
+
+import os
+import sys
+import copy
+import shutil
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import yaml
+
+# the benchmarks are read using parse_benchmarks.py, stored in the same folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import parse_benchmarks as pb
+# the mapping options are read with the functions stored with the rules of the pipeline
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "rules"))
+import utils
+
+# the rules we can measure, and the config keys of their number of threads
+SCALED_RULES = {
+    'reads_mapping': ['binning', 'minimap2', 'threads'],
+    'reads_mapping_streaming': ['binning', 'minimap2', 'threads'],
+    'bam_sorting': ['binning', 'samtools', 'threads'],
+    'metabat2_binning': ['binning', 'metabat2', 'threads'],
+    'semibin2_binning': ['binning', 'semibin2', 'threads'],
+    'checkm2_assessment': ['checkm2', 'threads'],
+    'gene_clustering': ['mmseqs2', 'threads'],
+    'genomes_dereplication': ['bins_postprocessing', 'drep', 'threads'],
+}
+
+# rules whose job reserves the threads of minimap2 and of samtools sort ('mapping: sort_threads'):
+# both are set so that the job runs with the measured number of threads in total
+SORTING_RULES = ['reads_mapping_streaming']
+SORT_THREADS = ['mapping', 'sort_threads']
+
+# rules only run in one of the mapping modes ('mapping: mode')
+SAM_MODE_RULES = ['reads_mapping', 'bam_sorting']
+STREAMING_MODE_RULES = ['reads_mapping_streaming']
+
+THREADS = [1, 2, 4, 8, 16]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Measure the speedup of the heavy rules of the pipeline with their number of threads.')
+
+    parser.add_argument('--config', default='config/template_config.yaml', help='Config the runs are based on (default: config/template_config.yaml)')
+    parser.add_argument('--samples', default='.test/unit/1._SR_only/metadata.tsv', help='Samples table to use (default: the simulated metagenome, .test/unit/1._SR_only/metadata.tsv)')
+    parser.add_argument('--rules', nargs='+', choices=list(SCALED_RULES), help='Rules to measure (default: all the rules run in the mapping mode of the config)')
+    parser.add_argument('--threads', nargs='+', type=int, default=THREADS, help='Numbers of threads to measure (default: 1 2 4 8 16)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each job by number of threads (default: 3)')
+    parser.add_argument('--min_efficiency', type=float, default=0.6, help='Minimal parallel efficiency of the recommended number of threads (default: 0.6)')
+    parser.add_argument('--output_dir', default='thread_scaling', help='Folder where configs, benchmarks and results are saved (default: thread_scaling)')
+    parser.add_argument('--snakemake_args', default='', help="Other arguments given to Snakemake, e.g. '--conda-prefix /path/to/envs'")
+    parser.add_argument('--analyze_only', action='store_true', help='Do not run the pipeline, only analyze the benchmarks saved in OUTPUT_DIR')
+
+    return parser.parse_args()
+
+def set_nested(config: dict, keys: list, value):
+    """
+    Sets `config[keys[0]][keys[1]]... = value`, creating the missing levels
+    """
+    for key in keys[:-1]:
+        if config.get(key) is None:
+            config[key] = {}
+        config = config[key]
+    config[keys[-1]] = value
+
+def default_rules(config: dict):
+    """
+    Returns the measured rules run with the mapping mode of `config`
+    """
+    skipped = SAM_MODE_RULES if utils.streaming_mapping(config) else STREAMING_MODE_RULES
+    return [rule for rule in SCALED_RULES if rule not in skipped]
+
+def split_sorting_threads(config: dict, threads: int):
+    """
+    Returns the threads of minimap2 and of samtools sort of a mapping job with `threads` threads
+    in total, samtools sort keeping at most the threads it is given in `config`
+    """
+    sort_threads = min(utils.mapping_option(config, 'sort_threads'), threads - 1)
+    return threads - sort_threads, sort_threads
+
+def write_scaling_config(base_config: dict, samples: str, rules: list, threads: int, repeats: int, output: str):
+    """
+    Writes the config of the runs with `threads` threads for the measured rules
+    """
+    config = copy.deepcopy(base_config)
+    config['samples'] = samples
+    config['benchmark_repeats'] = repeats
+    for rule in rules:
+        if rule in SORTING_RULES:
+            mapping_threads, sort_threads = split_sorting_threads(base_config, threads)
+            set_nested(config, SCALED_RULES[rule], mapping_threads)
+            set_nested(config, SORT_THREADS, sort_threads)
+        else:
+            set_nested(config, SCALED_RULES[rule], threads)
+
+    with open(output, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+def run_snakemake(config_path: str, rules: list, cores: int, snakemake_args: str, force=True):
+    cmd = ['snakemake', '--use-conda', '--cores', str(cores), '--configfile', config_path, '--until', *rules]
+    if force:
+        cmd += ['--forcerun', *rules]
+    cmd += snakemake_args.split()
+    print(" ".join(cmd))
+    subprocess.run(cmd, check=True)
+
+def save_rules_benchmarks(rules: list, threads: int, output_dir: str, patterns: list, benchmark_dir='benchmarks'):
+    """
+    Copies the benchmarks of the measured rules written by the last run, and returns them
+    with the number of threads used
+    """
+    benchmarks = pb.concatenate_benchmarks(pb.list_tables(benchmark_dir), patterns=patterns)
+    benchmarks = benchmarks[benchmarks['rule'].isin(rules)].copy()
+    benchmarks['threads'] = threads
+
+    threads_dir = os.path.join(output_dir, f"threads_{threads}")
+    for path in benchmarks['path'].unique():
+        destination = os.path.join(threads_dir, os.path.relpath(path, benchmark_dir))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy(path, destination)
+
+    return benchmarks
+
+def compute_scaling(benchmarks: pd.DataFrame):
+    """
+    Computes, for each rule and number of threads, the wall-clock time of the rule (the sum over its
+    jobs of the median time of their runs), the speedup against the smallest number of threads
+    measured, and the parallel efficiency
+    """
+    jobs = benchmarks.groupby(['rule', 'threads', 'path'])['s'].median().reset_index()
+    scaling = jobs.groupby(['rule', 'threads'])['s'].sum().reset_index().sort_values(['rule', 'threads'], ignore_index=True)
+
+    reference = scaling.groupby('rule').first()
+    scaling['speedup'] = scaling['rule'].map(reference['s']) / scaling['s']
+    scaling['efficiency'] = scaling['speedup'] * scaling['rule'].map(reference['threads']) / scaling['threads']
+    return scaling
+
+def recommend_threads(scaling: pd.DataFrame, min_efficiency=0.6):
+    """
+    Recommends, for each rule, the largest number of threads keeping a parallel efficiency of at
+    least `min_efficiency` (the smallest number of threads measured otherwise)
+    """
+    recommendations = []
+    for rule, rule_scaling in scaling.groupby('rule', sort=True):
+        efficient = rule_scaling[rule_scaling['efficiency'] >= min_efficiency]
+        best = efficient.iloc[-1] if not efficient.empty else rule_scaling.iloc[0]
+        config_key = ".".join(SCALED_RULES.get(rule, []))
+        if rule in SORTING_RULES:
+            # the recommendation is for the whole job
+            config_key += " + " + ".".join(SORT_THREADS)
+        recommendations.append({'rule': rule, 'config_key': config_key,
+                                'recommended_threads': int(best['threads']), 'speedup': best['speedup'],
+                                'efficiency': best['efficiency']})
+    return pd.DataFrame(recommendations)
+
+def plot_scaling(scaling: pd.DataFrame, output: str):
+    """
+    Plots the speedup (against the ideal one) and the efficiency of each rule
+    """
+    fig, (ax_speedup, ax_efficiency) = plt.subplots(1, 2, figsize=(12, 5))
+    threads = np.sort(scaling['threads'].unique())
+
+    for rule, rule_scaling in scaling.groupby('rule', sort=True):
+        ax_speedup.plot(rule_scaling['threads'], rule_scaling['speedup'], marker='o', label=rule)
+        ax_efficiency.plot(rule_scaling['threads'], rule_scaling['efficiency'], marker='o', label=rule)
+    ax_speedup.plot(threads, threads / threads[0], linestyle='--', color='grey', label='ideal')
+
+    for ax, ylabel in [(ax_speedup, 'Speedup'), (ax_efficiency, 'Parallel efficiency')]:
+        ax.set_xscale('log', base=2)
+        ax.set_xticks(threads)
+        ax.set_xticklabels(threads)
+        ax.set_xlabel('Threads')
+        ax.set_ylabel(ylabel)
+    ax_speedup.legend(fontsize='small')
+
+    fig.tight_layout()
+    fig.savefig(output)
+    plt.close(fig)
+
+def main():
+    args = parse_arguments()
+    os.makedirs(args.output_dir, exist_ok=True)
+    benchmarks_path = os.path.join(args.output_dir, "benchmarks.tsv")
+
+    if not args.analyze_only:
+        with open(args.config) as f:
+            base_config = yaml.safe_load(f)
+        patterns = pb.read_benchmark_patterns()
+        rules = args.rules or default_rules(base_config)
+
+        # producing once the inputs of the measured rules
+        config_path = os.path.join(args.output_dir, "config_preparation.yaml")
+        write_scaling_config(base_config, args.samples, rules, max(args.threads), 1, config_path)
+        run_snakemake(config_path, rules, max(args.threads), args.snakemake_args, force=False)
+
+        all_benchmarks = []
+        for threads in sorted(args.threads):
+            config_path = os.path.join(args.output_dir, f"config_threads_{threads}.yaml")
+            write_scaling_config(base_config, args.samples, rules, threads, args.repeats, config_path)
+            # the jobs run alone, with all the cores they are given
+            run_snakemake(config_path, rules, threads, args.snakemake_args)
+            all_benchmarks.append(save_rules_benchmarks(rules, threads, args.output_dir, patterns))
+
+        pd.concat(all_benchmarks, ignore_index=True).to_csv(benchmarks_path, sep='\t', index=False)
+
+    benchmarks = pd.read_csv(benchmarks_path, sep='\t')
+    scaling = compute_scaling(benchmarks)
+    recommendations = recommend_threads(scaling, args.min_efficiency)
+
+    scaling.to_csv(os.path.join(args.output_dir, "scaling.tsv"), sep='\t', index=False)
+    recommendations.to_csv(os.path.join(args.output_dir, "recommended_threads.tsv"), sep='\t', index=False)
+    plot_scaling(scaling, os.path.join(args.output_dir, "scaling.png"))
+
+    print(recommendations.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Shared streaming FASTA/FASTQ helpers used by the scripts of the pipeline.
+
+Files are read by large binary blocks (no per-line `str` handling) and gzipped
+or bgzipped files are handled transparently, both as input and as output.
+When `pigz` or `bgzip` is available, (de)compression is delegated to it so it
+runs in another process and can use several threads.
+"""
+
+import gzip
+import io
+import shutil
+import subprocess
+from collections import namedtuple
+
+# size of the blocks read from the sequence files
+BUFFER_SIZE = 4 * 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# a sequence record. `quality` is None for FASTA records
+SequenceRecord = namedtuple("SequenceRecord", ["header", "sequence", "quality"])
+
+
+class _PipedFile:
+    """
+    File-like object reading from or writing to an external (de)compression
+    process. Closing it waits for the process and raises if it failed.
+    """
+
+    def __init__(self, cmd: list, path: str, mode: str):
+        self.cmd = cmd
+        self.mode = mode
+        if mode == "rb":
+            self._file = open(path, "rb")
+            self.process = subprocess.Popen(cmd, stdin=self._file, stdout=subprocess.PIPE,
+                                            bufsize=BUFFER_SIZE)
+            self._stream = self.process.stdout
+        else:
+            self._file = open(path, "wb")
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self._file,
+                                            bufsize=BUFFER_SIZE)
+            self._stream = self.process.stdin
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def readline(self, size=-1):
+        return self._stream.readline(size)
+
+    def peek(self, size=0):
+        return self._stream.peek(size)
+
+    def write(self, data):
+        return self._stream.write(data)
+
+    def close(self):
+        if self._stream.closed:
+            return
+        self._stream.close()
+        return_code = self.process.wait()
+        self._file.close()
+        # a reader closed before the end makes the decompressor die of SIGPIPE
+        if return_code != 0 and not (self.mode == "rb" and return_code < 0):
+            raise subprocess.CalledProcessError(return_code, self.cmd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def is_gzipped(path: str):
+    """
+    Returns True if `path` is a gzip (or bgzip) file, based on its magic number
+    rather than on its extension
+    """
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def get_compressor(threads: int = 1, compresslevel: int = 6):
+    """
+    Returns the command of the external multi-threaded compressor to use, or None
+    if neither bgzip nor pigz are available (or only one thread is requested).
+    bgzip is preferred since it produces block-compressed files that can be indexed
+    """
+    if threads <= 1:
+        return None
+    if shutil.which("bgzip"):
+        return ["bgzip", "--threads", str(threads), "-l", str(compresslevel), "-c"]
+    if shutil.which("pigz"):
+        return ["pigz", "-p", str(threads), f"-{compresslevel}", "-c"]
+    return None
+
+
+def open_input(path: str, threads: int = 1):
+    """
+    Opens a plain, gzipped or bgzipped file in binary mode for reading
+    """
+    if not is_gzipped(path):
+        return open(path, "rb", buffering=BUFFER_SIZE)
+
+    # decompression in another process frees this one for parsing
+    if threads > 1 and shutil.which("pigz"):
+        return _PipedFile(["pigz", "-dc", "-p", str(threads)], path, "rb")
+
+    return io.BufferedReader(gzip.open(path, "rb"), buffer_size=BUFFER_SIZE)
+
+
+def open_output(path: str, threads: int = 1, compresslevel: int = 6):
+    """
+    Opens a file in binary mode for writing. If `path` ends with ".gz", the data
+    written is compressed, using several threads if `threads` > 1
+    """
+    if not path.endswith(".gz"):
+        return open(path, "wb", buffering=BUFFER_SIZE)
+
+    compressor = get_compressor(threads, compresslevel)
+    if compressor is not None:
+        return _PipedFile(compressor, path, "wb")
+
+    return gzip.open(path, "wb", compresslevel=compresslevel)
+
+
+def copy_sequence_file(src: str, dst: str, threads: int = 1):
+    """
+    Copies `src` to `dst` in a single pass, decompressing `src` if it is gzipped
+    and compressing the copy if `dst` ends with ".gz"
+    """
+    with open_input(src, threads) as infile, open_output(dst, threads) as outfile:
+        shutil.copyfileobj(infile, outfile, BUFFER_SIZE)
+
+
+def detect_format(handle):
+    """
+    Returns 'fasta' or 'fastq' by peeking at the first byte of an opened file
+    """
+    first = handle.peek(1)[:1] if hasattr(handle, "peek") else b""
+
+    if first == b">":
+        return "fasta"
+    elif first == b"@":
+        return "fastq"
+    elif first == b"":
+        # empty file (or non peekable handle): FASTA is the default
+        return "fasta"
+    raise ValueError(f"Unknown sequence format (first byte: {first!r})")
+
+
+def iter_fasta_tokens(handle, buffer_size: int = BUFFER_SIZE):
+    """
+    Low-level FASTA scanner working on blocks of bytes.
+
+    Yields (True, header) for each header line (without '>' and line ending)
+    and (False, data) for each slab of sequence lines, kept as-is (line endings
+    included). Only header lines are ever split out of the blocks, so the
+    sequences are never handled line by line.
+    """
+    leftover = b""
+    line_start = True
+
+    while True:
+        block = handle.read(buffer_size)
+        if not block:
+            break
+        buf = leftover + block if leftover else block
+        leftover = b""
+        pos = 0
+        size = len(buf)
+
+        while pos < size:
+            if line_start and buf[pos] == 62:  # '>'
+                end = buf.find(b"\n", pos)
+                if end == -1:
+                    # header split between two blocks
+                    leftover = buf[pos:]
+                    pos = size
+                    break
+                yield True, buf[pos + 1:end].rstrip(b"\r")
+                pos = end + 1
+                line_start = True
+            else:
+                next_header = buf.find(b"\n>", pos)
+                if next_header == -1:
+                    yield False, buf[pos:] if pos else buf
+                    line_start = buf.endswith(b"\n")
+                    pos = size
+                else:
+                    yield False, buf[pos:next_header + 1]
+                    pos = next_header + 1
+                    line_start = True
+
+    # last header without a line ending
+    if leftover:
+        yield True, leftover[1:].rstrip(b"\r\n")
+
+
+def _sequence_length(data: bytes):
+    """
+    Number of residues in a slab of sequence lines
+    """
+    return len(data) - data.count(b"\n") - data.count(b"\r")
+
+
+def iter_fasta_headers(path: str, threads: int = 1):
+    """
+    Yields the headers (bytes, without '>') of a FASTA file, skipping sequences
+    """
+    with open_input(path, threads) as handle:
+        for is_header, data in iter_fasta_tokens(handle):
+            if is_header:
+                yield data
+
+
+def iter_fasta_lengths(path: str, threads: int = 1):
+    """
+    Yields (header, length) for each sequence of a FASTA file, without ever
+    materializing the sequences
+    """
+    header = None
+    length = 0
+
+    with open_input(path, threads) as handle:
+        for is_header, data in iter_fasta_tokens(handle):
+            if is_header:
+                if header is not None:
+                    yield header, length
+                header = data
+                length = 0
+            elif header is not None:
+                length += _sequence_length(data)
+
+    if header is not None:
+        yield header, length
+
+
+def _iter_fasta_records(handle):
+    header = None
+    parts = []
+
+    for is_header, data in iter_fasta_tokens(handle):
+        if is_header:
+            if header is not None:
+                yield SequenceRecord(header, b"".join(parts).translate(None, b"\r\n"), None)
+            header = data
+            parts = []
+        elif header is not None:
+            parts.append(data)
+
+    if header is not None:
+        yield SequenceRecord(header, b"".join(parts).translate(None, b"\r\n"), None)
+
+
+def _iter_fastq_records(handle):
+    while True:
+        header = handle.readline()
+        if not header:
+            break
+        sequence = handle.readline()
+        handle.readline()  # '+' line
+        quality = handle.readline()
+        if not quality:
+            raise ValueError(f"Truncated FASTQ record: {header!r}")
+        yield SequenceRecord(header[1:].rstrip(b"\r\n"), sequence.rstrip(b"\r\n"),
+                             quality.rstrip(b"\r\n"))
+
+
+def iter_records(path: str, threads: int = 1):
+    """
+    Yields a `SequenceRecord` for each sequence of a FASTA or FASTQ file
+    (plain or gzipped). Only one record is held in memory at a time.
+    """
+    with open_input(path, threads) as handle:
+        if detect_format(handle) == "fastq":
+            yield from _iter_fastq_records(handle)
+        else:
+            yield from _iter_fasta_records(handle)
+
+
+def rewrite_fasta_headers(input_file: str, output_file: str, rename, threads: int = 1):
+    """
+    Copies a FASTA file while applying `rename` (bytes -> bytes) to each header
+    (given without '>'). Sequence lines are copied verbatim. Input and output can
+    be gzipped.
+
+    Returns a dictionary with the number of records, of modified headers and of
+    bases, computed in the same pass
+    """
+    records = 0
+    modified = 0
+    bases = 0
+
+    with open_input(input_file, threads) as infile, open_output(output_file, threads) as outfile:
+        for is_header, data in iter_fasta_tokens(infile):
+            if is_header:
+                records += 1
+                new_header = rename(data)
+                if new_header != data:
+                    modified += 1
+                outfile.write(b">" + new_header + b"\n")
+            else:
+                bases += _sequence_length(data)
+                outfile.write(data)
+
+    return {"records": records, "modified": modified, "bases": bases}
@@ -0,0 +1,113 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import json
+import shutil
+import workflow.scripts.other_scripts.benchmarks_report as br
+
+TEST_DIR = "workflow/scripts/test/data/benchmarks_report"
+BENCHMARKS = os.path.join(TEST_DIR, "benchmarks")
+
+HEADER = "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n"
+ORIGIN = 1_700_000_000
+
+CONFIG = {"assembly": {"megahit": {"threads": 4}}, "bowtie2": {"threads": 4}, "quast": {"threads": 0}}
+
+
+def write_benchmark(path, start, end, cpu_time):
+    path = os.path.join(BENCHMARKS, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(HEADER)
+        f.write(f"{end - start}\t0:00:00\t100.00\t200.00\t90.00\t95.00\t1.00\t2.00\t50.00\t{cpu_time}\n")
+    # the benchmark file is written at the end of the job
+    os.utime(path, (ORIGIN + end, ORIGIN + end))
+
+
+class TestBenchmarksReport(unittest.TestCase):
+
+    def setUp(self):
+        write_benchmark("02_preprocess/fastp/S1.benchmark.txt", 0, 100, 70)
+        write_benchmark("02_preprocess/fastp/S2.benchmark.txt", 0, 300, 210)
+        write_benchmark("03_assembly/megahit/S1.benchmark.txt", 100, 1000, 1800)
+        write_benchmark("03_assembly/megahit/S1.rename.benchmark.txt", 1000, 1100, 100)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_read_rules_threads(self):
+
+        threads = br.read_rules_threads(br.pb.RULES_DIR, CONFIG, cores=3)
+
+        # rules without threads use 1 thread, 0 stands for all the cores
+        self.assertEqual(threads["fastp"], 1)
+        self.assertEqual(threads["quast_qc"], 3)
+        # bounded by the cores of the run
+        self.assertEqual(threads["megahit_assembly"], 3)
+
+    def test_build_report(self):
+
+        jobs, rules, stages = br.build_report(BENCHMARKS, CONFIG, cores=16)
+        jobs = jobs.set_index("path")
+
+        megahit = jobs.loc[os.path.join(BENCHMARKS, "03_assembly/megahit/S1.benchmark.txt")]
+        self.assertEqual((megahit["start"], megahit["end"], megahit["threads"]), (100, 1000, 4))
+        self.assertAlmostEqual(megahit["efficiency"], 0.5)
+        self.assertAlmostEqual(megahit["wasted_cores"], 2)
+
+        # the other sample is not on the critical path
+        self.assertEqual(sorted(jobs.index[jobs["critical_path"]].map(os.path.basename)),
+                         ["S1.benchmark.txt", "S1.benchmark.txt", "S1.rename.benchmark.txt"])
+
+        self.assertEqual(stages["part"].tolist(), ["03_assembly", "02_preprocess"])
+        assembly = stages.set_index("part").loc["03_assembly"]
+        self.assertAlmostEqual(assembly["wall_clock_hours"], 1000 / 3600)
+        self.assertAlmostEqual(assembly["critical_path_hours"], 1000 / 3600)
+
+        provisioning = rules.set_index("rule")["provisioning"]
+        self.assertEqual(provisioning["megahit_fasta_headers_renaming"], "over-provisioned")
+        self.assertEqual(provisioning["fastp"], "ok")
+
+        html_output = os.path.join(TEST_DIR, "report.html")
+        br.write_html_report(jobs.reset_index(), rules, stages, html_output)
+        with open(html_output) as f:
+            self.assertIn("<svg", f.read())
+
+    def test_critical_path_with_dag(self):
+
+        # the rename does not depend on the assembly in this DAG
+        dag = os.path.join(TEST_DIR, "dag.json")
+        with open(dag, "w") as f:
+            json.dump({"nodes": [{"id": i, "value": {"jobid": i, "rule": rule, "label": rule}}
+                                 for i, rule in enumerate(["fastp", "megahit_assembly", "megahit_fasta_headers_renaming"])],
+                       "links": [{"u": 0, "v": 1}, {"u": 0, "v": 2}]}, f)
+
+        jobs, _, _ = br.build_report(BENCHMARKS, CONFIG, cores=16, dag_path=dag)
+
+        self.assertEqual(jobs.loc[jobs["critical_path"], "rule"].tolist(), ["fastp", "megahit_fasta_headers_renaming"])
+
+    def test_critical_path_with_incomplete_dag(self):
+
+        dag = os.path.join(TEST_DIR, "dag.json")
+        default_jobs, _, _ = br.build_report(BENCHMARKS, CONFIG, cores=16)
+
+        # DAG of a completed run written without --forceall: no dependencies
+        with open(dag, "w") as f:
+            json.dump({"nodes": [{"id": 0, "value": {"jobid": 0, "rule": "all", "label": "all"}}], "links": []}, f)
+        jobs, _, _ = br.build_report(BENCHMARKS, CONFIG, cores=16, dag_path=dag)
+        self.assertEqual(jobs["critical_path"].tolist(), default_jobs["critical_path"].tolist())
+
+        # the rename is missing from the DAG, the jobs of its sample can precede it
+        with open(dag, "w") as f:
+            json.dump({"nodes": [{"id": i, "value": {"jobid": i, "rule": rule, "label": rule}}
+                                 for i, rule in enumerate(["fastp", "megahit_assembly"])],
+                       "links": [{"u": 0, "v": 1}]}, f)
+        jobs, _, _ = br.build_report(BENCHMARKS, CONFIG, cores=16, dag_path=dag)
+        self.assertEqual(jobs.loc[jobs["critical_path"], "rule"].tolist(),
+                         ["fastp", "megahit_assembly", "megahit_fasta_headers_renaming"])
+
+
+if __name__ == "__main__":
+    unittest.main()
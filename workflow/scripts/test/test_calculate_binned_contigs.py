@@ -0,0 +1,113 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import pandas as pd
+import workflow.scripts.other_scripts.calculate_binned_contigs as cbc
+import workflow.scripts.contigs_membership as cm
+
+TEST_DIR = "workflow/scripts/test/data/binned_contigs"
+RESULTS = os.path.join(TEST_DIR, "results")
+
+
+def write_fasta(path, contigs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        for name, sequence in contigs:
+            f.write(f">{name}\n{sequence}\n")
+
+
+class TestCalculateBinnedContigs(unittest.TestCase):
+
+    def setUp(self):
+        write_fasta(os.path.join(RESULTS, "03_assembly/megahit/s1/assembly.fa.gz"),
+                    [("c3", "ACGTA"), ("c1", "AC"), ("c2", "ACG"), ("c4", "A")])
+        bins = os.path.join(RESULTS, "07_bins_refinement/binette/megahit/s1/final_bins")
+        # c1 is in two bins, c4 in none
+        write_fasta(os.path.join(bins, "bin_1.fa"), [("c1", "AC"), ("c2", "ACG")])
+        write_fasta(os.path.join(bins, "bin_2.fa"), [("c1", "AC"), ("c3", "ACGTA"), ("unknown", "A")])
+        self.bins = bins
+        with open(os.path.join(os.path.dirname(bins), "final_bins_quality_reports.tsv"), "w") as f:
+            f.write("bin_id\tcompleteness\tcontamination\n1\t95\t1\n2\t60\t2\n")
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_compute_contigs_assignation(self):
+
+        contigs_table = cbc.compute_contigs_assignation_for_an_assembler("megahit", RESULTS, "binette")
+
+        self.assertEqual(contigs_table['contig'].tolist(), ["c1", "c2", "c3", "c4"])
+        self.assertEqual(contigs_table['assigned'].tolist(), [2, 1, 1, 0])
+        self.assertEqual(contigs_table['len'].tolist(), [2, 3, 5, 1])
+        self.assertEqual(contigs_table['assigned'].dtype, "int32")
+        self.assertEqual(contigs_table['sample'].dtype, "category")
+
+        binned_contigs_rate = cbc.calculate_binned_contigs_rate(contigs_table)
+        pd.testing.assert_frame_equal(binned_contigs_rate,
+                                      pd.DataFrame({'sample': ["s1"], 'binned_rate': [75.0]}))
+
+    def write_dereplicated_bins(self):
+        """
+        Keeps only bin_2 after dereplication (its contigs are prefixed with its name) and indexes it
+        """
+        dereplicated = os.path.join(
+            RESULTS, "08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/95/megahit/bins")
+        write_fasta(os.path.join(dereplicated, "bin_2.fa"), [("bin_2_c1", "AC"), ("bin_2_c3", "ACGTA")])
+        unduplicated = os.path.join(RESULTS, "08_bins_postprocessing/genomes_list/megahit/unduplicated.tsv")
+        os.makedirs(os.path.dirname(unduplicated))
+        with open(unduplicated, "w") as f:
+            f.write("path\tfilename\tunambiguous_filename\n")
+            for bin_file in ["bin_1.fa", "bin_2.fa"]:
+                f.write(f"{os.path.join(self.bins, bin_file)}\t{bin_file}\t{bin_file}\n")
+        index = os.path.join(RESULTS, "08_bins_postprocessing/contigs_membership/95/megahit.sqlite")
+        os.makedirs(os.path.dirname(index))
+        cm.build_index([unduplicated], [dereplicated], index)
+        return dereplicated
+
+    def test_compute_contigs_assignation_all_types(self):
+
+        self.write_dereplicated_bins()
+
+        contigs_tables = cbc.compute_contigs_assignation(RESULTS, ["megahit", "metaflye"],
+                                                         ["binette", "dereplicated_and_filtered"],
+                                                         ani="95", cpu=2)
+
+        self.assertEqual(sorted(contigs_tables), [("megahit", "binette"), ("megahit", "dereplicated_and_filtered")])
+        self.assertEqual(contigs_tables[("megahit", "binette")]['assigned'].tolist(), [2, 1, 1, 0])
+        self.assertEqual(contigs_tables[("megahit", "dereplicated_and_filtered")]['assigned'].tolist(), [1, 0, 1, 0])
+
+    def test_unindexed_dereplicated_bin(self):
+
+        dereplicated = self.write_dereplicated_bins()
+        # a bin added after the index was built can't be linked to its sample
+        write_fasta(os.path.join(dereplicated, "bin_3.fa"), [("bin_3_c4", "A")])
+
+        with self.assertRaisesRegex(ValueError, "bin_3.fa"):
+            cbc.list_dereplicated_bins_by_sample(RESULTS, "megahit", "95")
+
+    def test_length_weighted_stats(self):
+
+        contigs_table = cbc.compute_contigs_assignation_for_an_assembler("megahit", RESULTS, "binette")
+
+        # c1 and c2 are in the high quality bin, c3 only in the medium quality one
+        self.assertEqual(contigs_table['quality_tier'].tolist(), ["high", "high", "medium", "unbinned"])
+
+        stats = cbc.calculate_binned_bases_stats(contigs_table).iloc[0]
+        self.assertEqual(stats['bases'], 11)
+        self.assertEqual(stats['binned_bases'], 10)
+        self.assertEqual(stats['n50'], 3)
+        self.assertEqual(stats['binned_n50'], 5)
+        self.assertEqual((stats['binned_bases_high'], stats['binned_bases_medium'], stats['binned_bases_low']),
+                         (5, 5, 0))
+
+        by_length = cbc.calculate_binned_rate_by_length(contigs_table, length_buckets=[2, 4])
+        self.assertEqual(by_length['length_class'].tolist(), ["<2", "2-4", ">=4"])
+        self.assertEqual(by_length['binned_rate'].tolist(), [0.0, 100.0, 100.0])
+        self.assertEqual(by_length['bases'].tolist(), [1, 5, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
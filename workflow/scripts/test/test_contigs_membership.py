@@ -0,0 +1,99 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import workflow.scripts.contigs_membership as cm
+
+TEST_DIR = "workflow/scripts/test/data/contigs_membership"
+RESULTS = os.path.join(TEST_DIR, "results")
+
+
+def write_fasta(path, headers):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        for header in headers:
+            f.write(f">{header}\nACGT\n")
+
+
+class TestContigsMembership(unittest.TestCase):
+
+    def setUp(self):
+        # two samples binned with Binette, both with a "bin.1.fa" bin
+        bin_s1 = os.path.join(RESULTS, "07_bins_refinement/binette/megahit/s1/final_bins/bin.1.fa")
+        bin_s2 = os.path.join(RESULTS, "07_bins_refinement/binette/megahit/s2/final_bins/bin.1.fa")
+        write_fasta(bin_s1, ["k141_1 flag=1", "k141_2"])
+        write_fasta(bin_s2, ["k141_1", "k141_7"])
+
+        self.unduplicated = os.path.join(RESULTS, "08_bins_postprocessing/genomes_list/megahit/unduplicated.tsv")
+        os.makedirs(os.path.dirname(self.unduplicated))
+        with open(self.unduplicated, "w") as f:
+            f.write("path\tfilename\tunambiguous_filename\n")
+            f.write(f"{bin_s1}\tbin.1.fa\tbin.1.fa\n")
+            f.write(f"{bin_s2}\tbin.1.fa\tbin.1_1.fa\n")
+
+        # only the bin of the second sample is kept after dereplication (and renamed)
+        self.dereplicated = os.path.join(
+            RESULTS, "08_bins_postprocessing/dereplicated_genomes_filtered_by_quality/95/megahit/bins")
+        write_fasta(os.path.join(self.dereplicated, "bin.1_1.fa"), ["bin_k141_1", "bin_k141_7"])
+
+        self.index = os.path.join(TEST_DIR, "index.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_parse_refined_bin_path(self):
+
+        self.assertEqual(
+            cm.parse_refined_bin_path("results/05_binning/metabat2/bins/megahit/s1/bins/bin.3.fa.gz"),
+            {"binner": "metabat2", "assembler": "megahit", "sample": "s1"})
+        self.assertEqual(
+            cm.parse_refined_bin_path("somewhere/else/bin.3.fa"),
+            {"binner": None, "assembler": None, "sample": None})
+
+    def test_build_and_query(self):
+
+        cm.build_index([self.unduplicated], [self.dereplicated], self.index, cpu=2)
+        conn = cm.open_index(self.index)
+
+        # the same contig name is found in both samples
+        rows = cm.lookup_contig(conn, "k141_1")
+        self.assertEqual(sorted((r["sample"], r["dereplicated_bin"]) for r in rows),
+                         [("s1", None), ("s2", "bin.1_1")])
+        self.assertEqual(cm.lookup_contig(conn, "k141_1", sample="s2")[0]["ani"], "95")
+
+        self.assertEqual(cm.binned_contigs(conn, "megahit", "s1"),
+                         {"k141_1": "bin.1.fa", "k141_2": "bin.1.fa"})
+        self.assertEqual(cm.bins_samples(conn, "megahit"), {"bin.1.fa": "s1", "bin.1_1.fa": "s2"})
+
+        # contigs are named as in the dereplicated bins
+        self.assertEqual(list(cm.iter_scaffolds_to_bin(conn, 95, "megahit")),
+                         [("bin_k141_1", "bin.1_1.fa"), ("bin_k141_7", "bin.1_1.fa")])
+        conn.close()
+
+    def test_partially_prefixed_bin(self):
+
+        # only one contig of the refined bin happens to start with the prefix of the bin,
+        # so the bin was renamed as a whole
+        write_fasta(os.path.join(RESULTS, "07_bins_refinement/binette/megahit/s2/final_bins/bin.1.fa"),
+                    ["bin_k141_1", "k141_7"])
+
+        cm.build_index([self.unduplicated], [self.dereplicated], self.index)
+        conn = cm.open_index(self.index)
+        self.assertEqual(list(cm.iter_scaffolds_to_bin(conn, 95, "megahit")),
+                         [("bin_bin_k141_1", "bin.1_1.fa"), ("bin_k141_7", "bin.1_1.fa")])
+        conn.close()
+
+    def test_unknown_dereplicated_bin(self):
+
+        write_fasta(os.path.join(self.dereplicated, "other.fa"), ["other_c1"])
+
+        with self.assertRaises(ValueError):
+            cm.build_index([self.unduplicated], [self.dereplicated], self.index)
+        self.assertFalse(os.path.exists(self.index))
+        self.assertFalse(os.path.exists(f"{self.index}.tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
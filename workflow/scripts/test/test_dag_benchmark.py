@@ -0,0 +1,72 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import re
+import shutil
+import pandas as pd
+import workflow.scripts.other_scripts.dag_benchmark as db
+import workflow.rules.utils as utils
+
+TEST_DIR = "workflow/scripts/test/data/dag_benchmark"
+
+DRY_RUN_OUTPUT = """Building DAG of jobs...
+Job stats:
+job                  count
+-----------------  -------
+all                      1
+fastp                  100
+reads_mapping          300
+total                  401
+
+This was a dry-run (flag -n). The order of jobs does not reflect the order of execution.
+"""
+
+
+class TestDagBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+        utils.load_sample_sheet.cache_clear()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_write_samples_table(self):
+
+        table = db.write_samples_table(5, TEST_DIR)
+
+        sample_sheet = utils.load_sample_sheet(table)
+        self.assertEqual(len(sample_sheet.samples), 5)
+        self.assertEqual(sample_sheet.samples_lr, sample_sheet.samples)
+        self.assertTrue(os.path.exists(sample_sheet.fastq_pair("SYN000004")[1]))
+
+        table = db.write_samples_table(3, os.path.join(TEST_DIR, "sr"), long_reads=False)
+        self.assertEqual(set(pd.read_csv(table, sep="\t")["type"]), {"R1", "R2"})
+
+    def test_parse_job_table(self):
+
+        self.assertEqual(db.parse_job_table(DRY_RUN_OUTPUT), {"all": 1, "fastp": 100, "reads_mapping": 300})
+
+    def test_samples_constraints_match_the_same_samples(self):
+
+        samples = utils.load_sample_sheet(db.write_samples_table(1000, TEST_DIR)).samples
+        # names found in the paths of the pipeline next to sample names
+        others = ["SYN001000", "SYN00001", "SYN000001.LR", "SYN000001_1", "megahit", ""]
+
+        for mode in db.MODES:
+            constraint = re.compile(utils.samples_constraint({"sample_constraints": mode}, samples))
+            self.assertTrue(all(constraint.fullmatch(sample) for sample in samples))
+            if mode != "pattern":
+                self.assertFalse(any(constraint.fullmatch(name) for name in others))
+
+        pattern = re.compile(utils.samples_constraint({"sample_constraints": "pattern"}, samples))
+        self.assertFalse(pattern.fullmatch("SYN000001.LR"))
+
+        with self.assertRaises(ValueError):
+            utils.samples_constraint({"sample_constraints": "set"}, samples)
+
+
+if __name__ == "__main__":
+    unittest.main()
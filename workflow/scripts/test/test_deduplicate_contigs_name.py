@@ -76,6 +76,58 @@ class TestDeduplicateContigsName(unittest.TestCase):
             if filename.endswith(".fa"):
                 os.remove(os.path.join(FASTA_DIR, filename))
 
+    def test_rename_fasta_headers_parallel_and_idempotent(self):
+
+        rerun_dir = "workflow/scripts/test/data/assembly_rerun"
+        os.makedirs(rerun_dir, exist_ok=True)
+
+        for filename in os.listdir(FASTA_DIR):
+            if filename.endswith(".fna"):
+                src = os.path.join(FASTA_DIR, filename)
+                dst = os.path.join(rerun_dir, os.path.splitext(filename)[0] + ".fa")
+
+                with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                    fdst.write(fsrc.read())
+
+        # the manifest is stored next to the folder, which only holds bins
+        manifest = f"{rerun_dir}_manifest.tsv"
+
+        # running twice (in parallel) must not prefix the headers twice
+        for _ in range(2):
+            dcn.rename_fasta_headers(dcn.list_fasta(rerun_dir), cpu=2, manifest=manifest)
+
+        output_file = os.path.join(rerun_dir, "before_deduplicate_contigs_name2.fa")
+        with open(output_file, "r") as f:
+            headers = [line.strip() for line in f if line.startswith(">")]
+
+        self.assertListEqual(
+            headers,
+            [
+                ">before_deduplicate_contigs_name2_contig A",
+                ">before_deduplicate_contigs_name2_contig B",
+            ],
+        )
+
+        # without the manifest, the headers check alone prevents a second prefix
+        os.remove(manifest)
+        dcn.rename_fasta_headers(dcn.list_fasta(rerun_dir))
+
+        with open(output_file, "r") as f:
+            headers_after_rerun = [line.strip() for line in f if line.startswith(">")]
+
+        self.assertListEqual(headers_after_rerun, headers)
+
+        # no temporary file nor manifest is left in the folder
+        self.assertSetEqual(
+            set(os.listdir(rerun_dir)),
+            {"before_deduplicate_contigs_name.fa", "before_deduplicate_contigs_name2.fa"},
+        )
+
+        # cleaning up the test files
+        for filename in os.listdir(rerun_dir):
+            os.remove(os.path.join(rerun_dir, filename))
+        os.rmdir(rerun_dir)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,95 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import sys
+import shutil
+import hashlib
+import subprocess
+import numpy as np
+import workflow.scripts.depth_to_vamb_abundance as dva
+import workflow.rules.utils as utils
+
+TEST_DIR = "workflow/scripts/test/data/depth_to_vamb_abundance"
+
+DEPTH_TABLE = (
+    "contigName\tcontigLen\ttotalAvgDepth\tS1.sorted.bam\tS1.sorted.bam-var\n"
+    "k141_1\t5000\t12.5\t12.5\t3.1\n"
+    "k141_2\t200\t4\t4\t0.5\n"
+    "k141_3\t250\t7.25\t7.25\t1.2\n"
+)
+
+
+class TestDepthToVambAbundance(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+        self.depth_path = os.path.join(TEST_DIR, "S1.depth_matrix.tab")
+        with open(self.depth_path, "w") as f:
+            f.write(DEPTH_TABLE)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_depth_to_abundance(self):
+
+        abundance = dva.depth_to_abundance(dva.read_depth_table(self.depth_path), min_length=250)
+
+        # contigs shorter than the minimum length of VAMB are left out
+        self.assertEqual(abundance['matrix'].dtype, np.float32)
+        np.testing.assert_array_equal(abundance['matrix'], np.array([[12.5], [7.25]], dtype=np.float32))
+        self.assertEqual(list(abundance['samplenames']), ["S1.sorted.bam"])
+        self.assertEqual(abundance['refhash'].item(), hashlib.md5(b"k141_1k141_3").digest())
+
+    def test_hash_of_the_contigs_kept_by_vamb(self):
+
+        # assembly the depth table was computed on, in the same order
+        assembly = os.path.join(TEST_DIR, "assembly.fa")
+        with open(assembly, "w") as f:
+            for name, length in [("k141_1 flag=1", 5000), ("k141_2", 200), ("k141_3 flag=0", 250)]:
+                f.write(f">{name}\n{'A' * length}\n")
+
+        for min_length in [250, dva.VAMB_MIN_CONTIG_LENGTH]:
+            # VAMB hashes the identifiers of the contigs of the assembly at least -m bp long
+            hasher = hashlib.md5()
+            with open(assembly) as f:
+                records = f.read().split(">")[1:]
+            kept = 0
+            for record in records:
+                header, sequence = record.split("\n", 1)
+                if len(sequence.replace("\n", "")) >= min_length:
+                    hasher.update(header.split()[0].encode().rstrip())
+                    kept += 1
+
+            abundance = dva.depth_to_abundance(dva.read_depth_table(self.depth_path), min_length=min_length)
+            self.assertEqual(abundance['refhash'].item(), hasher.digest())
+            self.assertEqual(abundance['matrix'].shape[0], kept)
+
+        # VAMB and the abundance file get the same minimum length from the config
+        self.assertEqual(utils.vamb_min_contig_length({}), dva.VAMB_MIN_CONTIG_LENGTH)
+        self.assertEqual(utils.vamb_min_contig_length({"binning": {"vamb": {"min_contig_length": 1500}}}), 1500)
+
+    def test_not_a_depth_table(self):
+
+        with open(self.depth_path, "w") as f:
+            f.write("contig\tdepth\nk141_1\t12.5\n")
+
+        with self.assertRaises(ValueError):
+            dva.read_depth_table(self.depth_path)
+
+    def test_abundance_file(self):
+
+        output = os.path.join(TEST_DIR, "S1.abundance.npz")
+        subprocess.run([sys.executable, "workflow/scripts/depth_to_vamb_abundance.py", "--depth", self.depth_path,
+                        "--min_length", "100", "--output", output], check=True, capture_output=True)
+
+        # loaded the way VAMB loads it
+        arrays = np.load(output, allow_pickle=True)
+        self.assertEqual(arrays["matrix"].shape, (3, 1))
+        self.assertAlmostEqual(arrays["minid"].item(), 0.97)
+        self.assertEqual(arrays["refhash"].item(), hashlib.md5(b"k141_1k141_2k141_3").digest())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import workflow.rules.utils as utils
+
+
+class TestMappingOptions(unittest.TestCase):
+
+    def test_mapping_option(self):
+
+        config = {"mapping": {"mode": "sam", "sort_threads": 0}}
+
+        self.assertFalse(utils.streaming_mapping(config))
+        # given values are kept, even if false
+        self.assertEqual(utils.mapping_option(config, "sort_threads"), 0)
+        # others get their default value
+        self.assertEqual(utils.mapping_option(config, "sort_memory_per_thread"), "768M")
+        self.assertTrue(utils.streaming_mapping({}))
+
+        with self.assertRaises(ValueError):
+            utils.streaming_mapping({"mapping": {"mode": "bam"}})
+
+    def test_sort_tmp_prefix(self):
+
+        bam = "results/05_binning/minimap2/{assembler_sr}/{sample}.sorted.bam"
+
+        self.assertEqual(utils.sort_tmp_prefix({}, bam), bam + ".tmp")
+        self.assertEqual(utils.sort_tmp_prefix({"mapping": {"tmp_dir": "/scratch"}}, bam),
+                         "/scratch/results_05_binning_minimap2_{assembler_sr}_{sample}.sorted.bam.tmp")
+
+    def test_hybrid_mapping_threads(self):
+
+        # 8 threads of minimap2 and 2 threads of samtools sort for each mapping
+        self.assertEqual(utils.hybrid_mapping_threads(16 + 2 * 2, 2), (8, 2))
+        # samtools sort gets fewer threads than minimap2
+        self.assertEqual(utils.hybrid_mapping_threads(4, 2), (1, 1))
+        self.assertEqual(utils.hybrid_mapping_threads(1, 2), (1, 0))
+
+    def test_long_read_preset(self):
+
+        self.assertEqual(utils.long_read_preset({"lr_technology": "pacbio-hifi"}), "map-hifi")
+        self.assertEqual(utils.long_read_preset({"lr_technology": "illumina"}), "")
+        self.assertEqual(utils.long_read_preset({}), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@
 
 import unittest
 import hashlib
+import gzip
 import os
 import workflow.scripts.megahit_fasta_header_rename as mfh
 
@@ -52,6 +53,25 @@ class TestMegahitFastaHeaderRename(unittest.TestCase):
         # clean up the output file after the test
         os.remove(output_file)
 
+    def test_replace_spaces_in_fasta_gzipped_output(self):
+
+        output_file = (
+            "workflow/scripts/test/data/assembly/after_deduplicate_contigs_name.fna.gz"
+        )
+
+        # the output is compressed in the same pass and the assembly stats are returned
+        stats = mfh.replace_spaces_in_fasta(TEST_ASSEMBLY, output_file, threads=2)
+
+        self.assertEqual(stats["records"], 3)
+        self.assertEqual(stats["bases"], 54)
+
+        with gzip.open(output_file, "rt") as f:
+            sequence_names = [line.strip()[1:] for line in f if line.startswith(">")]
+
+        self.assertEqual(sequence_names, ["contig.A", "contig.B", "contig.C"])
+
+        os.remove(output_file)
+
 
 if __name__ == "__main__":
     unittest.main()
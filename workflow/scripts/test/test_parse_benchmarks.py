@@ -0,0 +1,144 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import importlib.util
+import pandas as pd
+import workflow.scripts.other_scripts.parse_benchmarks as pb
+
+TEST_DIR = "workflow/scripts/test/data/parse_benchmarks"
+BENCHMARKS = os.path.join(TEST_DIR, "benchmarks")
+
+HEADER = "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n"
+
+
+def write_benchmark(path, seconds, cpu_time="6.10"):
+    path = os.path.join(BENCHMARKS, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(HEADER)
+        f.write(f"{seconds}\t0:00:12\t100.25\t200.50\t90.00\t95.00\t1.00\t2.00\t50.00\t{cpu_time}\n")
+
+
+class TestParseBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        write_benchmark("03_assembly/megahit/S1.benchmark.txt", 12.5)
+        write_benchmark("03_assembly/megahit/S1.rename.benchmark.txt", 1.5)
+        write_benchmark("04_assembly_qc/gene_calling/megahit.benchmark.txt", 3.0, cpu_time="-")
+        # a benchmark left by an older version of the pipeline
+        write_benchmark("03_assembly/old_assembler/S2.benchmark.txt", 4.0)
+        self.patterns = pb.read_benchmark_patterns()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_match_benchmark_path(self):
+
+        self.assertEqual(pb.match_benchmark_path("benchmarks/03_assembly/megahit/S1.rename.benchmark.txt", self.patterns),
+                         ("megahit_fasta_headers_renaming", {"sample": "S1"}))
+        self.assertEqual(pb.match_benchmark_path("/data/benchmarks/02_preprocess/fastqc/S1.R1.benchmark.txt", self.patterns)[1],
+                         {"sample": "S1", "read": "R1"})
+        self.assertEqual(pb.match_benchmark_path("benchmarks/unknown/S1.txt", self.patterns), (None, {}))
+
+    def test_concatenate_benchmarks(self):
+
+        tables = sorted(pb.list_tables(BENCHMARKS))
+        df = pb.concatenate_benchmarks(tables, cpu=2, patterns=self.patterns)
+
+        self.assertEqual(df.columns.tolist()[:2], ["s", "h:m:s"])
+        self.assertEqual(df.columns.tolist()[-5:], ["sample", "path", "part", "tool", "rule"])
+        df = df.set_index("path")
+
+        megahit = df.loc[os.path.join(BENCHMARKS, "03_assembly/megahit/S1.benchmark.txt")]
+        self.assertEqual((megahit["sample"], megahit["rule"], megahit["s"]), ("S1", "megahit_assembly", 12.5))
+        self.assertEqual((megahit["part"], megahit["tool"]), ("03_assembly", "megahit"))
+
+        # rules without a sample wildcard are global
+        gene_calling = df.loc[os.path.join(BENCHMARKS, "04_assembly_qc/gene_calling/megahit.benchmark.txt")]
+        self.assertEqual(gene_calling["sample"], "global")
+        self.assertTrue(gene_calling["cpu_time"] != gene_calling["cpu_time"])
+
+        # paths matching no rule are parsed as before
+        self.assertEqual(df.loc[os.path.join(BENCHMARKS, "03_assembly/old_assembler/S2.benchmark.txt"), "sample"], "S2")
+
+    def test_split_cached_tables(self):
+
+        tables = sorted(pb.list_tables(BENCHMARKS))
+        cached_df = pb.concatenate_benchmarks(tables, patterns=self.patterns)
+        cached_df["mtime_ns"] = cached_df["path"].map(lambda path: os.stat(path).st_mtime_ns)
+
+        # one file is modified, one is added
+        modified = os.path.join(BENCHMARKS, "03_assembly/megahit/S1.benchmark.txt")
+        write_benchmark("03_assembly/megahit/S1.benchmark.txt", 20.0)
+        os.utime(modified, ns=(1, 1))
+        write_benchmark("03_assembly/metaflye/S1.benchmark.txt", 30.0)
+
+        kept_df, to_read, _ = pb.split_cached_tables(sorted(pb.list_tables(BENCHMARKS)), cached_df)
+        self.assertEqual(sorted(to_read), [modified, os.path.join(BENCHMARKS, "03_assembly/metaflye/S1.benchmark.txt")])
+        self.assertEqual(len(kept_df), 3)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is needed for the cache")
+    def test_concatenate_benchmarks_incrementally(self):
+
+        cache = os.path.join(TEST_DIR, "benchmarks.parquet")
+        first = pb.concatenate_benchmarks_incrementally(pb.list_tables(BENCHMARKS), cache, patterns=self.patterns)
+
+        write_benchmark("03_assembly/metaflye/S1.benchmark.txt", 30.0)
+        second = pb.concatenate_benchmarks_incrementally(pb.list_tables(BENCHMARKS), cache, patterns=self.patterns)
+
+        self.assertEqual(len(second), len(first) + 1)
+        self.assertNotIn("mtime_ns", second.columns)
+
+
+class TestCompareBenchmarks(unittest.TestCase):
+
+    def jobs(self, rule, times, repeats=1, max_rss=100.0):
+        # one row by run of each job (one job by sample)
+        return pd.DataFrame([{"rule": rule, "part": "03_assembly", "tool": "megahit", "sample": f"S{i}",
+                              "s": s * (1 + 0.01 * repeat), "max_rss": max_rss, "io_in": 1.0, "io_out": 2.0}
+                             for i, s in enumerate(times) for repeat in range(repeats)])
+
+    def test_regression_above_noise(self):
+
+        baseline = self.jobs("megahit_assembly", [100, 200], repeats=3)
+        candidate = self.jobs("megahit_assembly", [130, 260], repeats=3)
+
+        comparison = pb.compare_benchmarks(baseline, candidate).set_index("metric")
+        self.assertAlmostEqual(comparison.loc["s", "relative_delta"], 0.3)
+        self.assertEqual(comparison.loc["s", "repeats"], 3)
+        self.assertTrue(comparison.loc["s", "regression"])
+        self.assertFalse(comparison.loc["max_rss", "regression"])
+
+        # a higher threshold accepts the increase
+        comparison = pb.compare_benchmarks(baseline, candidate, threshold=0.5)
+        self.assertFalse(comparison["regression"].any())
+
+    def test_increase_within_noise(self):
+
+        # the runs of each job vary by 50%
+        baseline = pd.concat([self.jobs("megahit_assembly", [100, 200]), self.jobs("megahit_assembly", [200, 400])])
+        candidate = pd.concat([self.jobs("megahit_assembly", [120, 240]), self.jobs("megahit_assembly", [300, 600])])
+
+        comparison = pb.compare_benchmarks(baseline, candidate).set_index("metric")
+        self.assertGreater(comparison.loc["s", "relative_delta"], 0.1)
+        self.assertFalse(comparison.loc["s", "significant"])
+        self.assertFalse(comparison.loc["s", "regression"])
+
+    def test_jobs_aligned(self):
+
+        # a job only found in one run is ignored, small rules are never regressions
+        baseline = pd.concat([self.jobs("megahit_assembly", [100]), self.jobs("fastp", [0.1])])
+        candidate = pd.concat([self.jobs("megahit_assembly", [100, 500]), self.jobs("fastp", [0.5])])
+
+        comparison = pb.compare_benchmarks(baseline, candidate, metrics=["s"]).set_index("rule")
+        self.assertEqual(comparison.loc["megahit_assembly", "jobs"], 1)
+        self.assertEqual(comparison.loc["megahit_assembly", "delta"], 0)
+        self.assertTrue(pd.isna(comparison.loc["fastp", "z_score"]))
+        self.assertFalse(comparison["regression"].any())
+
+
+if __name__ == "__main__":
+    unittest.main()
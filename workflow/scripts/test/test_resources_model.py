@@ -0,0 +1,117 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import workflow.scripts.other_scripts.resources_model as rm
+import workflow.rules.utils as utils
+
+TEST_DIR = "workflow/scripts/test/data/resources_model"
+
+
+class TestResourcesModel(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+        utils.read_samples_input_size.cache_clear()
+        utils.load_resources_model.cache_clear()
+
+        # samples of 1, 2 and 4 GB
+        self.samples_input_size = {"s1": 1e9, "s2": 2e9, "s3": 4e9}
+        self.benchmarks = pd.DataFrame({
+            "rule": ["metaspades_assembly"] * 3 + ["genomes_dereplication"] * 2 + [np.nan],
+            "sample": ["s1", "s2", "s3", "global", "global", "s1"],
+            "max_rss": [1000.0, 2100.0, 3900.0, 500.0, 800.0, 10.0],
+            "s": [600.0, 1200.0, 2400.0, 60.0, 120.0, 1.0],
+            "io_out": [100.0, 200.0, 400.0, 10.0, np.nan, 1.0],
+        })
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_fit_resources_model(self):
+
+        model = rm.fit_resources_model(self.benchmarks, self.samples_input_size, margin=1.0)
+
+        self.assertEqual(sorted(model), ["genomes_dereplication", "metaspades_assembly"])
+        self.assertEqual(model["metaspades_assembly"]["jobs"], 3)
+
+        # every observed job is covered by the line
+        memory = model["metaspades_assembly"]["mem_mb"]
+        for sample, max_rss in zip(["s1", "s2", "s3"], [1000.0, 2100.0, 3900.0]):
+            self.assertGreaterEqual(utils.predict_resource(memory, self.samples_input_size[sample]), max_rss - 1e-6)
+        self.assertAlmostEqual(model["metaspades_assembly"]["runtime"]["slope"], 10.0)
+
+        # rules run for all samples get the maximal value
+        self.assertEqual(model["genomes_dereplication"]["mem_mb"], {"intercept": 800.0, "slope": 0.0})
+        self.assertEqual(model["genomes_dereplication"]["disk_mb"], {"intercept": 10.0, "slope": 0.0})
+
+    def test_rule_resources(self):
+
+        samples = os.path.join(TEST_DIR, "samples.tsv")
+        fastq = os.path.join(TEST_DIR, "s1_1.fastq.gz")
+        with open(fastq, "wb") as f:
+            f.write(b"@" * 1000)
+        with open(samples, "w") as f:
+            f.write(f"sample\tsample_id\ttype\n{fastq}\ts1\tR1\n{TEST_DIR}/missing.fastq.gz\ts1\tR2\n")
+
+        model = os.path.join(TEST_DIR, "model.yaml")
+        rm.write_resources_model({"metaspades_assembly": {"jobs": 3, "mem_mb": {"intercept": 100.0, "slope": 1e9}}},
+                                 model, 1.0)
+        config = {"samples": samples, "resources": {"model": model, "attempt_factor": 2}}
+
+        resources = utils.rule_resources(config, "metaspades_assembly")
+        self.assertEqual(sorted(resources), ["mem_mb"])
+        # 100 MB + 1e9 MB by GB for 1000 bytes, doubled at the second attempt
+        self.assertEqual(resources["mem_mb"](SimpleNamespace(sample="s1"), 1), 1100)
+        self.assertEqual(resources["mem_mb"](SimpleNamespace(sample="s1"), 2), 2200)
+        # the FASTQ sizes are read once for all the jobs
+        self.assertEqual(utils.read_samples_input_size.cache_info().misses, 1)
+
+        # modeled disk_mb are bounded by the concurrent write cap, the model takes precedence over the estimates
+        rm.write_resources_model({"bam_sorting": {"jobs": 3, "disk_mb": {"intercept": 50000.0, "slope": 0.0}}}, model, 1.0)
+        utils.load_resources_model.cache_clear()
+        config["resources"]["concurrent_write_cap_mb"] = 20000
+        resources = utils.rule_resources(config, "bam_sorting", disk_mb=utils.mapping_disk_mb(config, "sorting"))
+        self.assertEqual(resources["disk_mb"](SimpleNamespace(sample="s1"), 1), 20000)
+        config["resources"]["concurrent_write_cap_mb"] = None
+
+        # without a model, Snakemake defaults are kept
+        self.assertEqual(utils.rule_resources(config, "megahit_assembly"), {})
+        self.assertEqual(utils.rule_resources({"samples": samples}, "metaspades_assembly"), {})
+
+    def test_concurrent_write_cap(self):
+
+        config = {"resources": {"model": None, "concurrent_write_cap_mb": 20000}}
+
+        self.assertEqual(utils.concurrent_write_cap(config), 20000)
+        self.assertEqual(utils.intermediates_priority(config), utils.INTERMEDIATES_PRIORITY)
+        # no cap: the rules consuming temporary files keep the default priority
+        self.assertIsNone(utils.concurrent_write_cap({"resources": {"concurrent_write_cap_mb": None}}))
+        self.assertEqual(utils.intermediates_priority({}), 0)
+
+        with self.assertRaises(ValueError):
+            utils.concurrent_write_cap({"resources": {"concurrent_write_cap_mb": 0}})
+
+    def test_mapping_disk_mb(self):
+
+        config = {"resources": {"model": None, "concurrent_write_cap_mb": 20000}}
+        input = SimpleNamespace(size_mb=3000)
+
+        # a SAM is about 5 times larger than the gzipped reads, at least 1000 MB are asked for
+        self.assertEqual(utils.mapping_disk_mb({}, "sam")(SimpleNamespace(), input), 15000)
+        self.assertEqual(utils.mapping_disk_mb({}, "bam")(SimpleNamespace(), SimpleNamespace(size_mb=10)), 1000)
+        # never more than the whole cap
+        self.assertEqual(utils.mapping_disk_mb(config, "sam")(SimpleNamespace(), SimpleNamespace(size_mb=5000)), 20000)
+
+        # the estimate is used when there is no model for the rule
+        resources = utils.rule_resources(config, "reads_mapping", disk_mb=utils.mapping_disk_mb(config, "sorting"))
+        self.assertEqual(resources["disk_mb"](SimpleNamespace(), input), 6000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import pandas as pd
+import workflow.rules.utils as utils
+
+TEST_DIR = "workflow/scripts/test/data/sample_sheet"
+
+
+def write_samples_table(name, rows):
+    path = os.path.join(TEST_DIR, name)
+    with open(path, "w") as f:
+        f.write("sample\tsample_id\ttype\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+    return path
+
+
+class TestSampleSheet(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+        utils.load_sample_sheet.cache_clear()
+
+        self.samples_table = write_samples_table("samples.tsv", [
+            ("data/S2_1.fastq.gz", "S2", "R1"),
+            ("data/S2_2.fastq.gz", "S2", "R2"),
+            ("data/S1_1.fastq.gz", "S1", "R1"),
+            ("data/S1_2.fastq.gz", "S1", "R2"),
+            ("data/S1_long.fastq.gz", "S1", "long"),
+            ("data/S3_long.fastq.gz", "S3", "long"),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_lookups(self):
+
+        sample_sheet = utils.load_sample_sheet(self.samples_table)
+
+        # samples are kept in the order of the table
+        self.assertEqual(sample_sheet.samples, ["S2", "S1"])
+        self.assertEqual(sample_sheet.samples_lr, ["S1", "S3"])
+        self.assertEqual(sample_sheet.fastq_pair("S1"), ("data/S1_1.fastq.gz", "data/S1_2.fastq.gz"))
+        self.assertEqual(sample_sheet.fastq_long_read("S3"), "data/S3_long.fastq.gz")
+        self.assertEqual(len(sample_sheet.all_fastq()), 6)
+
+        with self.assertRaises(ValueError):
+            sample_sheet.fastq_pair("S3")
+
+        # parsed once, and the lists given to the rule modules can be modified
+        samples = utils.read_table(self.samples_table)
+        samples.append("S3")
+        self.assertIs(utils.load_sample_sheet(self.samples_table), sample_sheet)
+        self.assertEqual(utils.read_table(self.samples_table), ["S2", "S1"])
+
+    def test_invalid_tables(self):
+
+        unpaired = write_samples_table("unpaired.tsv", [("data/S1_1.fastq.gz", "S1", "R1")])
+        unknown_type = write_samples_table("unknown_type.tsv", [("data/S1_1.fastq.gz", "S1", "R3")])
+        duplicated = write_samples_table("duplicated.tsv", [("data/S1_long.fastq.gz", "S1", "long"),
+                                                            ("data/S1_long2.fastq.gz", "S1", "long")])
+
+        for table in [unpaired, unknown_type, duplicated]:
+            with self.assertRaises(ValueError):
+                utils.SampleSheet(table)
+
+    def test_validate_assemblers(self):
+
+        df = utils.load_sample_sheet(self.samples_table).df
+        utils.validate_assemblers(df, ["megahit", "metaflye", "hybridspades"])
+
+        # no sample has both small and long reads
+        df = df[~((df["sample_id"] == "S1") & (df["type"] == "long"))]
+        utils.validate_assemblers(df, ["megahit", "metaflye"])
+        with self.assertRaises(ValueError):
+            utils.validate_assemblers(df, ["hybridspades"])
+
+        long_reads_only = pd.DataFrame({"sample": ["a.fastq.gz"], "sample_id": ["S1"], "type": ["long"]})
+        with self.assertRaises(ValueError):
+            utils.validate_assemblers(long_reads_only, ["metaspades"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import gzip
+import io
+import os
+import workflow.scripts.sequence_io as sio
+
+TEST_ASSEMBLY = (
+    "workflow/scripts/test/data/assembly/before_deduplicate_contigs_name.fna"
+)
+TEST_GZIPPED_BIN = "workflow/scripts/test/data/bins_for_renaming/a.fa.gz"
+OUTPUT_DIR = "workflow/scripts/test/data/sequence_io"
+
+
+class TestSequenceIO(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    def tearDown(self):
+        for f in os.listdir(OUTPUT_DIR):
+            os.remove(os.path.join(OUTPUT_DIR, f))
+        os.rmdir(OUTPUT_DIR)
+
+    def test_iter_fasta_tokens_any_buffer_size(self):
+
+        fasta = b">c1 a\nACGT\nAC\n>c2\n\n>c3\nA\nCGT"
+
+        # whatever the block size, joining the tokens back gives the original file
+        for buffer_size in [1, 2, 3, 5, 64]:
+            tokens = list(sio.iter_fasta_tokens(io.BytesIO(fasta), buffer_size))
+            rebuilt = b"".join(b">" + data + b"\n" if is_header else data
+                               for is_header, data in tokens)
+            headers = [data for is_header, data in tokens if is_header]
+
+            self.assertEqual(rebuilt, fasta)
+            self.assertEqual(headers, [b"c1 a", b"c2", b"c3"])
+
+    def test_iter_fasta_headers_and_lengths(self):
+
+        headers = list(sio.iter_fasta_headers(TEST_ASSEMBLY))
+        self.assertEqual(headers, [b"contig A", b"contig B", b"contig C"])
+
+        lengths = list(sio.iter_fasta_lengths(TEST_ASSEMBLY))
+        self.assertEqual(lengths, [(b"contig A", 18), (b"contig B", 18), (b"contig C", 18)])
+
+    def test_iter_records_gzipped(self):
+
+        records = list(sio.iter_records(TEST_GZIPPED_BIN))
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].header, b"contig1.A")
+        self.assertEqual(len(records[0].sequence), 31)
+        self.assertIsNone(records[0].quality)
+
+    def test_iter_records_fastq(self):
+
+        fastq = os.path.join(OUTPUT_DIR, "reads.fastq.gz")
+        with gzip.open(fastq, "wb") as f:
+            f.write(b"@read1\nACGT\n+\nIIII\n@read2\nGG\n+\n##\n")
+
+        records = list(sio.iter_records(fastq))
+
+        self.assertEqual(records, [
+            sio.SequenceRecord(b"read1", b"ACGT", b"IIII"),
+            sio.SequenceRecord(b"read2", b"GG", b"##"),
+        ])
+
+    def test_rewrite_fasta_headers_to_gzip(self):
+
+        output_file = os.path.join(OUTPUT_DIR, "renamed.fa.gz")
+
+        stats = sio.rewrite_fasta_headers(TEST_ASSEMBLY, output_file,
+                                          lambda header: header.replace(b" ", b"."))
+
+        self.assertEqual(stats, {"records": 3, "modified": 3, "bases": 54})
+
+        # the output is gzipped and only the headers changed
+        with open(TEST_ASSEMBLY, "rb") as f:
+            expected = f.read().replace(b"contig ", b"contig.")
+        with gzip.open(output_file, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_copy_sequence_file(self):
+
+        output_file = os.path.join(OUTPUT_DIR, "a.fa")
+        sio.copy_sequence_file(TEST_GZIPPED_BIN, output_file)
+
+        with gzip.open(TEST_GZIPPED_BIN, "rb") as f_in, open(output_file, "rb") as f_out:
+            self.assertEqual(f_in.read(), f_out.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
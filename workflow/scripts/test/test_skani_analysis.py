@@ -0,0 +1,315 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from unittest import mock
+import workflow.scripts.other_scripts.skani_analysis as skani
+
+TEST_DIR = "workflow/scripts/test/data/skani_analysis"
+
+# full matrix, the upper triangle differs from the lower one to check which one is used
+FULL_MATRIX = """3
+/tmp/skani/megahit.bin_1.fa\t100.00\t80.00\t0.00
+/tmp/skani/metaflye.bin_2.fa\t99.95\t100.00\t0.00
+/tmp/skani/megahit.bin_3.fa\t0.00\t97.30\t100.00
+"""
+
+LOWER_TRIANGULAR_MATRIX = """3
+megahit.bin_1.fa
+metaflye.bin_2.fa\t99.95
+megahit.bin_3.fa\t0.00\t97.30
+"""
+
+# same comparisons, as written by `skani triangle --sparse` (only similar pairs)
+SPARSE_OUTPUT = """Ref_file\tQuery_file\tANI\tAlign_fraction_ref\tAlign_fraction_query\tRef_name\tQuery_name
+/tmp/skani/megahit.bin_1.fa\t/tmp/skani/metaflye.bin_2.fa\t99.95\t90.1\t91.2\tk141_1\tcontig_1
+/tmp/skani/metaflye.bin_2.fa\t/tmp/skani/megahit.bin_3.fa\t97.30\t80.5\t82.3\tcontig_1\tk141_8
+"""
+
+LIST_BINS = """/tmp/skani/megahit.bin_1.fa
+/tmp/skani/metaflye.bin_2.fa
+/tmp/skani/megahit.bin_3.fa
+/tmp/skani/megahit.bin_4.fa
+"""
+
+
+def brute_force_clusters(matrix, names, threshold):
+    """
+    Reference clustering: connected components found by exploring the whole matrix
+    """
+    clusters = {}
+    assigned = set()
+    for i in range(len(names)):
+        if i in assigned:
+            continue
+        component = {i}
+        to_visit = [i]
+        while to_visit:
+            current = to_visit.pop()
+            for j in range(len(names)):
+                if j not in component and matrix[current, j] >= threshold:
+                    component.add(j)
+                    to_visit.append(j)
+        assigned |= component
+        clusters[str(len(clusters) + 1)] = [names[j] for j in sorted(component)]
+    return clusters
+
+
+class TestSkaniAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def write(self, name, content):
+        path = os.path.join(TEST_DIR, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_read_phylip(self):
+
+        expected = np.array([[100, 99.95, 0], [99.95, 100, 97.3], [0, 97.3, 100]], dtype=np.float32)
+
+        full = skani.read_phylip_lower_triangular(self.write("full.txt", FULL_MATRIX))
+        self.assertEqual(full.index.tolist(), ["megahit.bin_1.fa", "metaflye.bin_2.fa", "megahit.bin_3.fa"])
+        self.assertEqual(full.values.dtype, np.float32)
+        np.testing.assert_array_equal(full.values, expected)
+
+        # the diagonal is not in a lower triangular matrix
+        lower = skani.read_phylip_lower_triangular(self.write("lower.txt", LOWER_TRIANGULAR_MATRIX))
+        np.testing.assert_array_equal(lower.values, expected - np.diag([100, 100, 100]))
+
+    def test_build_shared_bins_dictionary_dereplicated(self):
+
+        matrix = skani.read_phylip_lower_triangular(self.write("full.txt", FULL_MATRIX))
+
+        expected = {
+            "megahit.bin_1.fa": ["megahit", "metaflye"],
+            "metaflye.bin_2.fa": ["megahit", "metaflye"],
+            "megahit.bin_3.fa": ["megahit"],
+        }
+        for block_size in [1, 2, 1024]:
+            self.assertEqual(skani.build_shared_bins_dictionary_dereplicated(matrix, 99.9, block_size=block_size),
+                             expected)
+
+    def test_mirror_lower_triangle_by_blocks(self):
+
+        lower = np.tril(np.random.default_rng(0).random((7, 7), dtype=np.float32))
+        matrix = lower.copy()
+        skani.mirror_lower_triangle(matrix, block_size=3)
+        np.testing.assert_array_equal(matrix, lower + np.tril(lower, -1).T)
+
+    def test_matrix_cache(self):
+
+        cache = os.path.join(TEST_DIR, "matrix.npy")
+        tsv = os.path.join(TEST_DIR, "matrix.tsv")
+
+        matrix = skani.read_phylip_lower_triangular(self.write("full.txt", FULL_MATRIX), cache)
+        matrix.to_csv(tsv, sep="\t")
+        os.utime(cache)
+
+        # the cache is found next to the TSV and memory-mapped
+        cached = skani.load_skani_matrix(tsv)
+        base = cached.values
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+        self.assertEqual(cached.index.tolist(), matrix.index.tolist())
+        np.testing.assert_array_equal(cached.values, matrix.values)
+
+        # same results as with the TSV
+        os.remove(cache)
+        from_tsv = skani.load_skani_matrix(tsv)
+        self.assertEqual(skani.build_clusters_bins_dictionary(from_tsv, 97),
+                         skani.build_clusters_bins_dictionary(cached, 97))
+        self.assertEqual(skani.build_shared_bins_dictionary_dereplicated(from_tsv, 99.95),
+                         skani.build_shared_bins_dictionary_dereplicated(cached, 99.95))
+
+    def test_sparse_results(self):
+
+        edges = skani.read_skani_sparse(self.write("sparse.txt", SPARSE_OUTPUT), self.write("list_bins.txt", LIST_BINS))
+        self.assertEqual(edges.bin_names, ["megahit.bin_1.fa", "metaflye.bin_2.fa", "megahit.bin_3.fa", "megahit.bin_4.fa"])
+
+        # saving and reading back the pairs
+        tsv = os.path.join(TEST_DIR, "pairs.tsv")
+        skani.write_skani_edges(edges, tsv)
+        loaded = skani.load_skani_matrix(tsv)
+        self.assertIsInstance(loaded, skani.SkaniEdges)
+        self.assertEqual(loaded.bin_names, edges.bin_names)
+
+        # same results as with the full matrix (bin_4 is similar to no other bin)
+        full_matrix = FULL_MATRIX.replace("3\n", "4\n", 1) + "megahit.bin_4.fa\t0\t0\t0\t100\n"
+        full = skani.read_phylip_lower_triangular(self.write("full.txt", full_matrix))
+        self.assertEqual(skani.build_shared_bins_dictionary_from_edges(loaded, 99.9),
+                         skani.build_shared_bins_dictionary_dereplicated(full, 99.9))
+        self.assertEqual(skani.build_clusters_bins_dictionary_from_edges(loaded, 97),
+                         {"1": ["megahit.bin_1.fa", "metaflye.bin_2.fa", "megahit.bin_3.fa"], "2": ["megahit.bin_4.fa"]})
+        self.assertEqual(skani.build_clusters_bins_dictionary_from_edges(loaded, 99.9),
+                         {"1": ["megahit.bin_1.fa", "metaflye.bin_2.fa"], "2": ["megahit.bin_3.fa"], "3": ["megahit.bin_4.fa"]})
+
+    def test_build_clusters_bins_dictionary(self):
+
+        rng = np.random.default_rng(0)
+        for size in [1, 5, 40]:
+            # random symmetric matrix with a few similar pairs
+            values = np.where(rng.random((size, size)) < 0.05, 99, 80).astype(np.float32)
+            values = np.tril(values, -1) + np.tril(values, -1).T + np.diag(np.full(size, 100, dtype=np.float32))
+            names = [f"megahit.bin_{i}.fa" for i in range(size)]
+
+            clusters = skani.build_clusters_bins_dictionary(pd.DataFrame(values, index=names, columns=names),
+                                                            97, block_size=7)
+            self.assertEqual(clusters, brute_force_clusters(values, names, 97))
+
+    def test_compare_incrementally(self):
+
+        # fake Skani: a sketch keeps the name and the sequence of a bin, ANI are given by pairs of sequences
+        ani = {("AAAA", "AAAT"): 99.95, ("AAAA", "CCCC"): 97.3}
+        calls = {"sketched": [], "queries": []}
+
+        def fake_sketch(list_bins_path, output_dir, cpu):
+            os.makedirs(output_dir)
+            with open(list_bins_path) as f:
+                for path in f.read().split():
+                    calls["sketched"].append(os.path.basename(path))
+                    with open(path) as bin_file, open(os.path.join(output_dir, os.path.basename(path) + ".sketch"), "w") as sketch:
+                        sketch.write(f"{path}\n{bin_file.read().strip()}\n")
+
+        def fake_dist(query_list_path, reference_list_path, output_file, cpu):
+            def read_sketches(list_path):
+                sketches = []
+                with open(list_path) as f:
+                    for sketch_path in f.read().split():
+                        with open(sketch_path) as sketch:
+                            sketches.append(sketch.read().split())
+                return sketches
+
+            queries, references = read_sketches(query_list_path), read_sketches(reference_list_path)
+            calls["queries"].append(len(queries))
+            with open(output_file, "w") as f:
+                f.write("Ref_file\tQuery_file\tANI\n")
+                for ref, ref_seq in references:
+                    for query, query_seq in queries:
+                        if tuple(sorted((ref_seq, query_seq))) in ani:
+                            f.write(f"{ref}\t{query}\t{ani[tuple(sorted((ref_seq, query_seq)))]}\n")
+
+        bins = {name: os.path.abspath(self.write(name, seq)) for name, seq in
+                [("megahit.bin_1.fa", "AAAA"), ("metaflye.bin_1.fa", "AAAT"), ("megahit.bin_2.fa", "CCCC")]}
+        store = os.path.join(TEST_DIR, "store")
+        tmp = os.path.join(TEST_DIR, "tmp")
+        output = os.path.join(TEST_DIR, "skani_output.tsv")
+
+        with mock.patch.object(skani, "run_skani_sketch", fake_sketch), mock.patch.object(skani, "run_skani_dist", fake_dist):
+            first_run = {name: bins[name] for name in ["megahit.bin_1.fa", "metaflye.bin_1.fa"]}
+            edges = skani.compare_incrementally(first_run, store, tmp, output, 1)
+            self.assertEqual(skani.build_shared_bins_dictionary_from_edges(edges, 99.9),
+                             {"megahit.bin_1.fa": ["megahit", "metaflye"], "metaflye.bin_1.fa": ["megahit", "metaflye"]})
+
+            # a new bin is added, and an old one is renamed (same content)
+            os.rename(bins["metaflye.bin_1.fa"], bins["metaflye.bin_1.fa"].replace("bin_1", "bin_9"))
+            second_run = {"megahit.bin_1.fa": bins["megahit.bin_1.fa"],
+                          "metaflye.bin_9.fa": bins["metaflye.bin_1.fa"].replace("bin_1", "bin_9"),
+                          "megahit.bin_2.fa": bins["megahit.bin_2.fa"]}
+            edges = skani.compare_incrementally(second_run, store, tmp, output, 1)
+
+            # nothing to do without new bins
+            skani.compare_incrementally(second_run, store, tmp, output, 1)
+
+        # only the new bin was sketched and compared against the others
+        self.assertEqual(len(calls["sketched"]), 3)
+        self.assertEqual(calls["queries"], [2, 1])
+        self.assertEqual(os.listdir(tmp), [])
+        # sketches are stored by sketch options
+        self.assertEqual(len(os.listdir(os.path.join(store, "sketch_medium", skani.SKETCH_STORE_SKETCHES))), 3)
+
+        self.assertEqual(edges.bin_names, ["megahit.bin_1.fa", "metaflye.bin_9.fa", "megahit.bin_2.fa"])
+        pairs = sorted((edges.bin_names[i], edges.bin_names[j], round(float(a), 2))
+                       for i, j, a in zip(edges.bin_1, edges.bin_2, edges.ani) if i != j)
+        self.assertEqual(pairs, [("megahit.bin_1.fa", "megahit.bin_2.fa", 97.3),
+                                 ("megahit.bin_1.fa", "metaflye.bin_9.fa", 99.95)])
+        self.assertEqual(skani.build_clusters_bins_dictionary_from_edges(edges, 97),
+                         {"1": ["megahit.bin_1.fa", "metaflye.bin_9.fa", "megahit.bin_2.fa"]})
+
+
+class TestBinsReports(unittest.TestCase):
+    """
+    CheckM2 and GTDB-Tk reports are looked up relatively to the results folder of the pipeline
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.makedirs(os.path.join(TEST_DIR, "results"), exist_ok=True)
+        os.chdir(TEST_DIR)
+        skani.load_unduplicated_table.cache_clear()
+        skani.load_checkm2_report.cache_clear()
+        skani.load_gtdb_taxonomy.cache_clear()
+
+        postprocessing = "results/08_bins_postprocessing"
+        os.makedirs(f"{postprocessing}/genomes_list/megahit")
+        with open(f"{postprocessing}/genomes_list/megahit/unduplicated.tsv", "w") as f:
+            f.write("path\tfilename\tunambiguous_filename\n")
+            f.write("results/07_bins_refinement/binette/megahit/s1/final_bins/bin_1.fa\tbin_1.fa\tbin_1.fa\n")
+            f.write("results/07_bins_refinement/binette/megahit/s2/final_bins/bin_1.fa\tbin_1.fa\tbin_1_1.fa\n")
+            f.write("results/07_bins_refinement/binette/megahit/s2/final_bins/bin_2.fa\tbin_2.fa\tbin_2.fa\n")
+
+        checkm2 = f"{postprocessing}/dereplicated_genomes_filtered_by_quality/95/megahit/checkm2"
+        os.makedirs(checkm2)
+        with open(f"{checkm2}/quality_report.tsv", "w") as f:
+            f.write("Name\tCompleteness\tContamination\tContig_N50\tGenome_Size\n")
+            f.write("bin_1\t90.0\t1.0\t5000\t2000000\n")
+            f.write("bin_1_1\t80.0\t3.0\t8000\t2500000\n")
+            f.write("bin_2\t70.0\t2.0\t3000\t1500000\n")
+
+        for sample, summaries in [("s1", {"bac120": "bin_1\td__Bacteria;s__A\n"}),
+                                  ("s2", {"bac120": "bin_1\td__Bacteria;s__B\n", "ar53": "bin_2\td__Archaea;s__C\n"})]:
+            gtdb_tk = f"{postprocessing}/gtdb_tk/megahit/{sample}"
+            os.makedirs(gtdb_tk)
+            for domain, content in summaries.items():
+                with open(f"{gtdb_tk}/gtdbtk.{domain}.summary.tsv", "w") as f:
+                    f.write("user_genome\tclassification\tfastani_reference\n")
+                    f.write(content.replace("\n", "\tGCF_1\n"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(TEST_DIR)
+
+    def test_checkm_metrics_bins_clusters(self):
+
+        clusters = {"1": ["megahit.bin_1.fa", "megahit.bin_1_1.fa"], "2": ["megahit.bin_2.fa"]}
+        results_df, summary_df = skani.checkm_metrics_bins_clusters(clusters, ani_threshold=95)
+
+        self.assertEqual(results_df['bin'].tolist(), ["bin_1", "bin_1_1", "bin_2"])
+        self.assertEqual(results_df['completeness'].tolist(), [90.0, 80.0, 70.0])
+        self.assertEqual(summary_df['num_bins'].tolist(), [2, 1])
+        self.assertEqual(summary_df.loc[1, 'mean_contig_n50'], 6500)
+        # the report is read only once for all the bins of an assembler
+        self.assertEqual(skani.load_checkm2_report.cache_info().misses, 1)
+
+        with self.assertRaises(ValueError):
+            skani.checkm_metrics_bins_clusters({"1": ["megahit.bin_9.fa"]}, ani_threshold=95)
+
+    def test_get_bins_taxo_and_quality(self):
+
+        bins_taxonomy = skani.get_bins_taxo({"megahit": {"megahit.bin_1.fa", "megahit.bin_1_1.fa", "megahit.bin_2.fa"}})
+        bins_taxonomy = bins_taxonomy.sort_values('renamed_bin', ignore_index=True)
+
+        self.assertEqual(bins_taxonomy.columns.tolist(),
+                         ['assembly', 'original_bin_name', 'renamed_bin', 'gtdb_classification'])
+        self.assertEqual(bins_taxonomy['original_bin_name'].tolist(), ["bin_1.fa", "bin_1.fa", "bin_2.fa"])
+        # bacterial and archaeal summaries of each sample are both looked up
+        self.assertEqual(bins_taxonomy['gtdb_classification'].tolist(),
+                         ["d__Bacteria;s__A", "d__Bacteria;s__B", "d__Archaea;s__C"])
+        self.assertEqual(skani.load_gtdb_taxonomy.cache_info().misses, 2)
+
+        bins_quality = skani.get_bins_quality(bins_taxonomy, 95)
+        self.assertEqual(bins_quality['completeness'].tolist(), [90.0, 80.0, 70.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# run from root of the repository
+# python3 -m unittest discover -s workflow/scripts/test/
+
+import unittest
+import os
+import shutil
+import yaml
+import pandas as pd
+import workflow.scripts.other_scripts.thread_scaling as ts
+
+TEST_DIR = "workflow/scripts/test/data/thread_scaling"
+
+
+class TestThreadScaling(unittest.TestCase):
+
+    def setUp(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+
+        # metabat2 scales perfectly, dRep stops scaling after 2 threads; two runs by job
+        rows = []
+        for threads in [1, 2, 4, 8]:
+            for repeat in [0, 1]:
+                for sample in ["s1", "s2"]:
+                    rows.append(("metabat2_binning", f"metabat2/{sample}", threads, 800 / threads + repeat))
+                rows.append(("genomes_dereplication", "drep", threads, 1000 / min(threads, 2)))
+        self.benchmarks = pd.DataFrame(rows, columns=["rule", "path", "threads", "s"])
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_compute_scaling_and_recommend(self):
+
+        scaling = ts.compute_scaling(self.benchmarks).set_index(["rule", "threads"])
+
+        # the median of the runs of each job, summed over the jobs
+        self.assertAlmostEqual(scaling.loc[("metabat2_binning", 1), "s"], 2 * 800.5)
+        self.assertAlmostEqual(scaling.loc[("genomes_dereplication", 8), "speedup"], 2)
+        self.assertAlmostEqual(scaling.loc[("genomes_dereplication", 4), "efficiency"], 0.5)
+
+        recommendations = ts.recommend_threads(scaling.reset_index(), min_efficiency=0.6).set_index("rule")
+        self.assertEqual(recommendations.loc["metabat2_binning", "recommended_threads"], 8)
+        self.assertEqual(recommendations.loc["genomes_dereplication", "recommended_threads"], 2)
+        self.assertEqual(recommendations.loc["genomes_dereplication", "config_key"], "bins_postprocessing.drep.threads")
+
+        plot = os.path.join(TEST_DIR, "scaling.png")
+        ts.plot_scaling(scaling.reset_index(), plot)
+        self.assertTrue(os.path.exists(plot))
+
+    def test_write_scaling_config(self):
+
+        config_path = os.path.join(TEST_DIR, "config.yaml")
+        base_config = {"samples": "data/config_data.tsv", "binning": {"minimap2": {"threads": 4}}}
+        ts.write_scaling_config(base_config, "metadata.tsv", ["reads_mapping", "bam_sorting"], 16, 3, config_path)
+
+        with open(config_path) as f:
+            config = yaml.safe_load(f)
+        self.assertEqual(config["samples"], "metadata.tsv")
+        self.assertEqual(config["benchmark_repeats"], 3)
+        self.assertEqual(config["binning"], {"minimap2": {"threads": 16}, "samtools": {"threads": 16}})
+        # the base config is left untouched
+        self.assertEqual(base_config["binning"]["minimap2"]["threads"], 4)
+
+    def test_streaming_mapping_threads(self):
+
+        config_path = os.path.join(TEST_DIR, "config.yaml")
+        base_config = {"mapping": {"mode": "streaming", "sort_threads": 2}, "binning": {"minimap2": {"threads": 4}}}
+
+        # the SAM rules don't run in streaming mode
+        self.assertNotIn("reads_mapping", ts.default_rules(base_config))
+        self.assertNotIn("bam_sorting", ts.default_rules(base_config))
+        self.assertIn("reads_mapping_streaming", ts.default_rules(base_config))
+        self.assertNotIn("reads_mapping_streaming", ts.default_rules({"mapping": {"mode": "sam"}}))
+
+        # the job runs with 8 threads: 6 for minimap2 and 2 for samtools sort
+        ts.write_scaling_config(base_config, "metadata.tsv", ["reads_mapping_streaming"], 8, 1, config_path)
+        with open(config_path) as f:
+            config = yaml.safe_load(f)
+        self.assertEqual(config["binning"]["minimap2"]["threads"], 6)
+        self.assertEqual(config["mapping"]["sort_threads"], 2)
+        self.assertEqual(ts.split_sorting_threads(base_config, 1), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()